@@ -8,6 +8,15 @@ db = SQLAlchemy()
 login_manager = LoginManager()
 socketio = SocketIO()
 
+# Columns added to existing tables since they were first created, as
+# (table, column, DDL); create_all only creates missing tables
+ADDED_COLUMNS = [
+    ('capture_sessions', 'capture_source', "VARCHAR(20) NOT NULL DEFAULT 'simulated'"),
+    ('capture_sessions', 'ring_size_mb', 'INTEGER'),
+    ('capture_sessions', 'ring_block_timeout_ms', 'INTEGER'),
+    ('capture_sessions', 'kernel_drops', 'BIGINT DEFAULT 0'),
+]
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
@@ -38,6 +47,10 @@ def create_app(config_class=Config):
     app.register_blueprint(analysis_bp)
     app.register_blueprint(admin_bp)
     
+    # Register CLI commands
+    from app.cli import rollups_cli
+    app.cli.add_command(rollups_cli)
+    
     # Add context processor for global template variables
     @app.context_processor
     def inject_global_data():
@@ -60,11 +73,31 @@ def create_app(config_class=Config):
     # Create database tables and initialize default data
     with app.app_context():
         db.create_all()
+        upgrade_schema()
         cleanup_orphaned_sessions()
         initialize_default_data()
     
     return app
 
+def upgrade_schema():
+    """Add the ADDED_COLUMNS an older database is missing"""
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(db.engine)
+    existing = {}
+    added = []
+    for table, column, ddl in ADDED_COLUMNS:
+        if table not in existing:
+            existing[table] = {c['name'] for c in inspector.get_columns(table)}
+        if column not in existing[table]:
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            added.append(f'{table}.{column}')
+
+    db.session.commit()
+
+    if added:
+        print(f"Upgraded database schema: added {', '.join(added)}")
+
 def cleanup_orphaned_sessions():
     """Clean up sessions that were marked as running but have no active thread"""
     from app.models.capture_session import CaptureSession
@@ -0,0 +1,36 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+rollups_cli = AppGroup('rollups', help='Manage traffic rollups.')
+
+
+@rollups_cli.command('backfill')
+@click.option('--start', type=click.DateTime(), default=None, help='UTC start (default: oldest packet).')
+@click.option('--end', type=click.DateTime(), default=None, help='UTC end (default: start of the current hour, or the end of a resumed checkpoint).')
+@click.option('--slice-hours', type=int, default=1, show_default=True, help='Hours of packets per work unit.')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+@click.option('--chunk-size', type=int, default=50000, show_default=True, help='Packets fetched per chunk.')
+@click.option('--checkpoint', default='rollup_backfill.json', show_default=True, help='Checkpoint file.')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint.')
+def backfill(start, end, slice_hours, workers, chunk_size, checkpoint, restart):
+    """Build or rebuild rollups from stored packets"""
+    from app.services.rollup_backfill import RollupBackfill
+
+    try:
+        job = RollupBackfill(
+            start=start,
+            end=end,
+            slice_hours=slice_hours,
+            workers=workers,
+            chunk_size=chunk_size,
+            checkpoint_path=checkpoint,
+            retention=current_app.config['ROLLUP_RETENTION_DAYS']
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    click.echo(f"Backfilling rollups {job.start.isoformat()} - {job.end.isoformat()} "
+               f"in {len(job.slices())} slices with {job.workers} workers")
+    result = job.run(resume=not restart, progress=click.echo)
+    click.echo(f"Done: {result['rows']} packets in {result['seconds']}s ({result['rows_per_sec']:,.0f} rows/s)")
@@ -5,6 +5,10 @@ from app.models.packet import Packet
 from app.models.alert import AlertRule, Alert
 from app.models.dashboard import Dashboard, Widget
 from app.models.audit_log import AuditLog
+from app.models.rollup import InterfaceRollup, SessionRollup
+from app.models.flow import Flow
+from app.models.passive_dns import PassiveDnsEntry
+from app.models.dhcp_lease import DhcpLease
 
 __all__ = [
     'User',
@@ -15,5 +19,10 @@ __all__ = [
     'Alert',
     'Dashboard',
     'Widget',
-    'AuditLog'
+    'AuditLog',
+    'InterfaceRollup',
+    'SessionRollup',
+    'Flow',
+    'PassiveDnsEntry',
+    'DhcpLease'
 ]
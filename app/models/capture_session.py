@@ -13,6 +13,10 @@ class CaptureSession(db.Model):
     end_time = db.Column(db.DateTime, nullable=True)
     packet_count = db.Column(db.Integer, default=0)
     bytes_captured = db.Column(db.BigInteger, default=0)
+    capture_source = db.Column(db.String(20), nullable=False, default='simulated')
+    ring_size_mb = db.Column(db.Integer, nullable=True)
+    ring_block_timeout_ms = db.Column(db.Integer, nullable=True)
+    kernel_drops = db.Column(db.BigInteger, default=0)
     filter_ip = db.Column(db.String(45), nullable=True)
     filter_port = db.Column(db.Integer, nullable=True)
     filter_protocol = db.Column(db.String(20), nullable=True)
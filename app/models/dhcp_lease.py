@@ -0,0 +1,18 @@
+from app import db
+from app.models.types import IPAddress
+
+
+class DhcpLease(db.Model):
+    """Snapshot of a lease from the live DHCP lease table"""
+    __tablename__ = 'dhcp_leases'
+
+    mac = db.Column(db.String(17), primary_key=True)
+    ip = db.Column(IPAddress, nullable=False, index=True)
+    hostname = db.Column(db.String(255), nullable=True)
+    server = db.Column(IPAddress, nullable=True)
+    interface_id = db.Column(db.Integer, db.ForeignKey('network_interfaces.id'), nullable=True)
+    lease_start = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<DhcpLease {self.ip} {self.mac}>'
@@ -0,0 +1,26 @@
+from app import db
+from app.models.types import IPAddress, ProtocolCode, TCPFlagMask, NanoTimestamp
+
+class Flow(db.Model):
+    __tablename__ = 'flows'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    interface_id = db.Column(db.Integer, db.ForeignKey('network_interfaces.id'), nullable=False, index=True)
+    start_time = db.Column(NanoTimestamp, nullable=False, index=True)
+    end_time = db.Column(NanoTimestamp, nullable=False)
+    transport = db.Column(ProtocolCode, nullable=False)
+    protocol = db.Column(ProtocolCode, nullable=False, index=True)
+    client_ip = db.Column(IPAddress, nullable=False, index=True)
+    client_port = db.Column(db.Integer, nullable=True)
+    server_ip = db.Column(IPAddress, nullable=False, index=True)
+    server_port = db.Column(db.Integer, nullable=True, index=True)
+    packets_out = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_out = db.Column(db.BigInteger, nullable=False, default=0)
+    packets_in = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_in = db.Column(db.BigInteger, nullable=False, default=0)
+    flags = db.Column(TCPFlagMask, nullable=True)
+    state = db.Column(db.String(12), nullable=True)
+    end_reason = db.Column(db.String(10), nullable=True)
+    
+    def __repr__(self):
+        return f'<Flow {self.client_ip}:{self.client_port} -> {self.server_ip}:{self.server_port}>'
@@ -0,0 +1,15 @@
+from app import db
+from app.models.types import IPAddress
+
+
+class PassiveDnsEntry(db.Model):
+    """Hostname an address was last seen answering for in observed DNS traffic"""
+    __tablename__ = 'passive_dns'
+
+    address = db.Column(IPAddress, primary_key=True)
+    hostname = db.Column(db.String(255), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<PassiveDnsEntry {self.address} {self.hostname}>'
@@ -0,0 +1,40 @@
+from app import db
+from app.models.types import ProtocolCode
+
+
+class InterfaceRollup(db.Model):
+    """Traffic on an interface per protocol in one time bucket"""
+    __tablename__ = 'interface_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('interface_id', 'resolution', 'bucket_start', 'protocol', name='uq_interface_rollup'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    interface_id = db.Column(db.Integer, db.ForeignKey('network_interfaces.id'), nullable=False)
+    resolution = db.Column(db.Integer, nullable=False)  # bucket width in seconds
+    bucket_start = db.Column(db.DateTime, nullable=False, index=True)
+    protocol = db.Column(ProtocolCode, nullable=False)
+    packets = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<InterfaceRollup {self.interface_id} {self.resolution}s {self.bucket_start} {self.protocol}>'
+
+
+class SessionRollup(db.Model):
+    """Traffic captured by a session per protocol in one time bucket"""
+    __tablename__ = 'session_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'resolution', 'bucket_start', 'protocol', name='uq_session_rollup'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('capture_sessions.id'), nullable=False)
+    resolution = db.Column(db.Integer, nullable=False)  # bucket width in seconds
+    bucket_start = db.Column(db.DateTime, nullable=False, index=True)
+    protocol = db.Column(ProtocolCode, nullable=False)
+    packets = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SessionRollup {self.session_id} {self.resolution}s {self.bucket_start} {self.protocol}>'
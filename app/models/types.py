@@ -0,0 +1,165 @@
+"""Compact column types for packet storage
+
+Packets are stored as integers and short blobs, but these types convert at the
+column boundary so queries, models and templates keep using the familiar
+string/datetime values ('10.0.0.1', 'HTTPS', 'SYN,ACK', datetime).
+"""
+import ipaddress
+from datetime import datetime
+from sqlalchemy.types import TypeDecorator, LargeBinary, SmallInteger, BigInteger
+
+# On-disk protocol codes. Append only: existing rows depend on these values.
+PROTOCOL_CODES = {
+    'OTHER': 0,
+    'TCP': 1,
+    'UDP': 2,
+    'ICMP': 3,
+    'HTTP': 4,
+    'HTTPS': 5,
+    'DNS': 6,
+    'SSH': 7,
+    'FTP': 8,
+    'SMTP': 9,
+    'POP3': 10,
+    'IMAP': 11,
+    'DHCP': 12,
+    'P2P': 13,
+}
+PROTOCOL_NAMES = {code: name for name, code in PROTOCOL_CODES.items()}
+
+TCP_FLAGS = (
+    (0x02, 'SYN'),
+    (0x01, 'FIN'),
+    (0x04, 'RST'),
+    (0x08, 'PSH'),
+    (0x10, 'ACK'),
+    (0x20, 'URG'),
+)
+TCP_FLAG_BITS = {name: bit for bit, name in TCP_FLAGS}
+
+# IPv4 addresses are held as IPv4-mapped IPv6 (::ffff:a.b.c.d) so every
+# address fits one 128-bit integer
+IPV4_MAPPED = 0xFFFF << 32
+IPV4_MAPPED_MASK = ((1 << 96) - 1) << 32
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def ip_to_int(address):
+    """Convert an address string to its 128-bit integer form"""
+    ip = ipaddress.ip_address(address)
+    if ip.version == 4:
+        return IPV4_MAPPED | int(ip)
+    return int(ip)
+
+
+def int_to_ip(value):
+    """Convert a 128-bit integer back to an address string"""
+    if value & IPV4_MAPPED_MASK == IPV4_MAPPED:
+        return str(ipaddress.IPv4Address(value & 0xFFFFFFFF))
+    return str(ipaddress.IPv6Address(value))
+
+
+def protocol_code(name):
+    """Get the storage code for a protocol name"""
+    try:
+        return PROTOCOL_CODES[name.upper()]
+    except KeyError:
+        raise ValueError(f'Unknown protocol: {name}')
+
+
+def flags_to_mask(flags):
+    """Convert 'SYN,ACK' style flags to a bitmask"""
+    mask = 0
+    for name in flags.split(','):
+        name = name.strip().upper()
+        if name:
+            mask |= TCP_FLAG_BITS[name]
+    return mask
+
+
+def mask_to_flags(mask):
+    """Convert a flags bitmask to 'SYN,ACK' style flags, or None if no flag is set"""
+    names = [name for bit, name in TCP_FLAGS if mask & bit]
+    return ','.join(names) if names else None
+
+
+def datetime_to_ns(value):
+    """Convert a naive UTC datetime to nanoseconds since the epoch"""
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000000 + delta.microseconds * 1000
+
+
+def ns_to_datetime(value):
+    """Convert nanoseconds since the epoch to a naive UTC datetime"""
+    return datetime.utcfromtimestamp(value // 1000000000).replace(microsecond=value % 1000000000 // 1000)
+
+
+class IPAddress(TypeDecorator):
+    """IPv4/IPv6 address stored as a 16-byte big-endian integer"""
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, int):
+            value = ip_to_int(value)
+        return value.to_bytes(16, 'big')
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return int_to_ip(int.from_bytes(value, 'big'))
+
+
+class ProtocolCode(TypeDecorator):
+    """Protocol name stored as a small integer code"""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return protocol_code(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return PROTOCOL_NAMES.get(value, 'OTHER')
+
+
+class TCPFlagMask(TypeDecorator):
+    """TCP flags stored as a bitmask"""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value or None
+        return flags_to_mask(value) or None
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return mask_to_flags(value)
+
+
+class NanoTimestamp(TypeDecorator):
+    """Naive UTC datetime stored as int64 nanoseconds since the epoch"""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return datetime_to_ns(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return ns_to_datetime(value)
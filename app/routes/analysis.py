@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
 from functools import wraps
 from app.services.analysis_service import AnalysisService, HistoricalQueryService
+from app.services.signature_stats import signature_stats
 
 analysis_bp = Blueprint('analysis', __name__, url_prefix='/analysis')
 analysis_service = AnalysisService()
@@ -70,6 +71,13 @@ def p2p():
     data = analysis_service.detect_p2p()
     return render_template('analysis/p2p.html', data=data)
 
+@analysis_bp.route('/signatures')
+@login_required
+@analyst_required
+def signatures():
+    category = request.args.get('category')
+    return jsonify(signature_stats.hits(category=category or None))
+
 @analysis_bp.route('/custom')
 @login_required
 @analyst_required
@@ -104,7 +112,18 @@ def historical():
 def historical_search():
     data = request.get_json()
     criteria = data.get('criteria', [])
-    results = historical_service.search_traffic(criteria)
+    results = historical_service.search_traffic(criteria, data.get('start_time'), data.get('end_time'),
+                                                data.get('limit', 500))
+    return jsonify(results)
+
+@analysis_bp.route('/flows/search', methods=['POST'])
+@login_required
+@analyst_required
+def flow_search():
+    data = request.get_json()
+    criteria = data.get('criteria', [])
+    results = historical_service.search_flows(criteria, data.get('start_time'), data.get('end_time'),
+                                              data.get('limit', 500))
     return jsonify(results)
 
 @analysis_bp.route('/historical/results/<qid>')
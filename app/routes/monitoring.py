@@ -86,7 +86,7 @@ def disable_interface(id):
 @monitoring_bp.route('/interfaces/<int:id>/stats')
 @login_required
 def interface_stats(id):
-    stats = interface_manager.get_interface_stats(id)
+    stats = interface_manager.get_interface_stats(id, exact=request.args.get('exact', type=int) == 1)
     return jsonify(stats)
 
 @monitoring_bp.route('/interfaces/discover', methods=['POST'])
@@ -123,7 +123,7 @@ def live(interface_id):
 @monitoring_bp.route('/live/<int:interface_id>/stats')
 @login_required
 def live_stats(interface_id):
-    stats = capture_service.get_live_stats(interface_id)
+    stats = capture_service.get_live_stats(interface_id, exact=request.args.get('exact', type=int) == 1)
     return jsonify(stats if stats else {})
 
 @monitoring_bp.route('/capture/start', methods=['POST'])
@@ -142,7 +142,10 @@ def start_capture():
             'protocol': data.get('filter_protocol')
         }
         
-        result = capture_service.start_capture(interface_id, filters, current_user.id, session_name)
+        result = capture_service.start_capture(interface_id, filters, current_user.id, session_name,
+                                               capture_source=data.get('capture_source'),
+                                               ring_size_mb=data.get('ring_size_mb'),
+                                               ring_block_timeout_ms=data.get('ring_block_timeout_ms'))
         
         print(f"Capture start result: {result}")
         return jsonify(result)
@@ -171,6 +174,12 @@ def resume_capture(id):
     result = capture_service.resume_capture(id)
     return jsonify(result)
 
+@monitoring_bp.route('/capture/<int:id>/stats')
+@login_required
+def session_stats(id):
+    stats = capture_service.get_session_stats(id)
+    return jsonify(stats if stats else {})
+
 @monitoring_bp.route('/capture/sessions')
 @login_required
 def sessions():
@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 from app import db, socketio
 from app.models.alert import AlertRule, Alert
+from app.models.types import datetime_to_ns
+from app.services.time_buckets import fill_buckets, time_bucket, to_epoch_seconds
 
 class AlertEngine:
     
@@ -115,7 +117,9 @@ class AlertEngine:
         escalation_candidates = Alert.query.join(AlertRule).filter(
             Alert.status == 'active',
             Alert.acknowledged_by.is_(None),
-            Alert.triggered_at < datetime.utcnow() - db.text('alert_rules.escalation_minutes * INTERVAL \'1 minute\'')
+            # Portable "triggered_at + escalation_minutes < now", compared in epoch seconds
+            to_epoch_seconds(Alert.triggered_at) + AlertRule.escalation_minutes * 60
+            < datetime_to_ns(datetime.utcnow()) // 1000000000
         ).all()
         
         for alert in escalation_candidates:
@@ -126,20 +130,10 @@ class AlertEngine:
     def get_alert_statistics(self):
         """Get alert statistics"""
         # Count by severity
-        critical_count = Alert.query.join(AlertRule).filter(
-            Alert.status == 'active',
-            AlertRule.severity == 'critical'
-        ).count()
-        
-        high_count = Alert.query.join(AlertRule).filter(
-            Alert.status == 'active',
-            AlertRule.severity == 'high'
-        ).count()
-        
-        medium_count = Alert.query.join(AlertRule).filter(
-            Alert.status == 'active',
-            AlertRule.severity == 'medium'
-        ).count()
+        severity_counts = self.get_active_counts_by_severity()
+        critical_count = severity_counts.get('critical', 0)
+        high_count = severity_counts.get('high', 0)
+        medium_count = severity_counts.get('medium', 0)
         
         total_count = Alert.query.filter_by(status='active').count()
         
@@ -192,20 +186,28 @@ class AlertEngine:
         start_time = now - timedelta(hours=hours)
         
         # Query alerts grouped by hour
+        hour = time_bucket(Alert.triggered_at, 3600).label('hour')
         hourly_data = db.session.query(
-            func.strftime('%Y-%m-%d %H:00:00', Alert.triggered_at).label('hour'),
+            hour,
             func.count(Alert.id).label('count')
         ).filter(
             Alert.triggered_at >= start_time
-        ).group_by('hour').all()
+        ).group_by(hour).order_by(hour).all()
         
         # Create a complete hourly array
-        hourly_counts = [0] * hours
-        data_dict = {row.hour: row.count for row in hourly_data}
+        end_time = start_time + timedelta(hours=hours - 1)
+        return [count for _, count in fill_buckets(hourly_data, start_time, end_time, 3600)]
+    
+    def get_active_counts_by_severity(self):
+        """Get {severity: active alert count} in one grouped query"""
+        from sqlalchemy import func
         
-        for i in range(hours):
-            hour_time = (start_time + timedelta(hours=i)).strftime('%Y-%m-%d %H:00:00')
-            if hour_time in data_dict:
-                hourly_counts[i] = data_dict[hour_time]
+        rows = db.session.query(
+            AlertRule.severity,
+            func.count(Alert.id)
+        ).join(Alert.rule).filter(
+            Alert.status == 'active'
+        ).group_by(AlertRule.severity).all()
         
-        return hourly_counts
+        return {severity: count for severity, count in rows}
+
@@ -3,142 +3,142 @@ from datetime import datetime, timedelta
 from app import db
 from app.models.packet import Packet
 from app.models.capture_session import CaptureSession
+from app.models.types import datetime_to_ns
+from app.services.passive_dns import passive_dns
+from app.services.segment_store import get_packet_store
+
+PROTOCOL_SUMMARY_RANGES = {
+    '1h': timedelta(hours=1),
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30)
+}
 
 class AnalysisService:
     
-    def analyze_dns(self):
-        """Analyze DNS traffic"""
-        query_types = {'A': 1200, 'AAAA': 300, 'MX': 150, 'TXT': 80, 'CNAME': 200}
-        top_domains = [
-            {'domain': 'google.com', 'queries': 450},
-            {'domain': 'facebook.com', 'queries': 320},
-            {'domain': 'cloudflare.com', 'queries': 280},
-            {'domain': 'amazon.com', 'queries': 210},
-            {'domain': 'microsoft.com', 'queries': 180}
-        ]
-        dns_servers = [
-            {'server': '8.8.8.8', 'queries': 1100},
-            {'server': '1.1.1.1', 'queries': 830}
-        ]
+    def analyze_dns(self, interface_ids=None):
+        """Analyze DNS traffic from the incremental DNS aggregates"""
+        from app.services.dns_stats import dns_stats
         
-        return {
-            'total_queries': sum(query_types.values()),
-            'query_types': query_types,
-            'top_domains': top_domains,
-            'dns_servers': dns_servers
-        }
+        return dns_stats.summary(interface_ids)
     
     def analyze_dhcp(self):
-        """Analyze DHCP traffic"""
-        leases = [
-            {'ip': '192.168.1.100', 'mac': '00:1A:2B:3C:4D:5E', 'hostname': 'desktop-01'},
-            {'ip': '192.168.1.101', 'mac': '00:1A:2B:3C:4D:5F', 'hostname': 'laptop-02'},
-            {'ip': '192.168.1.102', 'mac': '00:1A:2B:3C:4D:60', 'hostname': 'phone-03'}
+        """Analyze DHCP traffic from the live lease table"""
+        from app.services.dhcp_leases import dhcp_leases
+        
+        leases = dhcp_leases.leases()
+        servers = {}
+        for lease in leases:
+            if lease['server']:
+                servers[lease['server']] = servers.get(lease['server'], 0) + 1
+        dhcp_servers = [
+            {'server': server, 'leases': count}
+            for server, count in sorted(servers.items(), key=lambda item: item[1], reverse=True)
         ]
         
         return {
             'total_leases': len(leases),
             'leases': leases,
-            'dhcp_server': '192.168.1.1'
+            'dhcp_server': dhcp_servers[0]['server'] if dhcp_servers else None,
+            'dhcp_servers': dhcp_servers,
+            'messages': dhcp_leases.stats()
         }
     
     def analyze_tcp_states(self):
-        """Analyze TCP connection states"""
-        states = {
-            'ESTABLISHED': 450,
-            'SYN_SENT': 80,
-            'SYN_RECV': 75,
-            'FIN_WAIT1': 30,
-            'FIN_WAIT2': 25,
-            'TIME_WAIT': 100,
-            'CLOSE': 10,
-            'CLOSE_WAIT': 15
-        }
+        """Analyze TCP connection states from the live flow tables"""
+        from app.services.flow_table import flow_tables
+        
+        states = flow_tables.state_counts()
+        performance = flow_tables.tcp_performance(minutes=5)
+        series = flow_tables.tcp_series(minutes=60)
         
         return {
             'states': states,
             'total_connections': sum(states.values()),
-            'handshake_rate': random.randint(50, 200),
-            'half_open': random.randint(10, 50)
+            'handshake_rate': round(flow_tables.handshake_rate(), 2),
+            'half_open': states['SYN_SENT'] + states['SYN_RECV'],
+            'handshake_rtt_ms': performance['rtt_ms'],
+            'server_rtt_ms': performance['server_rtt_ms'],
+            'client_rtt_ms': performance['client_rtt_ms'],
+            'retransmissions': performance['retransmissions'],
+            'retransmission_rate': performance['retransmission_rate'],
+            'out_of_order': performance['out_of_order'],
+            'zero_window_events': performance['zero_window_events'],
+            'connection_series': [
+                {
+                    'timestamp': minute.isoformat(),
+                    'handshakes': summary['handshakes'],
+                    'retransmissions': summary['retransmissions']
+                }
+                for minute, summary in series
+            ]
         }
     
-    def analyze_http(self):
-        """Analyze HTTP traffic"""
-        methods = {'GET': 2500, 'POST': 800, 'PUT': 150, 'DELETE': 80, 'HEAD': 120}
-        status_codes = {
-            '200': 2800,
-            '301': 250,
-            '404': 180,
-            '500': 50,
-            '403': 70
-        }
-        user_agents = [
-            {'agent': 'Chrome/119.0', 'count': 1800},
-            {'agent': 'Firefox/120.0', 'count': 900},
-            {'agent': 'Safari/17.0', 'count': 650}
-        ]
+    def analyze_http(self, interface_ids=None):
+        """Analyze HTTP traffic from the incremental HTTP aggregates"""
+        from app.services.http_stats import http_stats
         
-        return {
-            'total_requests': sum(methods.values()),
-            'methods': methods,
-            'status_codes': status_codes,
-            'user_agents': user_agents
-        }
+        return http_stats.summary(interface_ids)
     
-    def analyze_https(self):
-        """Analyze HTTPS traffic"""
-        tls_versions = {
-            'TLS 1.2': 2000,
-            'TLS 1.3': 5500,
-            'TLS 1.1': 50,
-            'TLS 1.0': 10
-        }
+    def analyze_https(self, interface_ids=None):
+        """Analyze HTTPS traffic from the incremental TLS handshake aggregates"""
+        from app.services.tls_stats import tls_stats
         
-        return {
-            'total_connections': sum(tls_versions.values()),
-            'tls_versions': tls_versions,
-            'cipher_suites': ['TLS_AES_128_GCM_SHA256', 'TLS_AES_256_GCM_SHA384']
-        }
+        return tls_stats.summary(interface_ids)
     
-    def analyze_email(self):
-        """Analyze email protocol traffic"""
-        protocols = {
-            'SMTP': 450,
-            'POP3': 180,
-            'IMAP': 920
-        }
+    def analyze_email(self, interface_ids=None):
+        """Analyze mail protocol traffic from the incremental mail aggregates"""
+        from app.services.mail_stats import mail_stats
         
-        return {
-            'total': sum(protocols.values()),
-            'protocols': protocols,
-            'servers': ['mail.example.com', 'smtp.gmail.com']
-        }
+        summary = mail_stats.summary(interface_ids)
+        hostnames = passive_dns.annotate([server['server'] for server in summary['servers']])
+        for server in summary['servers']:
+            server['hostname'] = hostnames.get(server['server'])
+        
+        return summary
     
-    def detect_p2p(self):
-        """Detect P2P traffic"""
-        signatures = [
-            {'protocol': 'BitTorrent', 'connections': 45, 'ports': [6881, 6882, 6883]},
-            {'protocol': 'eDonkey', 'connections': 12, 'ports': [4662, 4672]}
+    def detect_p2p(self, interface_ids=None):
+        """Detect P2P traffic from the payload signature hit counters"""
+        from app.services.signature_stats import signature_stats
+        
+        signatures = signature_stats.hits(interface_ids)
+        detected = [
+            {
+                'protocol': hit['signature'],
+                'category': hit['category'],
+                'connections': hit['flows'],
+                'payload_matches': hit['payload_hits'],
+                'port_matches': hit['port_hits'],
+                'first_seen': hit['first_seen'],
+                'last_seen': hit['last_seen'],
+                'hosts': hit['hosts']
+            }
+            for hit in signatures if hit['category'] == 'p2p'
         ]
         
         return {
-            'total_connections': sum(s['connections'] for s in signatures),
-            'detected_protocols': signatures
+            'total_connections': sum(protocol['connections'] for protocol in detected),
+            'detected_protocols': detected,
+            'signatures': signatures
         }
     
     def get_protocol_summary(self, time_range='24h'):
-        """Get protocol summary for time range"""
-        protocols = {
-            'TCP': 15000,
-            'UDP': 8000,
-            'ICMP': 500,
-            'HTTP': 3500,
-            'HTTPS': 7500,
-            'DNS': 1930
-        }
+        """Get packets per protocol for a time range from the stored protocol codes"""
+        from app.services.rollup_service import RollupService
+        
+        span = PROTOCOL_SUMMARY_RANGES.get(time_range, PROTOCOL_SUMMARY_RANGES['24h'])
+        end = datetime.utcnow()
+        start = end - span
+        store = get_packet_store()
+        
+        if store is not None:
+            # One bincount of the protocol column per segment
+            protocols = store.protocol_counts(start_ns=datetime_to_ns(start))
+        else:
+            protocols = RollupService().get_protocol_counts(start, end, resolution=60)
         
         return {
-            'time_range': time_range,
+            'time_range': time_range if time_range in PROTOCOL_SUMMARY_RANGES else '24h',
             'protocols': protocols,
             'total_packets': sum(protocols.values())
         }
@@ -146,24 +146,193 @@ class AnalysisService:
 
 class HistoricalQueryService:
     
-    def search_traffic(self, criteria):
+    # Search builder labels -> store field/operator names
+    FIELDS = {
+        'source ip': 'source_ip',
+        'destination ip': 'destination_ip',
+        'protocol': 'protocol',
+        'port': 'port'
+    }
+    OPERATORS = {
+        'equals': 'equals',
+        'contains': 'contains',
+        'greater than': 'greater',
+        'less than': 'less'
+    }
+    MAX_RESULTS = 5000
+    
+    def search_traffic(self, criteria, start_time=None, end_time=None, limit=500):
         """Search historical traffic based on criteria"""
-        results = []
-        
-        for i in range(50):
-            results.append({
-                'timestamp': (datetime.utcnow() - timedelta(hours=random.randint(1, 72))).isoformat(),
-                'source_ip': f'{random.randint(1,255)}.{random.randint(1,255)}.{random.randint(1,255)}.{random.randint(1,255)}',
-                'destination_ip': f'{random.randint(1,255)}.{random.randint(1,255)}.{random.randint(1,255)}.{random.randint(1,255)}',
-                'protocol': random.choice(['TCP', 'UDP', 'ICMP']),
-                'bytes': random.randint(64, 1500)
-            })
+        store = get_packet_store()
+        if store is None:
+            return {'success': False, 'message': 'Packet store is disabled', 'total': 0, 'results': []}
+        
+        if not isinstance(criteria, list):
+            return {'success': False, 'message': 'Criteria must be a list', 'total': 0, 'results': []}
+        
+        conditions = []
+        for criterion in criteria:
+            if not isinstance(criterion, dict):
+                return {'success': False, 'message': f'Unsupported criterion: {criterion}', 'total': 0, 'results': []}
+            field = str(criterion.get('field', '')).strip().lower().replace('_', ' ')
+            operator = str(criterion.get('operator', 'equals')).strip().lower()
+            value = criterion.get('value')
+            if value in (None, ''):
+                continue
+            if field not in self.FIELDS or operator not in self.OPERATORS:
+                return {'success': False, 'message': f'Unsupported criterion: {criterion}', 'total': 0, 'results': []}
+            conditions.append((self.FIELDS[field], self.OPERATORS[operator], value))
+        
+        try:
+            start_ns = datetime_to_ns(datetime.fromisoformat(start_time)) if start_time else None
+            end_ns = datetime_to_ns(datetime.fromisoformat(end_time)) if end_time else None
+            total, results = store.search(conditions, start_ns, end_ns, limit=self._limit(limit))
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'message': str(e), 'total': 0, 'results': []}
+        
+        hostnames = passive_dns.annotate([r['source_ip'] for r in results] + [r['destination_ip'] for r in results])
+        for result in results:
+            result['source_host'] = hostnames.get(result['source_ip'])
+            result['destination_host'] = hostnames.get(result['destination_ip'])
         
         return {
-            'total': len(results),
+            'total': total,
             'results': results
         }
     
+    def _limit(self, limit):
+        """Get a result limit clamped to 1..MAX_RESULTS"""
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid limit: {limit!r}')
+        return min(max(limit, 1), self.MAX_RESULTS)
+    
+    # Flow search builder labels -> flows columns
+    FLOW_FIELDS = {
+        'ip': ('client_ip', 'server_ip'),
+        'client ip': ('client_ip',),
+        'server ip': ('server_ip',),
+        'port': ('client_port', 'server_port'),
+        'server port': ('server_port',),
+        'protocol': ('protocol', 'transport'),
+        'state': ('state',),
+        'bytes': ('bytes',),
+        'packets': ('packets',)
+    }
+    
+    def search_flows(self, criteria, start_time=None, end_time=None, limit=500):
+        """Search stored flows; a flow matches the time range if it overlaps it"""
+        from app.models.flow import Flow
+        
+        if not isinstance(criteria, list):
+            return {'success': False, 'message': 'Criteria must be a list', 'total': 0, 'results': []}
+        
+        query = Flow.query
+        try:
+            for criterion in criteria:
+                if not isinstance(criterion, dict):
+                    return {'success': False, 'message': f'Unsupported criterion: {criterion}', 'total': 0, 'results': []}
+                field = str(criterion.get('field', '')).strip().lower().replace('_', ' ')
+                operator = self.OPERATORS.get(str(criterion.get('operator', 'equals')).strip().lower())
+                value = criterion.get('value')
+                if value in (None, ''):
+                    continue
+                if field not in self.FLOW_FIELDS or operator is None:
+                    return {'success': False, 'message': f'Unsupported criterion: {criterion}', 'total': 0, 'results': []}
+                query = query.filter(db.or_(*[
+                    self._flow_condition(Flow, column, operator, str(value).strip())
+                    for column in self.FLOW_FIELDS[field]
+                ]))
+            
+            if start_time:
+                query = query.filter(Flow.end_time >= datetime.fromisoformat(start_time))
+            if end_time:
+                query = query.filter(Flow.start_time < datetime.fromisoformat(end_time))
+            limit = self._limit(limit)
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'message': str(e), 'total': 0, 'results': []}
+        
+        total = query.count()
+        flows = query.order_by(Flow.start_time.desc()).limit(limit).all()
+        hostnames = passive_dns.annotate([f.client_ip for f in flows] + [f.server_ip for f in flows])
+        
+        return {
+            'total': total,
+            'results': [
+                {
+                    'id': f.id,
+                    'interface_id': f.interface_id,
+                    'start_time': f.start_time.isoformat(),
+                    'end_time': f.end_time.isoformat(),
+                    'duration': round((f.end_time - f.start_time).total_seconds(), 3),
+                    'transport': f.transport,
+                    'protocol': f.protocol,
+                    'client_ip': f.client_ip,
+                    'client_host': hostnames.get(f.client_ip),
+                    'client_port': f.client_port,
+                    'server_ip': f.server_ip,
+                    'server_host': hostnames.get(f.server_ip),
+                    'server_port': f.server_port,
+                    'packets_out': f.packets_out,
+                    'bytes_out': f.bytes_out,
+                    'packets_in': f.packets_in,
+                    'bytes_in': f.bytes_in,
+                    'flags': f.flags,
+                    'state': f.state,
+                    'end_reason': f.end_reason
+                }
+                for f in flows
+            ]
+        }
+    
+    def _flow_condition(self, Flow, column, operator, value):
+        """Build the SQL condition for one flow column"""
+        import ipaddress
+        from app.models.types import PROTOCOL_CODES, ip_to_int
+        
+        if column in ('client_ip', 'server_ip'):
+            if operator not in ('equals', 'contains'):
+                raise ValueError(f'Unsupported operator for {column}: {operator}')
+            network = ipaddress.ip_network(value, strict=False)
+            if operator == 'equals' and network.num_addresses != 1:
+                raise ValueError(f'Not a single address: {value}')
+            low = ip_to_int(str(network.network_address))
+            # 16-byte big-endian blobs sort like the addresses they hold
+            return getattr(Flow, column).between(low, low + network.num_addresses - 1)
+        
+        if column in ('protocol', 'transport'):
+            if operator == 'equals':
+                codes = [PROTOCOL_CODES[value.upper()]] if value.upper() in PROTOCOL_CODES else []
+            elif operator == 'contains':
+                codes = [code for name, code in PROTOCOL_CODES.items() if value.upper() in name]
+            else:
+                raise ValueError(f'Unsupported operator for protocol: {operator}')
+            return getattr(Flow, column).in_(codes)
+        
+        if column == 'state':
+            if operator == 'equals':
+                return Flow.state == value.upper()
+            if operator == 'contains':
+                return Flow.state.contains(value.upper())
+            raise ValueError(f'Unsupported operator for state: {operator}')
+        
+        if column == 'bytes':
+            expression = Flow.bytes_out + Flow.bytes_in
+        elif column == 'packets':
+            expression = Flow.packets_out + Flow.packets_in
+        else:
+            expression = getattr(Flow, column)
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError(f'Invalid number for {column}: {value}')
+        if operator in ('equals', 'contains'):
+            return expression == number
+        if operator == 'greater':
+            return expression > number
+        return expression < number
+    
     def compare_baseline(self, current, baseline):
         """Compare current metrics with baseline"""
         metrics = ['bandwidth', 'packet_rate', 'connections', 'errors']
@@ -0,0 +1,242 @@
+"""Classic BPF code generation for capture filters
+
+Compiles PacketFilters into a socket filter program for Ethernet frames so
+that traffic outside every attached session filter is dropped in the kernel
+and never reaches the capture loop.
+"""
+import ctypes
+import socket
+
+# Instruction classes and modes
+BPF_LD_W_ABS = 0x20
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LD_H_IND = 0x48
+BPF_LDX_B_MSH = 0xb1
+BPF_ALU_AND_K = 0x54
+BPF_JMP_JA = 0x05
+BPF_JMP_JEQ_K = 0x15
+BPF_JMP_JSET_K = 0x45
+BPF_RET_K = 0x06
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+ETHERTYPES = {4: 0x0800, 6: 0x86DD}
+IP_PROTOCOLS = {
+    4: {'TCP': 6, 'UDP': 17, 'ICMP': 1},
+    6: {'TCP': 6, 'UDP': 17, 'ICMP': 58},
+}
+
+DEFAULT_SNAPLEN = 262144
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [
+        ('code', ctypes.c_uint16),
+        ('jt', ctypes.c_uint8),
+        ('jf', ctypes.c_uint8),
+        ('k', ctypes.c_uint32),
+    ]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [
+        ('len', ctypes.c_ushort),
+        ('filter', ctypes.POINTER(_SockFilter)),
+    ]
+
+
+class _Test:
+    """Load a value and compare it against a constant"""
+
+    def __init__(self, loads, k, op=BPF_JMP_JEQ_K, invert=False):
+        self.loads = loads
+        self.k = k
+        self.op = op
+        self.invert = invert
+
+
+class _All(list):
+    """Conjunction of tests"""
+
+
+class _Any(list):
+    """Disjunction of tests"""
+
+
+class _Label:
+    pass
+
+
+def compile_filter(packet_filter, snaplen=DEFAULT_SNAPLEN):
+    """Compile a PacketFilter into a list of (code, jt, jf, k) instructions"""
+    return compile_filters([packet_filter], snaplen)
+
+
+def compile_filters(filters, snaplen=DEFAULT_SNAPLEN):
+    """Compile the union of several PacketFilters; an empty list rejects everything"""
+    if any(f.is_empty for f in filters):
+        return [(BPF_RET_K, 0, 0, snaplen)]
+    if not filters:
+        return [(BPF_RET_K, 0, 0, 0)]
+
+    tree = _Any()
+    for version in (4, 6):
+        alternatives = _Any(_All(_family_conditions(f, version)) for f in filters if version in f.ip_versions)
+        if alternatives:
+            tree.append(_All([_Test([(BPF_LD_H_ABS, 12)], ETHERTYPES[version]), alternatives]))
+
+    accept = _Label()
+    reject = _Label()
+    code = []
+    _emit(tree, accept, reject, code)
+    code.append(accept)
+    code.append((BPF_RET_K, None, None, snaplen))
+    code.append(reject)
+    code.append((BPF_RET_K, None, None, 0))
+
+    return _assemble(code)
+
+
+def attach_filter(sock, program):
+    """Attach a compiled program to a socket"""
+    insns = (_SockFilter * len(program))(*[_SockFilter(*insn) for insn in program])
+    fprog = _SockFprog(len(program), insns)
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, bytes(fprog))
+
+
+def detach_filter(sock):
+    """Remove any filter attached to a socket"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
+    except OSError:
+        pass
+
+
+def _family_conditions(packet_filter, version):
+    conditions = []
+
+    if packet_filter.network is not None:
+        conditions.append(_Any([
+            _address_test(packet_filter.network, version, 'src'),
+            _address_test(packet_filter.network, version, 'dst'),
+        ]))
+
+    if packet_filter.port is not None:
+        conditions.append(_port_test(version, ('TCP', 'UDP'), (packet_filter.port,)))
+
+    if packet_filter.protocol:
+        transports, ports = packet_filter.PROTOCOLS[packet_filter.protocol]
+        if ports:
+            conditions.append(_port_test(version, transports, ports))
+        else:
+            conditions.append(_Any(_protocol_test(version, t) for t in transports))
+
+    return conditions
+
+
+def _address_test(network, version, direction):
+    if version == 4:
+        offset = 26 if direction == 'src' else 30
+        mask = int(network.netmask)
+        if mask == 0:
+            return _All()
+        loads = [(BPF_LD_W_ABS, offset)]
+        if mask != 0xFFFFFFFF:
+            loads.append((BPF_ALU_AND_K, mask))
+        return _Test(loads, int(network.network_address) & mask)
+
+    offset = 22 if direction == 'src' else 38
+    address = network.network_address.packed
+    mask = network.netmask.packed
+    words = _All()
+    for i in range(4):
+        word_mask = int.from_bytes(mask[i * 4:i * 4 + 4], 'big')
+        if word_mask == 0:
+            continue
+        loads = [(BPF_LD_W_ABS, offset + i * 4)]
+        if word_mask != 0xFFFFFFFF:
+            loads.append((BPF_ALU_AND_K, word_mask))
+        words.append(_Test(loads, int.from_bytes(address[i * 4:i * 4 + 4], 'big') & word_mask))
+    return words
+
+
+def _protocol_test(version, transport):
+    offset = 23 if version == 4 else 20
+    return _Test([(BPF_LD_B_ABS, offset)], IP_PROTOCOLS[version][transport])
+
+
+def _port_test(version, transports, ports):
+    if version == 4:
+        src_loads = [(BPF_LDX_B_MSH, 14), (BPF_LD_H_IND, 14)]
+        dst_loads = [(BPF_LDX_B_MSH, 14), (BPF_LD_H_IND, 16)]
+    else:
+        src_loads = [(BPF_LD_H_ABS, 54)]
+        dst_loads = [(BPF_LD_H_ABS, 56)]
+
+    port_match = _Any()
+    for port in ports:
+        port_match.append(_Test(list(src_loads), port))
+        port_match.append(_Test(list(dst_loads), port))
+
+    alternatives = _Any()
+    for transport in transports:
+        if transport not in ('TCP', 'UDP'):
+            continue
+        terms = _All([_protocol_test(version, transport)])
+        if version == 4:
+            # Non-first fragments carry no transport header
+            terms.append(_Test([(BPF_LD_H_ABS, 20)], 0x1FFF, op=BPF_JMP_JSET_K, invert=True))
+        terms.append(port_match)
+        alternatives.append(terms)
+    return alternatives
+
+
+def _emit(node, on_true, on_false, code):
+    if isinstance(node, _Test):
+        code.extend((op, None, None, k) for op, k in node.loads)
+        if node.invert:
+            on_true, on_false = on_false, on_true
+        code.append((node.op, on_true, on_false, node.k))
+        return
+
+    if not node:
+        # Empty conjunction is true, empty disjunction is false
+        code.append((BPF_JMP_JA, None, None, on_true if isinstance(node, _All) else on_false))
+        return
+
+    for child in node[:-1]:
+        label = _Label()
+        if isinstance(node, _All):
+            _emit(child, label, on_false, code)
+        else:
+            _emit(child, on_true, label, code)
+        code.append(label)
+    _emit(node[-1], on_true, on_false, code)
+
+
+def _assemble(code):
+    positions = {}
+    pc = 0
+    for item in code:
+        if isinstance(item, _Label):
+            positions[item] = pc
+        else:
+            pc += 1
+
+    program = []
+    for item in code:
+        if isinstance(item, _Label):
+            continue
+        op, jt, jf, k = item
+        pc = len(program)
+        if op == BPF_JMP_JA:
+            program.append((op, 0, 0, positions[k] - pc - 1))
+            continue
+        jt = positions[jt] - pc - 1 if jt is not None else 0
+        jf = positions[jf] - pc - 1 if jf is not None else 0
+        if jt > 255 or jf > 255:
+            raise ValueError('Capture filter is too complex to compile')
+        program.append((op, jt, jf, k))
+    return program
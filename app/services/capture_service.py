@@ -1,4 +1,3 @@
-import random
 import threading
 import time
 from datetime import datetime, timedelta
@@ -6,6 +5,31 @@ from app import db, socketio
 from app.models.network_interface import NetworkInterface
 from app.models.capture_session import CaptureSession
 from app.models.packet import Packet
+from app.models.rollup import InterfaceRollup
+from app.services.capture_supervisor import CaptureWorkerError, supervisor
+from app.services.dhcp_leases import dhcp_leases
+from app.services.distinct_counter import count_recent_sources
+from app.services.flow_store import flow_writer
+from app.services.flow_table import flow_tables
+from app.services.ingest_service import PacketBatchWriter
+from app.services.packet_capture import CAPTURE_SOURCES, open_capture_source
+from app.services.packet_demux import CaptureTap
+from app.services.packet_filter import PacketFilter
+from app.services.passive_dns import passive_dns
+from app.services.ring_buffer import PacketRingBuffer
+from app.services.rollup_service import RollupService, write_rollups
+from app.services.segment_store import get_packet_store
+from app.services.shared_capture import SharedCapture
+from app.services.signature_engine import load_signatures
+
+
+def _parse_int(value, name):
+    """Parse an integer request option, raising ValueError with a message for the client"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {name}: {value!r}')
+
 
 class InterfaceManager:
     
@@ -25,7 +49,7 @@ class InterfaceManager:
             for iface in interfaces
         ]
     
-    def get_interface_stats(self, interface_id):
+    def get_interface_stats(self, interface_id, exact=False):
         """Get interface statistics"""
         interface = NetworkInterface.query.get(interface_id)
         if not interface:
@@ -51,16 +75,8 @@ class InterfaceManager:
         
         packet_rate = int(total_packets)
         
-        # Get unique connections from recent packets
-        from app.models.packet import Packet
-        from sqlalchemy import func
-        
-        connections_count = db.session.query(
-            func.count(func.distinct(Packet.source_ip))
-        ).join(CaptureSession).filter(
-            CaptureSession.interface_id == interface_id,
-            Packet.timestamp >= datetime.utcnow() - timedelta(minutes=5)
-        ).scalar() or 0
+        # Get unique connections from the recent distinct-source sketches
+        connections_count = count_recent_sources(interface_id, minutes=5, exact=exact)
         
         # If no active monitoring, try to get live system stats
         if packet_rate == 0 and total_bandwidth == 0:
@@ -102,25 +118,14 @@ class InterfaceManager:
         if not interface:
             return None
         
-        # Get packets from last hour for this interface
-        from app.models.packet import Packet
-        from sqlalchemy import func
-        
-        data = []
+        # One query over the last minute of 1s interface rollups
         now = datetime.utcnow()
+        series = RollupService().get_series(
+            now - timedelta(seconds=60), now - timedelta(seconds=1), 1, interface_ids=[interface_id]
+        )
         
-        for i in range(60):
-            timestamp = now - timedelta(seconds=60-i)
-            
-            # Get packets in this second
-            bytes_in_second = db.session.query(
-                func.sum(Packet.length)
-            ).join(CaptureSession).filter(
-                CaptureSession.interface_id == interface_id,
-                Packet.timestamp >= timestamp,
-                Packet.timestamp < timestamp + timedelta(seconds=1)
-            ).scalar() or 0
-            
+        data = []
+        for timestamp, packets, bytes_in_second in series:
             # Convert to Mbps
             mbps = (bytes_in_second * 8) / 1000000
             data.append({'timestamp': timestamp.isoformat(), 'value': round(mbps, 2)})
@@ -132,13 +137,39 @@ class CaptureService:
     
     def __init__(self):
         self.active_sessions = {}
+        self.buffers = {}
+        self.writers = {}
+        # (interface_id, capture_source) -> SharedCapture
+        self.captures = {}
+        self.capture_lock = threading.Lock()
     
-    def start_capture(self, interface_id, filters, user_id, session_name='Capture Session'):
+    def start_capture(self, interface_id, filters, user_id, session_name='Capture Session', capture_source=None,
+                      ring_size_mb=None, ring_block_timeout_ms=None):
         """Start packet capture on interface"""
+        from flask import current_app
+        
         interface = NetworkInterface.query.get(interface_id)
         if not interface:
             return {'success': False, 'message': 'Interface not found'}
         
+        capture_source = capture_source or current_app.config['DEFAULT_CAPTURE_SOURCE']
+        if capture_source not in CAPTURE_SOURCES:
+            return {'success': False, 'message': f'Unknown capture source: {capture_source}'}
+        
+        try:
+            PacketFilter(filters.get('ip'), filters.get('port'), filters.get('protocol'))
+            if ring_size_mb is not None:
+                ring_size_mb = _parse_int(ring_size_mb, 'ring size')
+            if ring_block_timeout_ms is not None:
+                ring_block_timeout_ms = _parse_int(ring_block_timeout_ms, 'block timeout')
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        
+        if ring_size_mb is not None and not 1 <= ring_size_mb <= 4096:
+            return {'success': False, 'message': 'Ring size must be between 1 and 4096 MB'}
+        if ring_block_timeout_ms is not None and not 1 <= ring_block_timeout_ms <= 10000:
+            return {'success': False, 'message': 'Block timeout must be between 1 and 10000 ms'}
+        
         # Allow monitoring even if interface appears inactive (might be virtual or system dependent)
         # Real packet capture will fail gracefully if interface is truly unavailable
         
@@ -153,6 +184,9 @@ class CaptureService:
             interface_id=interface_id,
             user_id=user_id,
             status='running',
+            capture_source=capture_source,
+            ring_size_mb=ring_size_mb,
+            ring_block_timeout_ms=ring_block_timeout_ms,
             filter_ip=filters.get('ip'),
             filter_port=filters.get('port'),
             filter_protocol=filters.get('protocol')
@@ -160,24 +194,13 @@ class CaptureService:
         db.session.add(session)
         db.session.commit()
         
-        # Start capture thread
         interface.is_monitoring = True
         db.session.commit()
         
-        # Get the current app instance to pass to thread
-        from flask import current_app
+        # Get the current app instance to pass to threads
         app = current_app._get_current_object()
         
-        thread = threading.Thread(
-            target=self._capture_thread, 
-            args=(session.id, app), 
-            daemon=True
-        )
-        thread.start()
-        
-        self.active_sessions[session.id] = thread
-        
-        print(f"Started capture thread for session {session.id}")
+        self.active_sessions[session.id] = self._attach_session(session, app)
         
         return {'success': True, 'session_id': session.id}
     
@@ -189,11 +212,16 @@ class CaptureService:
         
         session.status = 'completed'
         session.end_time = datetime.utcnow()
-        session.interface.is_monitoring = False
+        session.interface.is_monitoring = CaptureSession.query.filter(
+            CaptureSession.interface_id == session.interface_id,
+            CaptureSession.id != session.id,
+            CaptureSession.status.in_(['running', 'paused'])
+        ).count() > 0
         db.session.commit()
         
-        if session_id in self.active_sessions:
-            del self.active_sessions[session_id]
+        capture = self.active_sessions.pop(session_id, None)
+        if capture:
+            capture.detach(session_id)
         
         return {'success': True}
     
@@ -206,6 +234,10 @@ class CaptureService:
         session.status = 'paused'
         db.session.commit()
         
+        capture = self.active_sessions.get(session_id)
+        if capture:
+            capture.set_paused(session_id, True)
+        
         return {'success': True}
     
     def resume_capture(self, session_id):
@@ -217,9 +249,13 @@ class CaptureService:
         session.status = 'running'
         db.session.commit()
         
+        capture = self.active_sessions.get(session_id)
+        if capture:
+            capture.set_paused(session_id, False)
+        
         return {'success': True}
     
-    def get_live_stats(self, interface_id):
+    def get_live_stats(self, interface_id, exact=False):
         """Get live statistics for interface"""
         interface = NetworkInterface.query.get(interface_id)
         if not interface:
@@ -234,6 +270,14 @@ class CaptureService:
         # Calculate actual metrics
         total_bandwidth = 0
         total_packet_rate = 0
+        kernel_drops = sum(
+            capture.kernel_stats.get('kernel_drops', 0)
+            for (capture_interface_id, _), capture in list(self.captures.items())
+            if capture_interface_id == interface_id
+        )
+        buffer_drops = sum(
+            self.buffers[session.id].dropped for session in active_sessions if session.id in self.buffers
+        )
         
         for session in active_sessions:
             duration = (datetime.utcnow() - session.start_time).total_seconds()
@@ -242,36 +286,45 @@ class CaptureService:
                 total_bandwidth += bandwidth_bps / 1000000
                 total_packet_rate += session.packet_count / duration
         
-        # Get protocol distribution from recent packets
-        from app.models.packet import Packet
-        from sqlalchemy import func
-        
-        protocol_counts = db.session.query(
-            Packet.protocol,
-            func.count(Packet.id)
-        ).join(CaptureSession).filter(
-            CaptureSession.interface_id == interface_id,
-            Packet.timestamp >= datetime.utcnow() - timedelta(seconds=5)
-        ).group_by(Packet.protocol).all()
-        
-        protocol_dist = {proto: count for proto, count in protocol_counts}
+        # Get protocol distribution from the last few seconds of rollups
+        now = datetime.utcnow()
+        protocol_dist = RollupService().get_protocol_counts(
+            now - timedelta(seconds=5), now, interface_ids=[interface_id]
+        )
         
         # Get connection count
-        connections = db.session.query(
-            func.count(func.distinct(Packet.source_ip))
-        ).join(CaptureSession).filter(
-            CaptureSession.interface_id == interface_id,
-            Packet.timestamp >= datetime.utcnow() - timedelta(minutes=5)
-        ).scalar() or 0
+        connections = count_recent_sources(interface_id, minutes=5, exact=exact)
         
         return {
             'packets_per_sec': int(total_packet_rate),
             'bandwidth_mbps': round(total_bandwidth, 2),
             'connections': connections,
+            'kernel_drops': kernel_drops,
+            'buffer_drops': buffer_drops,
             'protocol_distribution': protocol_dist,
             'timestamp': datetime.utcnow().isoformat()
         }
     
+    def get_session_stats(self, session_id):
+        """Get live pipeline statistics for a capture session"""
+        session = CaptureSession.query.get(session_id)
+        if not session:
+            return None
+        
+        writer = self.writers.get(session_id)
+        buffer = self.buffers.get(session_id)
+        
+        return {
+            'session_id': session.id,
+            'status': session.status,
+            'packet_count': session.packet_count,
+            'bytes_captured': session.bytes_captured,
+            'kernel_drops': session.kernel_drops or 0,
+            'ingest': writer.stats() if writer else None,
+            'buffer': buffer.stats() if buffer else None,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+    
     def apply_filter(self, session_id, criteria):
         """Apply filter to capture session"""
         session = CaptureSession.query.get(session_id)
@@ -292,12 +345,16 @@ class CaptureService:
             .limit(limit)\
             .all()
         
+        hostnames = passive_dns.annotate([p.source_ip for p in packets] + [p.destination_ip for p in packets])
+        
         return [
             {
                 'id': p.id,
                 'timestamp': p.timestamp.isoformat(),
                 'source_ip': p.source_ip,
+                'source_host': hostnames.get(p.source_ip),
                 'destination_ip': p.destination_ip,
+                'destination_host': hostnames.get(p.destination_ip),
                 'source_port': p.source_port,
                 'destination_port': p.destination_port,
                 'protocol': p.protocol,
@@ -307,111 +364,253 @@ class CaptureService:
             for p in packets
         ]
     
-    def _capture_thread(self, session_id, app):
-        """Background thread to generate packet data"""
-        protocols = ['TCP', 'UDP', 'ICMP', 'HTTP', 'HTTPS', 'DNS', 'SSH', 'FTP']
-        flags_options = ['SYN', 'ACK', 'FIN', 'PSH', 'RST', 'SYN,ACK', 'PSH,ACK', 'FIN,ACK']
-        
-        # Common source/destination IPs for more realistic traffic
-        source_ips = [
-            '192.168.1.100', '192.168.1.101', '192.168.1.102', '10.0.0.50',
-            '172.16.0.20', '192.168.0.150', '10.1.1.30'
-        ]
-        dest_ips = [
-            '8.8.8.8', '1.1.1.1', '172.217.14.206', '151.101.1.140',
-            '104.16.132.229', '13.107.21.200', '192.168.1.1'
-        ]
-        
-        print(f"Capture thread started for session {session_id}")
+    def _attach_session(self, session, app):
+        """Attach a session to its interface's shared capture, starting the capture if needed"""
+        buffer = PacketRingBuffer(
+            app.config['PACKET_BUFFER_SIZE'],
+            policy=app.config['PACKET_BUFFER_POLICY']
+        )
+        writer = PacketBatchWriter(
+            session.id,
+            batch_size=app.config['INGEST_BATCH_SIZE'],
+            flush_interval=app.config['INGEST_FLUSH_INTERVAL'],
+            store=get_packet_store()
+        )
+        self.buffers[session.id] = buffer
+        self.writers[session.id] = writer
         
-        alert_check_counter = 0
+        writer_thread = threading.Thread(
+            target=self._writer_thread,
+            args=(session.id, app, buffer, writer),
+            daemon=True
+        )
+        writer_thread.start()
+        
+        key = (session.interface_id, session.capture_source)
+        with self.capture_lock:
+            capture = self.captures.get(key)
+            if capture is None:
+                capture = SharedCapture(key, session.interface.name, session.capture_source)
+                self.captures[key] = capture
+                thread = threading.Thread(
+                    target=self._capture_thread,
+                    args=(capture, session.id, app),
+                    daemon=True
+                )
+                thread.start()
+                print(f"Started {session.capture_source} capture thread on {session.interface.name}")
+            capture.attach(session.id, PacketFilter.from_session(session), buffer)
+        
+        print(f"Attached session {session.id} to {session.capture_source} capture on {session.interface.name}")
+        return capture
+    
+    def _open_source(self, capture, session, config):
+        """Open the capture source for a shared capture, in a worker process if configured"""
+        if session.capture_source == 'live':
+            options = {'snaplen': config['CAPTURE_SNAPLEN']}
+        elif session.capture_source == 'ring':
+            options = {
+                'snaplen': config['CAPTURE_SNAPLEN'],
+                'ring_size_mb': session.ring_size_mb or config['CAPTURE_RING_SIZE_MB'],
+                'block_timeout_ms': session.ring_block_timeout_ms or config['CAPTURE_RING_BLOCK_TIMEOUT_MS']
+            }
+        else:
+            options = {'packets_per_second': config['SIMULATED_PACKET_RATE']}
+        
+        signatures = load_signatures(config['SIGNATURE_FILE'])
+        
+        if config['CAPTURE_WORKER_MODE'] == 'process':
+            return supervisor.start(capture.key, {
+                'source': capture.capture_source,
+                'interface': capture.interface_name,
+                'options': options,
+                'signatures': signatures,
+                'inspect_bytes': config['SIGNATURE_INSPECT_BYTES']
+            })
+        
+        return CaptureTap(open_capture_source(capture.capture_source, capture.interface_name, **options),
+                          signatures=signatures, inspect_bytes=config['SIGNATURE_INSPECT_BYTES'])
+    
+    def _fail_sessions(self, session_ids, capture):
+        """Mark sessions failed and detach them from their capture"""
+        interfaces = set()
+        for session_id in session_ids:
+            capture.detach(session_id)
+            session = CaptureSession.query.get(session_id)
+            if session and session.status in ['running', 'paused']:
+                session.status = 'failed'
+                session.end_time = datetime.utcnow()
+                interfaces.add(session.interface)
+        # Other capture sources may still be running on the same interface
+        for interface in interfaces:
+            interface.is_monitoring = CaptureSession.query.filter(
+                CaptureSession.interface_id == interface.id,
+                CaptureSession.status.in_(['running', 'paused'])
+            ).count() > 0
+        db.session.commit()
+    
+    def _capture_thread(self, capture, session_id, app):
+        """Background thread that reads one interface and feeds every attached session"""
+        with app.app_context():
+            # Ring and rate options come from the session that opened the capture
+            session = CaptureSession.query.get(session_id)
+            try:
+                capture.tap = self._open_source(capture, session, app.config)
+            except Exception as e:
+                print(f"Failed to open {capture.capture_source} capture on {capture.interface_name}: {e}")
+                with self.capture_lock:
+                    self.captures.pop(capture.key, None)
+                self._fail_sessions(capture.session_ids, capture)
+                return
+            
+            # Control arrives through stop/pause/resume_capture, not by polling the session rows
+            last_drops_update = time.monotonic()
+            last_rollup_update = time.monotonic()
+            try:
+                while True:
+                    try:
+                        # Stop capturing while every session is paused
+                        capture.apply_filters()
+                        if not capture.wait_active():
+                            with self.capture_lock:
+                                if capture.sessions:
+                                    continue
+                                self.captures.pop(capture.key, None)
+                                break
+                        
+                        capture.poll(timeout=1.0)
+                        
+                        if time.monotonic() - last_rollup_update >= app.config['INGEST_FLUSH_INTERVAL']:
+                            last_rollup_update = time.monotonic()
+                            self._record_aggregates(capture)
+                        
+                        if time.monotonic() - last_drops_update >= app.config['ALERT_CHECK_INTERVAL']:
+                            last_drops_update = time.monotonic()
+                            self._record_kernel_drops(capture)
+                        
+                    except CaptureWorkerError as e:
+                        print(f"Capture worker for {capture.capture_source} on {capture.interface_name} failed: {e}")
+                        db.session.rollback()
+                        with self.capture_lock:
+                            self.captures.pop(capture.key, None)
+                        self._fail_sessions(capture.session_ids, capture)
+                        break
+                    except Exception as e:
+                        print(f"Error in capture thread {capture.interface_name}: {e}")
+                        import traceback
+                        traceback.print_exc()
+                        db.session.rollback()
+                        time.sleep(1)
+            finally:
+                capture.close()
+                interface_id = capture.key[0]
+                with self.capture_lock:
+                    last_on_interface = not any(key[0] == interface_id for key in self.captures)
+                if last_on_interface:
+                    flow_tables.flush(interface_id)
+                try:
+                    self._record_aggregates(capture, final=last_on_interface)
+                except Exception as e:
+                    print(f"Error writing rollups and flows for {capture.interface_name}: {e}")
+                    db.session.rollback()
+    
+    def _record_kernel_drops(self, capture):
+        """Persist changed per-session kernel drop counts"""
+        sessions = CaptureSession.__table__
+        for session_id, drops in capture.unrecorded_kernel_drops().items():
+            db.session.execute(
+                sessions.update().where(sessions.c.id == session_id).values(kernel_drops=drops)
+            )
+        db.session.commit()
+    
+    def _record_aggregates(self, capture, final=False):
+        """Persist the interface rollups counted and the flows finished since the last call, and passive DNS and DHCP leases when due"""
+        write_rollups(InterfaceRollup, capture.key[0], capture.rollups.drain())
+        flow_writer.write()
+        passive_dns.save(force=final)
+        dhcp_leases.snapshot(force=final)
+        db.session.commit()
+    
+    def _writer_thread(self, session_id, app, buffer, writer):
+        """Background thread that persists buffered packets for a session"""
+        last_alert_check = time.monotonic()
+        last_emit = last_alert_check
         
         with app.app_context():
             # Import alert engine for periodic evaluation
             from app.services.alert_service import AlertEngine
             alert_engine = AlertEngine()
             
-            while True:
+            while not buffer.drained:
                 try:
-                    session = CaptureSession.query.get(session_id)
-                    if not session or session.status not in ['running', 'paused']:
-                        print(f"Session {session_id} stopped or not found")
-                        break
+                    writer.add(buffer.get_batch(writer.batch_size, timeout=writer.flush_interval))
+                    if writer.due():
+                        writer.flush()
                     
-                    # Skip packet generation if paused
-                    if session.status == 'paused':
-                        time.sleep(1)
+                    # Full batches are written as they fill, so alerts and stats keep
+                    # their own timers rather than waiting for a due flush
+                    now = time.monotonic()
+                    if now - last_emit < writer.flush_interval:
                         continue
+                    last_emit = now
                     
-                    # Generate more packets per cycle (20-50)
-                    packet_count = random.randint(20, 50)
-                    for _ in range(packet_count):
-                        packet = Packet(
-                            session_id=session_id,
-                            source_ip=random.choice(source_ips),
-                            destination_ip=random.choice(dest_ips),
-                            source_port=random.randint(1024, 65535),
-                            destination_port=random.choice([80, 443, 53, 22, 25, 3306, 5432, 8080, 3389]),
-                            protocol=random.choice(protocols),
-                            length=random.randint(64, 1500),
-                            flags=random.choice(flags_options) if random.choice(protocols) == 'TCP' else None
-                        )
-                        db.session.add(packet)
-                        session.packet_count += 1
-                        session.bytes_captured += packet.length
-                    
-                    db.session.commit()
-                    print(f"Session {session_id}: Generated {packet_count} packets, total: {session.packet_count}")
+                    session = CaptureSession.query.get(session_id)
                     
-                    # Check alerts every 30 seconds (30 iterations)
-                    alert_check_counter += 1
-                    if alert_check_counter >= 30:
-                        alert_check_counter = 0
-                        
-                        # Calculate current metrics
-                        duration = (datetime.utcnow() - session.start_time).total_seconds()
-                        if duration > 0:
-                            bandwidth_mbps = (session.bytes_captured * 8) / duration / 1000000
-                            packet_rate = session.packet_count / duration
-                            
-                            # Get unique connections in last 5 minutes
-                            from sqlalchemy import func
-                            connections = db.session.query(
-                                func.count(func.distinct(Packet.source_ip))
-                            ).filter(
-                                Packet.session_id == session_id,
-                                Packet.timestamp >= datetime.utcnow() - timedelta(minutes=5)
-                            ).scalar() or 0
-                            
-                            metrics = {
-                                'bandwidth': bandwidth_mbps,
-                                'packet_rate': packet_rate,
-                                'connection': connections,
-                            }
-                            
-                            print(f"Session {session_id}: Evaluating alerts - Bandwidth: {bandwidth_mbps:.2f} Mbps, Packet Rate: {packet_rate:.0f} pps, Connections: {connections}")
-                            
-                            # Evaluate alert rules
-                            try:
-                                triggered_alerts = alert_engine.evaluate_rules(metrics)
-                                if triggered_alerts:
-                                    print(f"⚠️  {len(triggered_alerts)} alert(s) triggered!")
-                                    for alert in triggered_alerts:
-                                        print(f"   - {alert.rule.name}: {alert.triggered_value}")
-                            except Exception as e:
-                                print(f"Error evaluating alerts: {e}")
+                    # Check alerts every 30 seconds
+                    if now - last_alert_check >= 30:
+                        last_alert_check = now
+                        self._evaluate_alerts(session, alert_engine)
                     
                     # Emit stats via websocket
                     socketio.emit('packet_update', {
                         'session_id': session_id,
                         'packet_count': session.packet_count,
-                        'bytes_captured': session.bytes_captured
+                        'bytes_captured': session.bytes_captured,
+                        'kernel_drops': session.kernel_drops or 0,
+                        'buffer': buffer.stats()
                     })
                     
                 except Exception as e:
-                    print(f"Error in capture thread {session_id}: {e}")
+                    print(f"Error in writer thread {session_id}: {e}")
                     import traceback
                     traceback.print_exc()
                     db.session.rollback()
-                
-                time.sleep(1)
+                    time.sleep(1)
+            
+            try:
+                writer.flush()
+            except Exception as e:
+                print(f"Error flushing packets for session {session_id}: {e}")
+            
+            self.buffers.pop(session_id, None)
+            self.writers.pop(session_id, None)
+    
+    def _evaluate_alerts(self, session, alert_engine):
+        """Evaluate alert rules against a session's current metrics"""
+        duration = (datetime.utcnow() - session.start_time).total_seconds()
+        if duration <= 0:
+            return
+        
+        bandwidth_mbps = (session.bytes_captured * 8) / duration / 1000000
+        packet_rate = session.packet_count / duration
+        
+        # Get unique connections in last 5 minutes on the session's interface
+        connections = count_recent_sources(session.interface_id, minutes=5)
+        
+        metrics = {
+            'bandwidth': bandwidth_mbps,
+            'packet_rate': packet_rate,
+            'connection': connections,
+        }
+        
+        print(f"Session {session.id}: Evaluating alerts - Bandwidth: {bandwidth_mbps:.2f} Mbps, Packet Rate: {packet_rate:.0f} pps, Connections: {connections}")
+        
+        # Evaluate alert rules
+        try:
+            triggered_alerts = alert_engine.evaluate_rules(metrics)
+            if triggered_alerts:
+                print(f"⚠️  {len(triggered_alerts)} alert(s) triggered!")
+                for alert in triggered_alerts:
+                    print(f"   - {alert.rule.name}: {alert.triggered_value}")
+        except Exception as e:
+            print(f"Error evaluating alerts: {e}")
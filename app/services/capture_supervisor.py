@@ -0,0 +1,146 @@
+"""Out-of-process capture workers
+
+Each worker is a separate Python process that opens an interface's capture
+source, decodes and demultiplexes frames and sends per-session batches of
+packet records back to the web process over a pipe, so capture and decode
+run on their own core instead of sharing the GIL with request handling.
+
+Workers are started with ``python -m app.services.capture_worker`` rather
+than multiprocessing's spawn, which would re-import the launching script
+(``run.py`` creates the Flask app at import time).
+"""
+import atexit
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Connection
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class CaptureWorkerError(Exception):
+    """Raised when a capture worker fails or exits unexpectedly"""
+
+
+class CaptureWorker:
+    """Parent-side handle for a capture worker process"""
+
+    def __init__(self, key, settings, start_timeout=30):
+        self.key = key
+        self.kernel_stats = {}
+        self.closed = False
+
+        command_read, command_write = os.pipe()
+        result_read, result_write = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', 'app.services.capture_worker', str(command_read), str(result_write)],
+                pass_fds=(command_read, result_write),
+                cwd=PROJECT_ROOT
+            )
+        finally:
+            os.close(command_read)
+            os.close(result_write)
+
+        self.commands = Connection(command_write, readable=False)
+        self.results = Connection(result_read, writable=False)
+        self.commands.send(settings)
+
+        if not self.results.poll(start_timeout):
+            self.close()
+            raise CaptureWorkerError('Capture worker did not start')
+        kind, payload = self._recv()
+        if kind == 'error':
+            self.close()
+            raise CaptureWorkerError(payload)
+
+    def set_filters(self, filters):
+        """Send the {session_id: PacketFilter} mapping to the worker"""
+        self._send(('filters', {session_id: f.to_dict() for session_id, f in filters.items()}))
+
+    def poll(self, handler, timeout=1.0):
+        """Hand {session_id: [records]} batches from the worker to the handler"""
+        count = 0
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if not self.results.poll(max(remaining, 0)):
+                break
+            kind, payload = self._recv()
+            if kind == 'packets':
+                handler(payload)
+                count += sum(len(records) for records in payload.values())
+            elif kind == 'stats':
+                self.kernel_stats = payload
+            elif kind == 'error':
+                raise CaptureWorkerError(payload)
+            if remaining <= 0:
+                break
+        return count
+
+    def stats(self):
+        return dict(self.kernel_stats)
+
+    def close(self, timeout=5):
+        """Stop the worker process"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.commands.send(('stop', None))
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.commands.close()
+        self.results.close()
+        supervisor.unregister(self)
+
+    def _send(self, command):
+        try:
+            self.commands.send(command)
+        except OSError:
+            raise CaptureWorkerError('Capture worker exited')
+
+    def _recv(self):
+        try:
+            return self.results.recv()
+        except (EOFError, OSError):
+            raise CaptureWorkerError(f'Capture worker exited with code {self.process.poll()}')
+
+
+class CaptureSupervisor:
+    """Tracks running capture workers and stops them on shutdown"""
+
+    def __init__(self):
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def start(self, key, settings):
+        """Start a capture worker for an interface capture"""
+        worker = CaptureWorker(key, settings)
+        with self.lock:
+            self.workers[key] = worker
+        print(f"Started capture worker pid {worker.process.pid} for {settings['source']} capture on {settings['interface']}")
+        return worker
+
+    def unregister(self, worker):
+        with self.lock:
+            if self.workers.get(worker.key) is worker:
+                del self.workers[worker.key]
+
+    def shutdown(self):
+        """Stop all capture workers"""
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.close()
+
+
+supervisor = CaptureSupervisor()
+atexit.register(supervisor.shutdown)
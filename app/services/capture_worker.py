@@ -0,0 +1,72 @@
+"""Capture worker process entry point, see capture_supervisor"""
+import os
+import sys
+import time
+from multiprocessing.connection import Connection
+from app.services.packet_capture import open_capture_source
+from app.services.packet_demux import CaptureTap
+from app.services.packet_filter import PacketFilter
+from app.services.signature_engine import DEFAULT_DEPTH
+
+
+def run_worker(commands, results):
+    """Worker process main loop"""
+    settings = commands.recv()
+    try:
+        tap = CaptureTap(open_capture_source(settings['source'], settings['interface'], **settings['options']),
+                         signatures=settings.get('signatures'), inspect_bytes=settings.get('inspect_bytes', DEFAULT_DEPTH))
+    except Exception as e:
+        results.send(('error', f"Failed to open {settings['source']} capture on {settings['interface']}: {e}"))
+        return
+    results.send(('started', os.getpid()))
+
+    poll_interval = settings.get('poll_interval', 0.25)
+    last_stats = 0
+    try:
+        while True:
+            while commands.poll():
+                command, payload = commands.recv()
+                if command == 'stop':
+                    return
+                if command == 'filters':
+                    tap.set_filters({session_id: PacketFilter(**f) for session_id, f in payload.items()})
+
+            # Every session is paused: wait for the next command instead of polling
+            if not tap.demux.routes:
+                commands.poll(None)
+                continue
+
+            # One message per poll; records shared between sessions are pickled once
+            batches = {}
+            tap.poll(lambda routed: _merge(batches, routed), timeout=poll_interval)
+            if batches:
+                results.send(('packets', batches))
+
+            if time.monotonic() - last_stats >= 1:
+                last_stats = time.monotonic()
+                results.send(('stats', tap.stats()))
+    except (EOFError, BrokenPipeError):
+        # Parent went away
+        pass
+    except Exception as e:
+        try:
+            results.send(('error', str(e)))
+        except OSError:
+            pass
+    finally:
+        tap.close()
+
+
+def _merge(batches, routed):
+    for session_id, records in routed.items():
+        if session_id in batches:
+            batches[session_id].extend(records)
+        else:
+            batches[session_id] = list(records)
+
+
+if __name__ == '__main__':
+    run_worker(
+        Connection(int(sys.argv[1]), writable=False),
+        Connection(int(sys.argv[2]), readable=False)
+    )
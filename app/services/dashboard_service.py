@@ -4,6 +4,13 @@ from datetime import datetime, timedelta
 from app import db
 from app.models.dashboard import Dashboard, Widget
 
+# Time range -> (span, seconds per chart point)
+TIME_SERIES_RANGES = {
+    '24h': (timedelta(hours=24), 3600),
+    '7d': (timedelta(days=7), 6 * 3600),
+    '30d': (timedelta(days=30), 86400)
+}
+
 class DashboardService:
     
     def create_dashboard(self, name, user_id, layout=None):
@@ -118,6 +125,14 @@ class DashboardService:
             return self._get_geographic_data()
         elif data_source == 'connection_states':
             return self._get_connection_states()
+        elif data_source == 'tcp_latency':
+            return self._get_tcp_latency()
+        elif data_source == 'tcp_loss':
+            return self._get_tcp_loss()
+        elif data_source == 'tls_versions':
+            return self._get_tls_versions()
+        elif data_source == 'tls_fingerprints':
+            return self._get_tls_fingerprints()
         elif data_source == 'alert_summary':
             return self._get_alert_summary()
         elif data_source == 'interface_health':
@@ -145,66 +160,56 @@ class DashboardService:
         }
     
     def _get_bandwidth_data(self, time_range):
-        """Get bandwidth usage data from active interfaces"""
-        from app.models.network_interface import NetworkInterface
-        from app.models.capture_session import CaptureSession
-        
-        # Get active monitoring sessions
-        active_sessions = CaptureSession.query.filter_by(status='running').all()
-        
-        # Calculate actual bandwidth based on captured data
-        points = 60 if time_range == '24h' else 30
-        data = []
-        base_bandwidth = sum(session.bytes_captured / 1000000 / max((datetime.utcnow() - session.start_time).total_seconds(), 1) for session in active_sessions)
-        
-        for i in range(points):
-            timestamp = datetime.utcnow() - timedelta(hours=points-i)
-            value = base_bandwidth * random.uniform(0.7, 1.3)
-            data.append({
-                'timestamp': timestamp.isoformat(),
-                'value': round(value, 2)
-            })
+        """Get bandwidth usage data from interface rollups"""
+        series, recent, step = self._get_rollup_series(time_range)
+        
+        data = [
+            {'timestamp': timestamp.isoformat(), 'value': round(length * 8 / 1000000 / step, 2)}
+            for timestamp, packets, length in series
+        ]
+        current = sum(length for _, _, length in recent) * 8 / 1000000 / len(recent)
         
-        return {'data': data, 'unit': 'Mbps', 'current': round(base_bandwidth, 2)}
+        return {'data': data, 'unit': 'Mbps', 'current': round(current, 2)}
     
     def _get_packet_rate_data(self, time_range):
-        """Get packet rate data from capture sessions"""
-        from app.models.capture_session import CaptureSession
-        
-        active_sessions = CaptureSession.query.filter_by(status='running').all()
-        
-        # Calculate actual packet rate
-        points = 60 if time_range == '24h' else 30
-        data = []
-        base_rate = sum(session.packet_count / max((datetime.utcnow() - session.start_time).total_seconds(), 1) for session in active_sessions)
-        
-        for i in range(points):
-            timestamp = datetime.utcnow() - timedelta(minutes=points-i)
-            value = int(base_rate * random.uniform(0.8, 1.2))
-            data.append({
-                'timestamp': timestamp.isoformat(),
-                'value': value
-            })
+        """Get packet rate data from interface rollups"""
+        series, recent, step = self._get_rollup_series(time_range)
+        
+        data = [
+            {'timestamp': timestamp.isoformat(), 'value': int(packets / step)}
+            for timestamp, packets, length in series
+        ]
+        current = sum(packets for _, packets, _ in recent) / len(recent)
         
-        return {'data': data, 'unit': 'packets/sec', 'current': int(base_rate)}
+        return {'data': data, 'unit': 'packets/sec', 'current': int(current)}
+    
+    def _get_rollup_series(self, time_range):
+        """Get the range's series, the last minute of 1s buckets and the series step across all interfaces"""
+        from app.services.rollup_service import RollupService
+        
+        span, step = TIME_SERIES_RANGES.get(time_range, TIME_SERIES_RANGES['24h'])
+        now = datetime.utcnow()
+        rollups = RollupService()
+        series = rollups.get_series(now - span + timedelta(seconds=step), now, step)
+        recent = rollups.get_series(now - timedelta(seconds=60), now - timedelta(seconds=1), 1)
+        return series, recent, step
     
     def _get_protocol_distribution(self):
-        """Get protocol distribution from actual packet data"""
-        from app.models.packet import Packet
-        from sqlalchemy import func
+        """Get protocol distribution from the stored protocol codes"""
+        from app.models.types import datetime_to_ns
+        from app.services.rollup_service import RollupService
+        from app.services.segment_store import get_packet_store
         
-        # Get protocol counts from last 24 hours
-        protocol_counts = db.session.query(
-            Packet.protocol,
-            func.count(Packet.id).label('count')
-        ).filter(
-            Packet.timestamp >= datetime.utcnow() - timedelta(hours=24)
-        ).group_by(Packet.protocol).all()
+        now = datetime.utcnow()
+        since = now - timedelta(hours=24)
+        store = get_packet_store()
         
-        result = {}
-        for protocol, count in protocol_counts:
-            if protocol:
-                result[protocol] = count
+        if store is not None:
+            # Scan the protocol column of the last 24 hours of segments
+            result = store.protocol_counts(start_ns=datetime_to_ns(since))
+        else:
+            # Per-protocol minute rollups are already grouped by code
+            result = RollupService().get_protocol_counts(since, now, resolution=60)
         
         # If no data, return minimal placeholder
         if not result:
@@ -213,23 +218,47 @@ class DashboardService:
         return result
     
     def _get_top_talkers(self):
-        """Get top talkers from actual packet data"""
+        """Get top talkers from the live top-K sketches, or packet data before any capture has run"""
         from app.models.packet import Packet
+        from app.models.types import datetime_to_ns
+        from app.services.heavy_hitters import heavy_hitters
+        from app.services.passive_dns import passive_dns
+        from app.services.segment_store import get_packet_store
         from sqlalchemy import func
         
+        top = heavy_hitters.top('source_ip', '24h', limit=10)
+        if top:
+            return [
+                {
+                    'ip': entry['key'],
+                    'hostname': passive_dns.lookup(entry['key']),
+                    'packets': entry['packets'],
+                    'bytes': entry['bytes'],
+                    'error': entry['error']
+                }
+                for entry in top
+            ]
+        
+        since = datetime.utcnow() - timedelta(hours=24)
+        store = get_packet_store()
+        
         # Get top source IPs by packet count
-        top_sources = db.session.query(
-            Packet.source_ip,
-            func.count(Packet.id).label('packets'),
-            func.sum(Packet.length).label('bytes')
-        ).filter(
-            Packet.timestamp >= datetime.utcnow() - timedelta(hours=24)
-        ).group_by(Packet.source_ip).order_by(func.count(Packet.id).desc()).limit(10).all()
+        if store is not None:
+            top_sources = store.top_sources(start_ns=datetime_to_ns(since), limit=10)
+        else:
+            top_sources = db.session.query(
+                Packet.source_ip,
+                func.count(Packet.id).label('packets'),
+                func.sum(Packet.length).label('bytes')
+            ).filter(
+                Packet.timestamp >= since
+            ).group_by(Packet.source_ip).order_by(func.count(Packet.id).desc()).limit(10).all()
         
         talkers = []
         for ip, packets, bytes_total in top_sources:
             talkers.append({
                 'ip': ip,
+                'hostname': passive_dns.lookup(ip),
                 'packets': packets,
                 'bytes': bytes_total or 0
             })
@@ -245,64 +274,74 @@ class DashboardService:
         }
     
     def _get_connection_states(self):
-        """Get connection states from TCP packet analysis"""
-        from app.models.packet import Packet
-        from sqlalchemy import func
+        """Get connection states from the live flow tables"""
+        from app.services.flow_table import flow_tables
+        
+        return flow_tables.state_counts()
+    
+    def _get_tcp_latency(self):
+        """Get per-minute 90th percentile handshake RTT over the last hour"""
+        from app.services.flow_table import flow_tables
+        
+        series = flow_tables.tcp_series(minutes=60)
         
-        # Analyze TCP flags from recent packets
-        tcp_packets = Packet.query.filter(
-            Packet.protocol == 'TCP',
-            Packet.timestamp >= datetime.utcnow() - timedelta(hours=1)
-        ).all()
-        
-        states = {
-            'ESTABLISHED': 0,
-            'TIME_WAIT': 0,
-            'CLOSE_WAIT': 0,
-            'SYN_SENT': 0
+        return {
+            'data': [
+                {'timestamp': minute.isoformat(), 'value': summary['rtt_ms']['p90']}
+                for minute, summary in series
+                if summary['rtt_ms']['samples']
+            ],
+            'unit': 'ms (p90 handshake RTT)',
+            'current': flow_tables.tcp_performance(minutes=5)['rtt_ms']
         }
+    
+    def _get_tcp_loss(self):
+        """Get per-minute TCP retransmission percentage over the last hour"""
+        from app.services.flow_table import flow_tables
         
-        for packet in tcp_packets:
-            if packet.flags:
-                if 'ACK' in packet.flags:
-                    states['ESTABLISHED'] += 1
-                elif 'SYN' in packet.flags:
-                    states['SYN_SENT'] += 1
-                elif 'FIN' in packet.flags:
-                    states['TIME_WAIT'] += 1
+        series = flow_tables.tcp_series(minutes=60)
+        performance = flow_tables.tcp_performance(minutes=5)
         
-        return states
+        return {
+            'data': [
+                {'timestamp': minute.isoformat(), 'value': round(summary['retransmission_rate'] * 100, 2)}
+                for minute, summary in series
+            ],
+            'unit': '% retransmitted',
+            'retransmissions': performance['retransmissions'],
+            'out_of_order': performance['out_of_order'],
+            'zero_window_events': performance['zero_window_events']
+        }
+    
+    def _get_tls_versions(self):
+        """Get negotiated TLS versions over the last 24 hours"""
+        from app.services.tls_stats import tls_stats
+        
+        return tls_stats.summary()['tls_versions']
+    
+    def _get_tls_fingerprints(self):
+        """Get the most common JA3 client and JA3S server fingerprints over the last 24 hours"""
+        from app.services.tls_stats import tls_stats
+        
+        summary = tls_stats.summary()
+        
+        return {
+            'ja3': summary['ja3'],
+            'ja3s': summary['ja3s']
+        }
     
     def _get_alert_summary(self):
         """Get alert summary from actual alert data"""
-        from app.models.alert import Alert, AlertRule
+        from app.services.alert_service import AlertEngine
         
         # Get active alerts by severity
-        critical = Alert.query.join(AlertRule).filter(
-            Alert.status == 'active',
-            AlertRule.severity == 'critical'
-        ).count()
-        
-        high = Alert.query.join(AlertRule).filter(
-            Alert.status == 'active',
-            AlertRule.severity == 'high'
-        ).count()
-        
-        medium = Alert.query.join(AlertRule).filter(
-            Alert.status == 'active',
-            AlertRule.severity == 'medium'
-        ).count()
-        
-        low = Alert.query.join(AlertRule).filter(
-            Alert.status == 'active',
-            AlertRule.severity == 'low'
-        ).count()
+        counts = AlertEngine().get_active_counts_by_severity()
         
         return {
-            'critical': critical,
-            'high': high,
-            'medium': medium,
-            'low': low
+            'critical': counts.get('critical', 0),
+            'high': counts.get('high', 0),
+            'medium': counts.get('medium', 0),
+            'low': counts.get('low', 0)
         }
     
     def _get_interface_health(self):
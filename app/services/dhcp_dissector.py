@@ -0,0 +1,112 @@
+"""DHCP message parsing from UDP port 67/68 payload bytes
+
+Decodes the BOOTP fields and the options the lease tracker needs: message
+type, requested address, lease time, server identifier and host name.
+"""
+import struct
+from app.models.types import IPV4_MAPPED
+
+DISCOVER = 1
+OFFER = 2
+REQUEST = 3
+DECLINE = 4
+ACK = 5
+NAK = 6
+RELEASE = 7
+INFORM = 8
+
+MESSAGE_TYPES = {
+    DISCOVER: 'DISCOVER',
+    OFFER: 'OFFER',
+    REQUEST: 'REQUEST',
+    DECLINE: 'DECLINE',
+    ACK: 'ACK',
+    NAK: 'NAK',
+    RELEASE: 'RELEASE',
+    INFORM: 'INFORM'
+}
+
+_MAGIC_COOKIE = b'\x63\x82\x53\x63'
+_OPTIONS_OFFSET = 240
+
+_bootp = struct.Struct('!BBBBIHH4s4s4s4s16s')
+
+
+class DhcpMessage:
+    """DHCP message fields used for lease tracking; addresses are 128-bit integers or None"""
+
+    __slots__ = ('message_type', 'xid', 'mac', 'client_ip', 'your_ip', 'requested_ip', 'server_id',
+                 'lease_time', 'hostname')
+
+    def __init__(self, message_type, xid, mac, client_ip=None, your_ip=None, requested_ip=None, server_id=None,
+                 lease_time=None, hostname=None):
+        self.message_type = message_type
+        self.xid = xid
+        self.mac = mac
+        self.client_ip = client_ip
+        self.your_ip = your_ip
+        self.requested_ip = requested_ip
+        self.server_id = server_id
+        self.lease_time = lease_time
+        self.hostname = hostname
+
+    def __reduce__(self):
+        return (DhcpMessage, (self.message_type, self.xid, self.mac, self.client_ip, self.your_ip,
+                              self.requested_ip, self.server_id, self.lease_time, self.hostname))
+
+    @property
+    def type_name(self):
+        return MESSAGE_TYPES.get(self.message_type, f'TYPE{self.message_type}')
+
+    def __repr__(self):
+        return f'<DhcpMessage {self.type_name} {self.mac} xid={self.xid:#x}>'
+
+
+def _address(raw):
+    value = int.from_bytes(raw, 'big')
+    return IPV4_MAPPED | value if value else None
+
+
+def parse_dhcp(payload):
+    """Parse a DHCP message, returning None for plain BOOTP or malformed payloads"""
+    if len(payload) < _OPTIONS_OFFSET or bytes(payload[236:240]) != _MAGIC_COOKIE:
+        return None
+    _, htype, hlen, _, xid, _, _, ciaddr, yiaddr, _, _, chaddr = _bootp.unpack_from(payload)
+    if htype != 1 or hlen != 6:
+        return None
+
+    options = {}
+    offset = _OPTIONS_OFFSET
+    end = len(payload)
+    while offset < end:
+        code = payload[offset]
+        if code == 255:
+            break
+        if code == 0:
+            offset += 1
+            continue
+        if offset + 1 >= end:
+            break
+        length = payload[offset + 1]
+        options[code] = bytes(payload[offset + 2:offset + 2 + length])
+        offset += 2 + length
+
+    message_type = options.get(53)
+    if not message_type:
+        return None
+
+    lease_time = options.get(51)
+    hostname = options.get(12)
+    if hostname:
+        hostname = hostname.rstrip(b'\x00').decode('latin-1').lower() or None
+    return DhcpMessage(
+        message_type[0],
+        xid,
+        ':'.join(f'{b:02x}' for b in chaddr[:6]),
+        client_ip=_address(ciaddr),
+        your_ip=_address(yiaddr),
+        requested_ip=_address(options[50]) if len(options.get(50, b'')) == 4 else None,
+        server_id=_address(options[54]) if len(options.get(54, b'')) == 4 else None,
+        lease_time=int.from_bytes(lease_time, 'big') if lease_time and len(lease_time) == 4 else None,
+        hostname=hostname
+    )
@@ -0,0 +1,224 @@
+"""Live DHCP lease table built from captured DHCP exchanges
+
+Clients name themselves in DISCOVER/REQUEST (option 12), and the server's
+ACK grants the lease: address, lease time and server identifier. RELEASE,
+DECLINE and NAK end or cancel it. Leases are indexed by both MAC and IP, so
+an address resolves to its client's host name with one dict lookup. The
+table is snapshotted to dhcp_leases on an interval and reloaded from it on
+first use.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models.dhcp_lease import DhcpLease
+from app.models.types import int_to_ip, ip_to_int
+from app.services.dhcp_dissector import ACK, DECLINE, DISCOVER, INFORM, MESSAGE_TYPES, NAK, RELEASE, REQUEST, \
+    DhcpMessage
+from app.services.hostnames import is_plain_hostname
+
+# Host names remembered from client messages until the ACK arrives
+MAX_CLIENT_NAMES = 4096
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class Lease:
+    """One address leased to one client; times are epoch seconds"""
+
+    __slots__ = ('ip', 'mac', 'hostname', 'server', 'interface_id', 'start', 'expires')
+
+    def __init__(self, ip, mac, hostname, server, interface_id, start, expires):
+        self.ip = ip
+        self.mac = mac
+        self.hostname = hostname
+        self.server = server
+        self.interface_id = interface_id
+        self.start = start
+        self.expires = expires
+
+    def to_dict(self):
+        return {
+            'ip': int_to_ip(self.ip),
+            'mac': self.mac,
+            'hostname': self.hostname,
+            'server': int_to_ip(self.server) if self.server is not None else None,
+            'interface_id': self.interface_id,
+            'lease_start': datetime.utcfromtimestamp(self.start).isoformat(),
+            'expires': datetime.utcfromtimestamp(self.expires).isoformat() if self.expires is not None else None
+        }
+
+
+class DhcpLeaseTable:
+    """Leases indexed by MAC and by IP, fed by the shared captures"""
+
+    def __init__(self):
+        self.by_mac = {}
+        self.by_ip = {}
+        self.client_names = OrderedDict()
+        self.message_counts = dict.fromkeys(MESSAGE_TYPES.values(), 0)
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.dirty = False
+        self.last_snapshot = time.monotonic()
+
+    def _ensure_loaded(self):
+        """Load unexpired leases from the last snapshot; needs an app context and the lock"""
+        if self.loaded:
+            return
+        self.loaded = True
+        now = datetime.utcnow()
+        for row in DhcpLease.query.filter(db.or_(DhcpLease.expires_at.is_(None), DhcpLease.expires_at > now)).all():
+            lease = Lease(
+                ip_to_int(row.ip),
+                row.mac,
+                row.hostname,
+                ip_to_int(row.server) if row.server else None,
+                row.interface_id,
+                (row.lease_start - _EPOCH).total_seconds(),
+                (row.expires_at - _EPOCH).total_seconds() if row.expires_at else None
+            )
+            self._add(lease)
+
+    def _add(self, lease):
+        previous = self.by_mac.pop(lease.mac, None)
+        if previous is not None and self.by_ip.get(previous.ip) is previous:
+            del self.by_ip[previous.ip]
+        # The address moved to a new client
+        holder = self.by_ip.get(lease.ip)
+        if holder is not None:
+            self.by_mac.pop(holder.mac, None)
+        self.by_mac[lease.mac] = lease
+        self.by_ip[lease.ip] = lease
+
+    def _remove(self, lease):
+        if lease is None:
+            return
+        if self.by_mac.get(lease.mac) is lease:
+            del self.by_mac[lease.mac]
+        if self.by_ip.get(lease.ip) is lease:
+            del self.by_ip[lease.ip]
+        self.dirty = True
+
+    def update(self, interface_id, records):
+        """Follow the DHCP exchanges in delivered records"""
+        messages = [record for record in records if isinstance(record.app, DhcpMessage)]
+        if not messages:
+            return
+
+        with self.lock:
+            self._ensure_loaded()
+            for record in messages:
+                message = record.app
+                self.message_counts[message.type_name] = self.message_counts.get(message.type_name, 0) + 1
+                kind = message.message_type
+                hostname = message.hostname if is_plain_hostname(message.hostname) else None
+
+                if kind in (DISCOVER, REQUEST, INFORM) and hostname:
+                    self.client_names[message.mac] = hostname
+                    self.client_names.move_to_end(message.mac)
+                    if len(self.client_names) > MAX_CLIENT_NAMES:
+                        self.client_names.popitem(last=False)
+
+                if kind == ACK and message.your_ip is not None:
+                    now = record.ts_ns / 1000000000
+                    previous = self.by_mac.get(message.mac)
+                    self._add(Lease(
+                        message.your_ip,
+                        message.mac,
+                        hostname or self.client_names.get(message.mac)
+                        or (previous.hostname if previous is not None else None),
+                        message.server_id or record.source_ip,
+                        interface_id,
+                        now,
+                        now + message.lease_time if message.lease_time is not None else None
+                    ))
+                    self.dirty = True
+                elif kind == RELEASE:
+                    self._remove(self.by_mac.get(message.mac))
+                elif kind == DECLINE and message.requested_ip is not None:
+                    # The client found the offered address already in use
+                    self._remove(self.by_ip.get(message.requested_ip))
+                elif kind == NAK:
+                    self.client_names.pop(message.mac, None)
+
+    def _expire(self):
+        now = time.time()
+        for lease in [lease for lease in self.by_mac.values() if lease.expires is not None and lease.expires <= now]:
+            self._remove(lease)
+
+    def hostname(self, address):
+        """Get the host name of the client leasing an address (string or integer), or None"""
+        if address is None:
+            return None
+        try:
+            key = address if isinstance(address, int) else ip_to_int(address)
+        except ValueError:
+            return None
+        with self.lock:
+            self._ensure_loaded()
+            lease = self.by_ip.get(key)
+            if lease is None or (lease.expires is not None and lease.expires <= time.time()):
+                return None
+            return lease.hostname
+
+    def lookup_mac(self, mac):
+        """Get the current lease of a MAC address as a dict, or None"""
+        with self.lock:
+            self._ensure_loaded()
+            self._expire()
+            lease = self.by_mac.get(mac.lower())
+            return lease.to_dict() if lease is not None else None
+
+    def leases(self):
+        """Get the current leases as dicts, most recent first"""
+        with self.lock:
+            self._ensure_loaded()
+            self._expire()
+            return [lease.to_dict() for lease in sorted(self.by_mac.values(), key=lambda l: l.start, reverse=True)]
+
+    def stats(self):
+        with self.lock:
+            return dict(self.message_counts)
+
+    def snapshot(self, force=False):
+        """Replace the dhcp_leases rows with the live table when it changed, at most once per interval; the caller commits"""
+        interval = current_app.config['DHCP_SNAPSHOT_INTERVAL']
+        if not self._snapshot_due(force, interval):
+            return 0
+
+        with self.lock:
+            # Checked again under the lock: two capture threads must not both replace the table
+            if not self._snapshot_due(force, interval):
+                return 0
+            self.last_snapshot = time.monotonic()
+            self._expire()
+            self.dirty = False
+            rows = [
+                {
+                    'mac': lease.mac,
+                    'ip': lease.ip,
+                    'hostname': lease.hostname[:255] if lease.hostname else None,
+                    'server': lease.server,
+                    'interface_id': lease.interface_id,
+                    'lease_start': datetime.utcfromtimestamp(lease.start),
+                    'expires_at': datetime.utcfromtimestamp(lease.expires) if lease.expires is not None else None
+                }
+                for lease in self.by_mac.values()
+            ]
+
+        table = DhcpLease.__table__
+        db.session.execute(table.delete())
+        if rows:
+            db.session.execute(table.insert(), rows)
+        return len(rows)
+
+    def _snapshot_due(self, force, interval):
+        if not self.dirty or not self.loaded:
+            return False
+        return force or time.monotonic() - self.last_snapshot >= interval
+
+
+dhcp_leases = DhcpLeaseTable()
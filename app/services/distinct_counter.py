@@ -0,0 +1,133 @@
+"""Distinct source counting with per-minute HyperLogLog sketches
+
+Each interface keeps one HyperLogLog per minute of the source addresses it
+delivered. "Distinct sources in the last N minutes" is the register-wise
+max of N sketches, with a standard error of about 1.04 / sqrt(2 ** precision)
+(1.6% at the default precision of 12). ``exact=True`` runs the
+COUNT(DISTINCT) query over stored packets instead.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from app import db
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(value):
+    """splitmix64 of a 128-bit address folded to 64 bits"""
+    z = ((value >> 64) ^ value) & _MASK64
+    z = (z + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+class HyperLogLog:
+    """Mergeable cardinality sketch over 128-bit integer keys"""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values):
+        registers = self.registers
+        precision = self.precision
+        width = 64 - precision
+        low_mask = (1 << width) - 1
+        for value in values:
+            h = _hash64(value)
+            index = h >> width
+            # Rank: position of the first set bit in the remaining bits
+            rank = width - (h & low_mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    @classmethod
+    def merge(cls, sketches):
+        merged = cls(sketches[0].precision)
+        np.maximum.reduce([sketch.registers for sketch in sketches], out=merged.registers)
+        return merged
+
+    def count(self):
+        """Estimate the number of distinct keys added"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class DistinctSourceCounter:
+    """Per-interface, per-minute HyperLogLog sketches of source addresses"""
+
+    def __init__(self):
+        self.sketches = {}
+        self.lock = threading.Lock()
+
+    def update(self, interface_id, records):
+        """Add the source addresses of delivered records for an interface"""
+        if not records:
+            return
+
+        sources = {record.source_ip for record in records}
+        minute = int(time.time() // 60)
+        with self.lock:
+            minutes = self.sketches.get(interface_id)
+            if minutes is None:
+                minutes = self.sketches[interface_id] = {}
+            sketch = minutes.get(minute)
+            if sketch is None:
+                sketch = minutes[minute] = HyperLogLog(current_app.config['DISTINCT_COUNTER_PRECISION'])
+                kept = current_app.config['DISTINCT_COUNTER_MINUTES']
+                for expired in [m for m in minutes if m <= minute - kept]:
+                    del minutes[expired]
+            sketch.update(sources)
+
+    def has_sketches(self, interface_id):
+        with self.lock:
+            return bool(self.sketches.get(interface_id))
+
+    def count(self, interface_ids, minutes=5):
+        """Estimate distinct sources over the last N minutes across the given interfaces"""
+        current = int(time.time() // 60)
+        with self.lock:
+            window = [
+                sketch
+                for interface_id in interface_ids
+                for minute, sketch in self.sketches.get(interface_id, {}).items()
+                if minute > current - minutes
+            ]
+            if not window:
+                return 0
+            return HyperLogLog.merge(window).count()
+
+
+def count_recent_sources(interface_id, minutes=5, exact=False):
+    """Get distinct source addresses seen on an interface in the last N minutes
+
+    Uses the sketches unless exact is requested or the interface has not
+    been captured since startup, in which case the stored packets are counted.
+    """
+    if not exact and distinct_sources.has_sketches(interface_id):
+        return distinct_sources.count([interface_id], minutes)
+
+    from sqlalchemy import func
+    from app.models.capture_session import CaptureSession
+    from app.models.packet import Packet
+
+    return db.session.query(
+        func.count(func.distinct(Packet.source_ip))
+    ).join(CaptureSession).filter(
+        CaptureSession.interface_id == interface_id,
+        Packet.timestamp >= datetime.utcnow() - timedelta(minutes=minutes)
+    ).scalar() or 0
+
+
+distinct_sources = DistinctSourceCounter()
@@ -0,0 +1,154 @@
+"""DNS message parsing from port 53 payload bytes
+
+The header, first question and the A/AAAA answers of successful responses
+are decoded, which is all the DNS aggregates and the passive DNS cache
+need. DNS over TCP is parsed when a segment starts with a
+complete length-prefixed message; segments continuing a message are skipped.
+"""
+import struct
+from app.models.types import IPV4_MAPPED
+
+QUERY_TYPES = {
+    1: 'A',
+    2: 'NS',
+    5: 'CNAME',
+    6: 'SOA',
+    12: 'PTR',
+    15: 'MX',
+    16: 'TXT',
+    28: 'AAAA',
+    33: 'SRV',
+    35: 'NAPTR',
+    43: 'DS',
+    48: 'DNSKEY',
+    64: 'SVCB',
+    65: 'HTTPS',
+    255: 'ANY'
+}
+
+RESPONSE_CODES = {
+    0: 'NOERROR',
+    1: 'FORMERR',
+    2: 'SERVFAIL',
+    3: 'NXDOMAIN',
+    4: 'NOTIMP',
+    5: 'REFUSED'
+}
+
+NXDOMAIN = 3
+
+# Answers decoded per response
+MAX_ANSWERS = 32
+
+_header = struct.Struct('!HHHHHH')
+_question = struct.Struct('!HH')
+_record = struct.Struct('!HHIH')  # type, class, ttl, rdata length
+
+
+class DnsMessage:
+    """Header, first question and answered addresses of a DNS query or response
+
+    addresses holds (address, ttl) for each A/AAAA answer, with addresses as
+    128-bit integers like PacketRecord's.
+    """
+
+    __slots__ = ('id', 'response', 'rcode', 'name', 'qtype', 'answer_count', 'addresses')
+
+    def __init__(self, id, response, rcode, name, qtype, answer_count, addresses=()):
+        self.id = id
+        self.response = response
+        self.rcode = rcode
+        self.name = name
+        self.qtype = qtype
+        self.answer_count = answer_count
+        self.addresses = addresses
+
+    def __reduce__(self):
+        return (DnsMessage, (self.id, self.response, self.rcode, self.name, self.qtype, self.answer_count,
+                             self.addresses))
+
+    @property
+    def type_name(self):
+        return QUERY_TYPES.get(self.qtype, f'TYPE{self.qtype}')
+
+    def __repr__(self):
+        kind = 'response' if self.response else 'query'
+        return f'<DnsMessage {kind} {self.id} {self.name} {self.type_name} rcode={self.rcode}>'
+
+
+def read_name(data, offset):
+    """Read a possibly compressed domain name, returning (name, offset after it)"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = data[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0 == 0xC0:
+            # Compression pointer; guard against loops
+            jumps += 1
+            if jumps > 16:
+                raise ValueError('DNS name compression loop')
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        if length > 63:
+            raise ValueError('Invalid DNS label length')
+        labels.append(bytes(data[offset + 1:offset + 1 + length]).decode('latin-1'))
+        offset += 1 + length
+    return '.'.join(labels).lower(), end if end is not None else offset
+
+
+def parse_dns(payload):
+    """Parse a DNS message, returning None when the payload is not one"""
+    if len(payload) < _header.size:
+        return None
+    try:
+        message_id, flags, question_count, answer_count, _, _ = _header.unpack_from(payload)
+        # Only standard queries (opcode 0) are aggregated
+        if (flags >> 11) & 0x0F != 0 or question_count == 0:
+            return None
+        name, offset = read_name(payload, _header.size)
+        qtype, _ = _question.unpack_from(payload, offset)
+    except (IndexError, ValueError, struct.error):
+        return None
+
+    response = bool(flags & 0x8000)
+    rcode = flags & 0x0F
+    addresses = ()
+    if response and rcode == 0 and answer_count:
+        addresses = _read_addresses(payload, offset + _question.size, answer_count)
+    return DnsMessage(message_id, response, rcode, name, qtype, answer_count, addresses)
+
+
+def _read_addresses(payload, offset, answer_count):
+    """Collect (address, ttl) from the A/AAAA records of an answer section, stopping at malformed data"""
+    addresses = []
+    try:
+        for _ in range(min(answer_count, MAX_ANSWERS)):
+            _, offset = read_name(payload, offset)
+            rtype, _, ttl, length = _record.unpack_from(payload, offset)
+            offset += _record.size
+            if offset + length > len(payload):
+                break
+            if rtype == 1 and length == 4:
+                addresses.append((IPV4_MAPPED | int.from_bytes(payload[offset:offset + 4], 'big'), ttl))
+            elif rtype == 28 and length == 16:
+                addresses.append((int.from_bytes(payload[offset:offset + 16], 'big'), ttl))
+            offset += length
+    except (IndexError, ValueError, struct.error):
+        pass
+    return tuple(addresses)
+
+
+def parse_dns_tcp(payload):
+    """Parse a DNS over TCP segment that starts with a length-prefixed message"""
+    if len(payload) < 2:
+        return None
+    length = (payload[0] << 8) | payload[1]
+    if len(payload) < 2 + length:
+        return None
+    return parse_dns(payload[2:2 + length])
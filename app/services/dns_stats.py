@@ -0,0 +1,140 @@
+"""Incremental DNS aggregates fed by the DNS dissector
+
+Per interface and hour, the capture threads count queries by type, keep
+Space-Saving sketches of the most queried domains and busiest resolvers,
+and time responses against their queries (matched on client, resolver and
+message id) into a quantile sketch. Reading the last 24 hours merges at
+most 24 slots, however much DNS traffic there was.
+"""
+import time
+from collections import OrderedDict
+from app.models.types import int_to_ip
+from app.services.dns_dissector import NXDOMAIN, DnsMessage
+from app.services.heavy_hitters import SpaceSaving
+from app.services.hourly_slots import (HourlySlots, HourlyStatsRegistry, add_counts, merge_counts, merged_top,
+                                       round_ms, slot_start)
+from app.services.tcp_analyzer import QuantileSketch
+
+
+class DnsSlot:
+    """One hour of an interface's DNS traffic"""
+
+    __slots__ = ('queries', 'query_types', 'responses', 'nxdomain', 'domains', 'resolvers', 'latency')
+
+    def __init__(self, capacity):
+        self.queries = 0
+        self.query_types = {}
+        self.responses = 0
+        self.nxdomain = 0
+        self.domains = SpaceSaving(capacity)
+        self.resolvers = SpaceSaving(capacity)
+        self.latency = QuantileSketch()
+
+
+class DnsAggregator:
+    """DNS aggregates of one interface"""
+
+    def __init__(self, capacity=200, response_timeout=10, max_pending=65536):
+        self.response_timeout_ns = int(response_timeout * 1000000000)
+        self.max_pending = max_pending
+        self.slots = HourlySlots(lambda: DnsSlot(capacity))
+        # (client ip, client port, resolver ip, id) -> query ts_ns, oldest first
+        self.pending = OrderedDict()
+
+    def update(self, records):
+        pending = self.pending
+        for stats, run in self.slots.runs(records):
+            domains = {}
+            resolvers = {}
+            for record in run:
+                message = record.app
+                if not message.response:
+                    stats.queries += 1
+                    type_name = message.type_name
+                    stats.query_types[type_name] = stats.query_types.get(type_name, 0) + 1
+                    domains[message.name] = domains.get(message.name, 0) + 1
+                    resolvers[record.destination_ip] = resolvers.get(record.destination_ip, 0) + 1
+                    key = (record.source_ip, record.source_port, record.destination_ip, message.id)
+                    pending[key] = record.ts_ns
+                    pending.move_to_end(key)
+                    if len(pending) > self.max_pending:
+                        pending.popitem(last=False)
+                else:
+                    stats.responses += 1
+                    if message.rcode == NXDOMAIN:
+                        stats.nxdomain += 1
+                    sent_ns = pending.pop(
+                        (record.destination_ip, record.destination_port, record.source_ip, message.id), None
+                    )
+                    if sent_ns is not None and record.ts_ns >= sent_ns:
+                        stats.latency.add((record.ts_ns - sent_ns) / 1000000)
+            add_counts(stats.domains, domains)
+            add_counts(stats.resolvers, resolvers)
+
+        # Unanswered queries
+        if pending:
+            cutoff = time.time_ns() - self.response_timeout_ns
+            while pending and next(iter(pending.values())) < cutoff:
+                pending.popitem(last=False)
+
+
+class DnsStatsRegistry(HourlyStatsRegistry):
+    """Per-interface DNS aggregates, updated with the records the captures deliver"""
+
+    def __init__(self):
+        super().__init__(lambda config: DnsAggregator(
+            capacity=config['DNS_SKETCH_CAPACITY'],
+            response_timeout=config['DNS_RESPONSE_TIMEOUT']
+        ))
+
+    def update(self, interface_id, records):
+        """Add delivered records carrying a parsed DNS message"""
+        messages = [record for record in records if isinstance(record.app, DnsMessage)]
+        if not messages:
+            return
+        with self.lock:
+            self.aggregator(interface_id).update(messages)
+
+    def summary(self, interface_ids=None, limit=10):
+        """Get DNS totals, rates and top lists over the last 24 hours"""
+        with self.lock:
+            slots = self.window(interface_ids)
+            every = [stats for group in slots.values() for stats in group]
+
+            query_types = merge_counts(stats.query_types for stats in every)
+            domains = merged_top([stats.domains for stats in every], limit)
+            resolvers = merged_top([stats.resolvers for stats in every], limit)
+            latency = QuantileSketch.merge([stats.latency for stats in every]) if every else QuantileSketch()
+            queries = sum(stats.queries for stats in every)
+            responses = sum(stats.responses for stats in every)
+            nxdomain = sum(stats.nxdomain for stats in every)
+            volume = [
+                {'timestamp': slot_start(slot), 'value': sum(stats.queries for stats in slots[slot])}
+                for slot in sorted(slots)
+            ]
+
+        return {
+            'total_queries': queries,
+            'total_responses': responses,
+            'query_types': dict(sorted(query_types.items(), key=lambda item: item[1], reverse=True)),
+            'top_domains': [
+                {'domain': name, 'queries': count, 'error': error}
+                for name, count, error, _ in domains
+            ],
+            'dns_servers': [
+                {'server': int_to_ip(address), 'queries': count, 'error': error}
+                for address, count, error, _ in resolvers
+            ],
+            'nxdomain': nxdomain,
+            'nxdomain_rate': round(nxdomain / responses, 4) if responses else 0,
+            'latency_ms': {
+                'p50': round_ms(latency.quantile(0.5)),
+                'p90': round_ms(latency.quantile(0.9)),
+                'p99': round_ms(latency.quantile(0.99)),
+                'samples': latency.count
+            },
+            'query_volume': volume
+        }
+
+
+dns_stats = DnsStatsRegistry()
@@ -0,0 +1,34 @@
+import threading
+from app import db
+from app.models.flow import Flow
+from app.services.flow_table import flow_tables
+
+
+class FlowWriter:
+    """Queues flows exported by the flow tables and persists them with bulk Core inserts"""
+
+    def __init__(self):
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flows_written = 0
+
+    def add(self, flow):
+        """Flow table exporter: queue a finished flow"""
+        row = flow.row()
+        with self.lock:
+            self.pending.append(row)
+
+    def write(self):
+        """Insert the queued flows; the caller commits"""
+        with self.lock:
+            rows = self.pending
+            self.pending = []
+        if rows:
+            db.session.execute(Flow.__table__.insert(), rows)
+            self.flows_written += len(rows)
+        return len(rows)
+
+
+flow_writer = FlowWriter()
+# Flows finished by the capture flow tables are persisted by the capture threads
+flow_tables.add_exporter(flow_writer.add)
@@ -0,0 +1,424 @@
+"""Bidirectional flow tracking with a passive TCP state machine
+
+Packets are grouped by 5-tuple into flows in both directions. The client is
+the SYN sender, or for flows picked up mid-stream the side with the higher
+port. TCP flows follow the passive state machine used by Linux conntrack:
+SYN_SENT, SYN_RECV, ESTABLISHED, FIN_WAIT, CLOSE_WAIT, LAST_ACK, TIME_WAIT
+and CLOSE.
+
+Flows finish when they close (after a short linger for retransmissions),
+go idle or reach the active timeout; long-lived flows are then exported in
+parts. The table is an LRU of bounded size: when full, the least recently
+active flow is exported early. Finished flows are handed to the table's
+exporters as compact ``FlowRecord`` objects. TCP segments are also passed
+to the table's ``TcpAnalyzer``, which keeps its per-flow state on the flow.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from flask import current_app
+from app.models.types import PROTOCOL_CODES, PROTOCOL_NAMES, TCP_FLAG_BITS, int_to_ip, mask_to_flags, ns_to_datetime
+from app.services.tcp_analyzer import TcpAnalyzer, minute_start, summarize
+
+TCP = PROTOCOL_CODES['TCP']
+
+SYN = TCP_FLAG_BITS['SYN']
+ACK = TCP_FLAG_BITS['ACK']
+FIN = TCP_FLAG_BITS['FIN']
+RST = TCP_FLAG_BITS['RST']
+
+TCP_STATES = ('SYN_SENT', 'SYN_RECV', 'ESTABLISHED', 'FIN_WAIT', 'CLOSE_WAIT', 'LAST_ACK', 'TIME_WAIT', 'CLOSE')
+CLOSED_STATES = ('TIME_WAIT', 'CLOSE')
+
+_NS = 1000000000
+
+
+class FlowRecord:
+    """One direction-aware flow, counted from the client's side"""
+
+    __slots__ = ('interface_id', 'transport', 'protocol', 'client_ip', 'client_port', 'server_ip', 'server_port',
+                 'first_ns', 'last_ns', 'packets_out', 'bytes_out', 'packets_in', 'bytes_in',
+                 'flags', 'state', 'fin_from_client', 'end_reason', 'tcp')
+
+    def __init__(self, record, ts_ns, interface_id=None):
+        self.interface_id = interface_id
+        self.transport = record.transport
+        self.protocol = record.protocol
+        self.client_ip = record.source_ip
+        self.client_port = record.source_port
+        self.server_ip = record.destination_ip
+        self.server_port = record.destination_port
+        self.first_ns = ts_ns
+        self.last_ns = ts_ns
+        self.packets_out = 0
+        self.bytes_out = 0
+        self.packets_in = 0
+        self.bytes_in = 0
+        self.flags = 0
+        self.state = None
+        self.fin_from_client = None
+        self.end_reason = None
+        self.tcp = None
+
+    def row(self):
+        """Get the flows table row; the compact column types accept these values as-is"""
+        return {
+            'interface_id': self.interface_id,
+            'start_time': self.first_ns,
+            'end_time': self.last_ns,
+            'transport': self.transport,
+            'protocol': self.protocol,
+            'client_ip': self.client_ip,
+            'client_port': self.client_port,
+            'server_ip': self.server_ip,
+            'server_port': self.server_port,
+            'packets_out': self.packets_out,
+            'bytes_out': self.bytes_out,
+            'packets_in': self.packets_in,
+            'bytes_in': self.bytes_in,
+            'flags': self.flags,
+            'state': self.state,
+            'end_reason': self.end_reason
+        }
+
+    def to_dict(self):
+        """Get the flow in API form"""
+        return {
+            'interface_id': self.interface_id,
+            'transport': PROTOCOL_NAMES[self.transport],
+            'protocol': PROTOCOL_NAMES[self.protocol],
+            'client_ip': int_to_ip(self.client_ip),
+            'client_port': self.client_port,
+            'server_ip': int_to_ip(self.server_ip),
+            'server_port': self.server_port,
+            'start_time': ns_to_datetime(self.first_ns).isoformat(),
+            'end_time': ns_to_datetime(self.last_ns).isoformat(),
+            'packets_out': self.packets_out,
+            'bytes_out': self.bytes_out,
+            'packets_in': self.packets_in,
+            'bytes_in': self.bytes_in,
+            'flags': mask_to_flags(self.flags),
+            'state': self.state,
+            'end_reason': self.end_reason
+        }
+
+    def __repr__(self):
+        return f'<FlowRecord {self.to_dict()}>'
+
+
+def advance_tcp_state(flow, flags, from_client):
+    """Move a TCP flow through the state machine for one segment; True when a handshake completes"""
+    state = flow.state
+
+    if flags & RST:
+        flow.state = 'CLOSE'
+    elif state is None:
+        # First segment seen: a SYN opens the flow, anything else is picked up mid-stream
+        if flags & SYN:
+            flow.state = 'SYN_RECV' if flags & ACK else 'SYN_SENT'
+        elif flags & FIN:
+            flow.state = 'FIN_WAIT'
+            flow.fin_from_client = from_client
+        else:
+            flow.state = 'ESTABLISHED'
+    elif state == 'SYN_SENT':
+        if flags & SYN and flags & ACK and not from_client:
+            flow.state = 'SYN_RECV'
+    elif state == 'SYN_RECV':
+        if flags & FIN:
+            flow.state = 'FIN_WAIT'
+            flow.fin_from_client = from_client
+        elif flags & ACK and not flags & SYN and from_client:
+            flow.state = 'ESTABLISHED'
+            return True
+    elif state == 'ESTABLISHED':
+        if flags & FIN:
+            flow.state = 'FIN_WAIT'
+            flow.fin_from_client = from_client
+    elif state in ('FIN_WAIT', 'CLOSE_WAIT'):
+        if from_client != flow.fin_from_client:
+            if flags & FIN:
+                flow.state = 'LAST_ACK'
+            elif flags & ACK:
+                flow.state = 'CLOSE_WAIT'
+    elif state == 'LAST_ACK':
+        if flags & ACK and from_client == flow.fin_from_client:
+            flow.state = 'TIME_WAIT'
+    return False
+
+
+class FlowTable:
+    """Flows of one interface, ordered from least to most recently active"""
+
+    def __init__(self, interface_id=None, max_flows=65536, idle_timeout=120, active_timeout=1800, close_linger=5,
+                 analyzer=None):
+        self.interface_id = interface_id
+        self.analyzer = analyzer
+        self.max_flows = max_flows
+        self.idle_timeout_ns = int(idle_timeout * _NS)
+        self.active_timeout_ns = int(active_timeout * _NS)
+        self.close_linger_ns = int(close_linger * _NS)
+        self.flows = OrderedDict()
+        self.closed = set()
+        self.exporters = []
+        self.last_sweep_ns = 0
+        self.last_active_sweep_ns = 0
+        # Completed handshakes per second, for the recent handshake rate
+        self.handshakes = deque()
+
+        self.flows_created = 0
+        self.flows_exported = 0
+        self.flows_evicted = 0
+
+    def update(self, records):
+        """Add delivered packet records to their flows"""
+        flows = self.flows
+        analyzer = self.analyzer
+        now_ns = self.last_sweep_ns
+        for record in records:
+            ts_ns = record.ts_ns
+            if ts_ns > now_ns:
+                now_ns = ts_ns
+            forward = (record.transport, record.source_ip, record.source_port,
+                       record.destination_ip, record.destination_port)
+            flow = flows.get(forward)
+            if flow is not None:
+                from_client = flow.client_ip == record.source_ip and flow.client_port == record.source_port
+                key = forward
+            else:
+                key = (record.transport, record.destination_ip, record.destination_port,
+                       record.source_ip, record.source_port)
+                flow = flows.get(key)
+                if flow is None:
+                    key = forward
+                    flow = self._create(key, record, ts_ns)
+                from_client = flow.client_ip == record.source_ip and flow.client_port == record.source_port
+            flows.move_to_end(key)
+
+            flow.last_ns = ts_ns
+            # A dissector may relabel the flow after its first packets
+            flow.protocol = record.protocol
+            if from_client:
+                flow.packets_out += 1
+                flow.bytes_out += record.length
+            else:
+                flow.packets_in += 1
+                flow.bytes_in += record.length
+
+            if record.transport == TCP:
+                flags = record.flags
+                flow.flags |= flags
+                if analyzer is not None and record.tcp is not None:
+                    analyzer.observe(flow, record, from_client)
+                if advance_tcp_state(flow, flags, from_client):
+                    self._count_handshake(ts_ns)
+                if flow.state in CLOSED_STATES:
+                    self.closed.add(key)
+
+        if now_ns - self.last_sweep_ns >= _NS:
+            self.sweep(now_ns)
+
+    def _create(self, key, record, ts_ns):
+        if len(self.flows) >= self.max_flows:
+            oldest, flow = self.flows.popitem(last=False)
+            self.closed.discard(oldest)
+            self.flows_evicted += 1
+            self._export(flow, 'evicted')
+
+        flow = FlowRecord(record, ts_ns, self.interface_id)
+        if record.transport == TCP and record.flags & SYN:
+            # A SYN/ACK comes from the server
+            swap = bool(record.flags & ACK)
+        else:
+            # Without a SYN, guess the client as the side with the ephemeral (higher) port
+            swap = (record.source_port is not None and record.destination_port is not None
+                    and record.source_port < record.destination_port)
+        if swap:
+            flow.client_ip, flow.server_ip = flow.server_ip, flow.client_ip
+            flow.client_port, flow.server_port = flow.server_port, flow.client_port
+        self.flows[key] = flow
+        self.flows_created += 1
+        return flow
+
+    def _count_handshake(self, ts_ns):
+        second = ts_ns // _NS
+        if self.handshakes and self.handshakes[-1][0] == second:
+            self.handshakes[-1][1] += 1
+        else:
+            self.handshakes.append([second, 1])
+            while self.handshakes and self.handshakes[0][0] <= second - 60:
+                self.handshakes.popleft()
+
+    def sweep(self, now_ns=None):
+        """Export closed, idle and (every few seconds) active-timeout flows"""
+        now_ns = now_ns or time.time_ns()
+        self.last_sweep_ns = now_ns
+        flows = self.flows
+
+        for key in list(self.closed):
+            flow = flows.get(key)
+            if flow is None or flow.state not in CLOSED_STATES:
+                self.closed.discard(key)
+            elif now_ns - flow.last_ns >= self.close_linger_ns:
+                self.closed.discard(key)
+                del flows[key]
+                self._export(flow, 'closed' if flow.state == 'TIME_WAIT' else 'reset')
+
+        # Least recently active first, so idle flows are at the front
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if now_ns - flow.last_ns < self.idle_timeout_ns:
+                break
+            del flows[key]
+            self.closed.discard(key)
+            self._export(flow, 'idle')
+
+        if now_ns - self.last_active_sweep_ns >= 10 * _NS:
+            self.last_active_sweep_ns = now_ns
+            for key, flow in list(flows.items()):
+                if now_ns - flow.first_ns >= self.active_timeout_ns:
+                    self._export_part(key, flow)
+
+    def _export_part(self, key, flow):
+        """Export a long-lived flow's counts so far and keep tracking it from now"""
+        part = FlowRecord.__new__(FlowRecord)
+        for name in FlowRecord.__slots__:
+            setattr(part, name, getattr(flow, name))
+        self._export(part, 'active')
+        flow.first_ns = flow.last_ns
+        flow.packets_out = flow.bytes_out = flow.packets_in = flow.bytes_in = 0
+
+    def _export(self, flow, reason):
+        flow.end_reason = reason
+        self.flows_exported += 1
+        for exporter in self.exporters:
+            try:
+                exporter(flow)
+            except Exception as e:
+                print(f"Error exporting flow: {e}")
+
+    def flush(self):
+        """Export every remaining flow"""
+        while self.flows:
+            key, flow = self.flows.popitem(last=False)
+            self._export(flow, 'flushed')
+        self.closed.clear()
+
+    def state_counts(self):
+        """Get {state: live TCP flows}"""
+        counts = dict.fromkeys(TCP_STATES, 0)
+        for flow in self.flows.values():
+            if flow.state is not None:
+                counts[flow.state] += 1
+        return counts
+
+    def handshake_rate(self, now_ns=None):
+        """Get completed handshakes per second over the last minute"""
+        second = (now_ns or time.time_ns()) // _NS
+        return sum(count for s, count in self.handshakes if s > second - 60) / 60
+
+
+class FlowTableRegistry:
+    """Flow tables per interface, fed by the shared captures"""
+
+    def __init__(self):
+        self.tables = {}
+        self.exporters = []
+        self.recent = deque(maxlen=1000)
+        self.lock = threading.Lock()
+
+    def add_exporter(self, exporter):
+        """Call exporter(flow_record) for every finished flow; adding it again does nothing"""
+        with self.lock:
+            if exporter in self.exporters:
+                return
+            self.exporters.append(exporter)
+            for table in self.tables.values():
+                table.exporters.append(exporter)
+
+    def update(self, interface_id, records):
+        if not records:
+            return
+        with self.lock:
+            table = self.tables.get(interface_id)
+            if table is None:
+                config = current_app.config
+                table = self.tables[interface_id] = FlowTable(
+                    interface_id,
+                    max_flows=config['FLOW_TABLE_MAX_FLOWS'],
+                    idle_timeout=config['FLOW_IDLE_TIMEOUT'],
+                    active_timeout=config['FLOW_ACTIVE_TIMEOUT'],
+                    close_linger=config['FLOW_CLOSE_LINGER'],
+                    analyzer=TcpAnalyzer(config['TCP_ANALYZER_MINUTES'], config['TCP_ANALYZER_ACCURACY'])
+                )
+                table.exporters.append(self.recent.append)
+                table.exporters.extend(self.exporters)
+            table.update(records)
+
+    def flush(self, interface_id):
+        """Export every flow of an interface, e.g. when its capture stops"""
+        with self.lock:
+            table = self.tables.get(interface_id)
+            if table is not None:
+                table.flush()
+
+    def _tables(self, interface_ids):
+        now_ns = time.time_ns()
+        tables = []
+        for interface_id, table in self.tables.items():
+            if interface_ids is None or interface_id in interface_ids:
+                # Expire flows even when their interface has gone quiet
+                table.sweep(now_ns)
+                tables.append(table)
+        return tables
+
+    def state_counts(self, interface_ids=None):
+        """Get {state: live TCP flows} across interfaces"""
+        counts = dict.fromkeys(TCP_STATES, 0)
+        with self.lock:
+            for table in self._tables(interface_ids):
+                for state, count in table.state_counts().items():
+                    counts[state] += count
+        return counts
+
+    def handshake_rate(self, interface_ids=None):
+        with self.lock:
+            return sum(table.handshake_rate() for table in self._tables(interface_ids))
+
+    def _tcp_minutes(self, interface_ids, minutes):
+        now_ns = time.time_ns()
+        windows = {}
+        for interface_id, table in self.tables.items():
+            if (interface_ids is None or interface_id in interface_ids) and table.analyzer is not None:
+                for minute, stats in table.analyzer.window(minutes, now_ns).items():
+                    windows.setdefault(minute, []).append(stats)
+        return windows
+
+    def tcp_performance(self, interface_ids=None, minutes=5):
+        """Get handshake RTT percentiles and loss counters over the last N minutes"""
+        with self.lock:
+            windows = self._tcp_minutes(interface_ids, minutes)
+            return summarize([stats for minute in windows.values() for stats in minute])
+
+    def tcp_series(self, interface_ids=None, minutes=60):
+        """Get [(minute_start, summary)] for minutes with TCP traffic"""
+        with self.lock:
+            windows = self._tcp_minutes(interface_ids, minutes)
+            return [(minute_start(minute), summarize(windows[minute])) for minute in sorted(windows)]
+
+    def stats(self):
+        """Get flow table sizes and counters per interface"""
+        with self.lock:
+            return {
+                interface_id: {
+                    'flows': len(table.flows),
+                    'max_flows': table.max_flows,
+                    'created': table.flows_created,
+                    'exported': table.flows_exported,
+                    'evicted': table.flows_evicted
+                }
+                for interface_id, table in self.tables.items()
+            }
+
+
+flow_tables = FlowTableRegistry()
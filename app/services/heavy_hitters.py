@@ -0,0 +1,224 @@
+"""Streaming top-K (heavy hitter) tracking with Space-Saving sketches
+
+A sketch with capacity k monitors at most k keys in O(k) memory. Every
+reported packet count overestimates the key's true count by at most its
+``error``, and error <= N / k for a stream of N packets, so any key with more
+than N / k packets is guaranteed to be listed. Byte totals only include
+traffic seen while the key was monitored, so they are a lower bound.
+"""
+import heapq
+import threading
+import time
+from flask import current_app
+from app.models.types import int_to_ip
+
+DIMENSIONS = ('source_ip', 'destination_ip', 'destination_port', 'conversation')
+
+# Window name -> (seconds per slot, slots kept)
+WINDOWS = {
+    '1h': (60, 60),
+    '24h': (3600, 24)
+}
+
+
+class SpaceSaving:
+    """Space-Saving sketch over weighted keys"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        # key -> [count, error, bytes]
+        self.counters = {}
+        # (count, key) entries, refreshed lazily when a counter has grown
+        self.heap = []
+
+    def update(self, counts):
+        """Add {key: (packets, bytes)}"""
+        counters = self.counters
+        for key, (packets, length) in counts.items():
+            self.total += packets
+            counter = counters.get(key)
+            if counter is not None:
+                counter[0] += packets
+                counter[2] += length
+            elif len(counters) < self.capacity:
+                counters[key] = [packets, 0, length]
+                heapq.heappush(self.heap, (packets, key))
+            else:
+                # Replace the smallest counter; its count becomes the newcomer's error
+                minimum, evicted = self._pop_minimum()
+                del counters[evicted]
+                counters[key] = [minimum + packets, minimum, length]
+                heapq.heappush(self.heap, (minimum + packets, key))
+
+        if len(self.heap) > 2 * self.capacity:
+            self.heap = [(counter[0], key) for key, counter in counters.items()]
+            heapq.heapify(self.heap)
+
+    def _pop_minimum(self):
+        heap = self.heap
+        while True:
+            count, key = heap[0]
+            counter = self.counters.get(key)
+            if counter is None:
+                heapq.heappop(heap)
+            elif counter[0] != count:
+                heapq.heapreplace(heap, (counter[0], key))
+            else:
+                heapq.heappop(heap)
+                return count, key
+
+    @property
+    def minimum(self):
+        """Count of the smallest monitored key, 0 while the sketch is not full"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def top(self, limit):
+        """Get the [(key, packets, error, bytes)] with the highest counts"""
+        ranked = heapq.nlargest(limit, self.counters.items(), key=lambda item: item[1][0])
+        return [(key, count, error, length) for key, (count, error, length) in ranked]
+
+    @classmethod
+    def merge(cls, sketches, capacity):
+        """Combine sketches of disjoint streams, keeping the error bound
+
+        A key missing from a full sketch may still have up to that sketch's
+        minimum count there, which is added to both its count and error.
+        """
+        merged = cls(capacity)
+        minimums = [sketch.minimum for sketch in sketches]
+        missing_total = sum(minimums)
+        combined = {}
+        for sketch, minimum in zip(sketches, minimums):
+            merged.total += sketch.total
+            for key, (count, error, length) in sketch.counters.items():
+                entry = combined.get(key)
+                if entry is None:
+                    entry = combined[key] = [missing_total, missing_total, 0]
+                entry[0] += count - minimum
+                entry[1] += error - minimum
+                entry[2] += length
+
+        for key, entry in heapq.nlargest(capacity, combined.items(), key=lambda item: item[1][0]):
+            merged.counters[key] = entry
+        merged.heap = [(entry[0], key) for key, entry in merged.counters.items()]
+        heapq.heapify(merged.heap)
+        return merged
+
+
+class WindowedTopK:
+    """Tumbling per-slot sketches covering a sliding window"""
+
+    def __init__(self, slot_seconds, slots, capacity):
+        self.slot_seconds = slot_seconds
+        self.slots = slots
+        self.capacity = capacity
+        self.sketches = {}
+
+    def update(self, counts, now=None):
+        slot = int((now or time.time()) // self.slot_seconds)
+        sketch = self.sketches.get(slot)
+        if sketch is None:
+            sketch = self.sketches[slot] = SpaceSaving(self.capacity)
+            for expired in [s for s in self.sketches if s <= slot - self.slots]:
+                del self.sketches[expired]
+        sketch.update(counts)
+
+    def current(self, now=None):
+        """Get the sketches inside the window"""
+        slot = int((now or time.time()) // self.slot_seconds)
+        return [sketch for s, sketch in self.sketches.items() if s > slot - self.slots]
+
+
+class HeavyHitterRegistry:
+    """Per-interface top-K sketches for every dimension and window
+
+    Capture threads update it with the records they deliver and the
+    dashboard and reports read it; reads cost O(slots * capacity) no matter
+    how much traffic has been seen.
+    """
+
+    def __init__(self):
+        self.trackers = {}
+        self.lock = threading.Lock()
+
+    def update(self, interface_id, records):
+        """Count delivered records for an interface"""
+        if not records:
+            return
+
+        counts = {dimension: {} for dimension in DIMENSIONS}
+        sources = counts['source_ip']
+        destinations = counts['destination_ip']
+        ports = counts['destination_port']
+        conversations = counts['conversation']
+        for record in records:
+            length = record.length
+            for table, key in (
+                (sources, record.source_ip),
+                (destinations, record.destination_ip),
+                (ports, record.destination_port),
+                (conversations, (record.source_ip, record.destination_ip)
+                 if record.source_ip <= record.destination_ip
+                 else (record.destination_ip, record.source_ip))
+            ):
+                if key is None:
+                    continue
+                entry = table.get(key)
+                if entry is None:
+                    table[key] = (1, length)
+                else:
+                    table[key] = (entry[0] + 1, entry[1] + length)
+
+        now = time.time()
+        with self.lock:
+            tracker = self.trackers.get(interface_id)
+            if tracker is None:
+                capacity = current_app.config['HEAVY_HITTER_CAPACITY']
+                tracker = self.trackers[interface_id] = {
+                    (dimension, window): WindowedTopK(slot_seconds, slots, capacity)
+                    for dimension in DIMENSIONS
+                    for window, (slot_seconds, slots) in WINDOWS.items()
+                }
+            for (dimension, window), topk in tracker.items():
+                topk.update(counts[dimension], now)
+
+    def top(self, dimension, window='24h', limit=10, interface_ids=None):
+        """Get the top keys as [{'key', 'packets', 'bytes', 'error'}], or [] before any traffic"""
+        if dimension not in DIMENSIONS or window not in WINDOWS:
+            raise ValueError(f'Unknown top-K dimension or window: {dimension}, {window}')
+
+        with self.lock:
+            sketches = []
+            capacity = None
+            for interface_id, tracker in self.trackers.items():
+                if interface_ids is None or interface_id in interface_ids:
+                    topk = tracker[(dimension, window)]
+                    capacity = topk.capacity
+                    sketches.extend(topk.current())
+            if not sketches:
+                return []
+            merged = SpaceSaving.merge(sketches, capacity)
+
+        return [
+            {
+                'key': _format_key(dimension, key),
+                'packets': count,
+                'bytes': length,
+                'error': error
+            }
+            for key, count, error, length in merged.top(limit)
+        ]
+
+
+def _format_key(dimension, key):
+    if dimension == 'destination_port':
+        return key
+    if dimension == 'conversation':
+        return f'{int_to_ip(key[0])} <-> {int_to_ip(key[1])}'
+    return int_to_ip(key)
+
+
+heavy_hitters = HeavyHitterRegistry()
@@ -0,0 +1,17 @@
+"""Validation of host names taken from captured traffic
+
+DNS names, DHCP client names and TLS server names are chosen by whoever
+sent the packet. Jinja escapes them on the analysis pages, but the
+dashboard widgets build HTML strings in JavaScript and assign them to
+``innerHTML`` (renderTopTalkers and renderGenericData in
+dashboard/view.html), so anything but a plain dotted hostname is dropped
+before it is learned or counted.
+"""
+import re
+
+_HOSTNAME = re.compile(r'^[a-z0-9_-]+(\.[a-z0-9_-]+)*$')
+
+
+def is_plain_hostname(name):
+    """Check that name is a lowercase dotted hostname of letters, digits, '-' and '_'"""
+    return bool(name) and _HOSTNAME.match(name) is not None
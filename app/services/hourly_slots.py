@@ -0,0 +1,115 @@
+"""Hourly slots shared by the incremental protocol aggregates
+
+Each interface keeps one aggregate object per hour for the last SLOTS
+hours: ``HourlySlots`` creates them from a factory as records arrive and
+expires the oldest. ``HourlyStatsRegistry`` holds one aggregator per
+interface behind a lock and merges their slots for a summary, so reading
+24 hours costs at most 24 slots per interface, however much traffic there
+was.
+"""
+import threading
+import time
+from flask import current_app
+from app.models.types import ns_to_datetime
+from app.services.heavy_hitters import SpaceSaving
+
+SLOT_SECONDS = 3600
+SLOTS = 24
+
+_NS = 1000000000
+
+
+class HourlySlots:
+    """{hour: aggregate} of one interface, created by factory() on first use"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.slots = {}
+
+    def get(self, ts_ns):
+        """Get the aggregate of the hour ts_ns falls in, dropping hours older than SLOTS"""
+        slot = ts_ns // _NS // SLOT_SECONDS
+        stats = self.slots.get(slot)
+        if stats is None:
+            stats = self.slots[slot] = self.factory()
+            for expired in [s for s in self.slots if s <= slot - SLOTS]:
+                del self.slots[expired]
+        return stats
+
+    def runs(self, records):
+        """Yield (aggregate, records) for each run of consecutive records in the same hour"""
+        run = []
+        current = None
+        for record in records:
+            slot = record.ts_ns // _NS // SLOT_SECONDS
+            if slot != current and run:
+                yield self.get(run[0].ts_ns), run
+                run = []
+            current = slot
+            run.append(record)
+        if run:
+            yield self.get(run[0].ts_ns), run
+
+    def window(self, now=None):
+        """Get {slot: aggregate} inside the last SLOTS hours"""
+        current = int((now or time.time()) // SLOT_SECONDS)
+        return {slot: stats for slot, stats in self.slots.items() if slot > current - SLOTS}
+
+
+class HourlyStatsRegistry:
+    """Per-interface aggregators, each with its HourlySlots as ``slots``
+
+    factory(config) builds an interface's aggregator from the app config the
+    first time the interface is seen. Callers hold ``lock`` around
+    ``aggregator`` and ``window``.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.aggregators = {}
+        self.lock = threading.Lock()
+
+    def aggregator(self, interface_id):
+        aggregator = self.aggregators.get(interface_id)
+        if aggregator is None:
+            aggregator = self.aggregators[interface_id] = self.factory(current_app.config)
+        return aggregator
+
+    def window(self, interface_ids=None):
+        """Get {slot: [aggregate per interface]} inside the last SLOTS hours"""
+        slots = {}
+        for interface_id, aggregator in self.aggregators.items():
+            if interface_ids is None or interface_id in interface_ids:
+                for slot, stats in aggregator.slots.window().items():
+                    slots.setdefault(slot, []).append(stats)
+        return slots
+
+
+def slot_start(slot):
+    """Get the ISO timestamp an hourly slot starts at"""
+    return ns_to_datetime(slot * SLOT_SECONDS * _NS).isoformat()
+
+
+def add_counts(sketch, counts):
+    """Add {key: count} to a Space-Saving sketch"""
+    sketch.update({key: (count, 0) for key, count in counts.items()})
+
+
+def merge_counts(counts):
+    """Sum an iterable of {key: count} dicts"""
+    total = {}
+    for entry in counts:
+        for key, count in entry.items():
+            total[key] = total.get(key, 0) + count
+    return total
+
+
+def merged_top(sketches, limit):
+    """Get the top (key, count, error, bytes) of the merged Space-Saving sketches"""
+    if not sketches:
+        return []
+    return SpaceSaving.merge(sketches, sketches[0].capacity).top(limit)
+
+
+def round_ms(value):
+    return None if value is None else round(value, 3)
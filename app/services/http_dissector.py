@@ -0,0 +1,228 @@
+"""HTTP/1.x message head parsing with bounded per-flow reassembly
+
+Each direction of a connection on an HTTP port is followed by sequence
+number. Bytes are buffered only while a message head is incomplete, up to
+MAX_HEADER_BYTES; bodies are skipped by Content-Length. After a chunked or
+close-delimited body, a lost segment or an oversized head, the stream
+resynchronises on the next segment that starts with a request or status
+line. At most MAX_STREAMS directions are followed, least recently active
+evicted first, so memory stays bounded whatever the traffic.
+
+Responses are matched to their connection's oldest unanswered request to
+time them and to know when a response has no body (HEAD).
+"""
+from collections import OrderedDict, deque
+from app.models.types import TCP_FLAG_BITS
+
+MAX_HEADER_BYTES = 8192
+MAX_STREAMS = 4096
+MAX_PENDING_REQUESTS = 16
+
+METHODS = ('GET', 'POST', 'PUT', 'DELETE', 'HEAD', 'OPTIONS', 'PATCH', 'CONNECT', 'TRACE')
+
+# Header name -> HttpMessage attribute
+HEADERS = {
+    b'host': 'host',
+    b'user-agent': 'user_agent',
+    b'content-type': 'content_type',
+    b'server': 'server'
+}
+
+FIN = TCP_FLAG_BITS['FIN']
+RST = TCP_FLAG_BITS['RST']
+
+_STARTS = tuple(method.encode() + b' ' for method in METHODS) + (b'HTTP/1.',)
+_HEADER_VALUE_LENGTH = 256
+
+
+class HttpMessage:
+    """Request or status line and selected headers of one HTTP message"""
+
+    __slots__ = ('request', 'method', 'uri', 'version', 'status', 'host', 'user_agent', 'content_type',
+                 'server', 'latency_ms')
+
+    def __init__(self, request, method=None, uri=None, version=None, status=None, host=None, user_agent=None,
+                 content_type=None, server=None, latency_ms=None):
+        self.request = request
+        self.method = method
+        self.uri = uri
+        self.version = version
+        self.status = status
+        self.host = host
+        self.user_agent = user_agent
+        self.content_type = content_type
+        self.server = server
+        self.latency_ms = latency_ms
+
+    def __reduce__(self):
+        return (HttpMessage, (self.request, self.method, self.uri, self.version, self.status, self.host,
+                              self.user_agent, self.content_type, self.server, self.latency_ms))
+
+    def __repr__(self):
+        if self.request:
+            return f'<HttpMessage {self.method} {self.uri} {self.version}>'
+        return f'<HttpMessage {self.version} {self.status}>'
+
+
+def parse_head(head):
+    """Parse a message head (without the blank line), returning (HttpMessage, content_length, chunked) or None"""
+    lines = head.split(b'\r\n')
+    parts = lines[0].decode('latin-1').split(' ', 2)
+    if parts[0].startswith('HTTP/1.'):
+        if len(parts) < 2 or not parts[1].isdigit():
+            return None
+        message = HttpMessage(False, version=parts[0], status=int(parts[1]))
+    elif len(parts) == 3 and parts[0] in METHODS and parts[2].startswith('HTTP/1.'):
+        message = HttpMessage(True, method=parts[0], uri=parts[1][:_HEADER_VALUE_LENGTH], version=parts[2])
+    else:
+        return None
+
+    content_length = None
+    chunked = False
+    for line in lines[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        attribute = HEADERS.get(name)
+        if attribute is not None:
+            setattr(message, attribute, value.strip().decode('latin-1')[:_HEADER_VALUE_LENGTH])
+        elif name == b'content-length':
+            try:
+                content_length = int(value.strip())
+            except ValueError:
+                return None
+        elif name == b'transfer-encoding' and b'chunked' in value.lower():
+            chunked = True
+    return message, content_length, chunked
+
+
+class HttpStream:
+    """Reassembly state of one direction of a connection"""
+
+    __slots__ = ('next_seq', 'buffer', 'skip', 'pending')
+
+    def __init__(self, next_seq):
+        self.next_seq = next_seq
+        # Bytes of an incomplete message head, or None between messages
+        self.buffer = None
+        # Body bytes still to skip; None when the body length is unknown
+        self.skip = 0
+        # (ts_ns, method) of requests awaiting a response
+        self.pending = deque(maxlen=MAX_PENDING_REQUESTS)
+
+
+class HttpStreams:
+    """Per-direction HTTP reassembly for one capture tap"""
+
+    def __init__(self, max_streams=MAX_STREAMS, max_header_bytes=MAX_HEADER_BYTES):
+        self.max_streams = max_streams
+        self.max_header_bytes = max_header_bytes
+        self.streams = OrderedDict()
+
+    def feed(self, source_ip, source_port, destination_ip, destination_port, seq, flags, payload, length, ts_ns):
+        """Add one TCP segment, returning the first HttpMessage whose head it completes, or None
+
+        length is the segment's payload length from the IP header; payload may
+        be shorter when the capture truncated the frame.
+        """
+        key = (source_ip, source_port, destination_ip, destination_port)
+        streams = self.streams
+        stream = streams.get(key)
+
+        if flags & RST:
+            streams.pop(key, None)
+            streams.pop((destination_ip, destination_port, source_ip, source_port), None)
+            return None
+        if not length:
+            if flags & FIN:
+                streams.pop(key, None)
+            return None
+
+        if stream is None:
+            if not bytes(payload[:8]).startswith(_STARTS):
+                return None
+            stream = streams[key] = HttpStream(seq)
+            if len(streams) > self.max_streams:
+                streams.popitem(last=False)
+        else:
+            streams.move_to_end(key)
+
+        gap = ((seq - stream.next_seq + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        if gap < 0:
+            # Retransmitted or duplicate bytes
+            if gap + length <= 0:
+                return None
+            payload = payload[-gap:]
+            seq = stream.next_seq
+            length += gap
+        elif gap > 0:
+            # Lost data: wait for the next message start
+            stream.buffer = None
+            stream.skip = None
+        stream.next_seq = (seq + length) & 0xFFFFFFFF
+        if len(payload) < length:
+            stream.buffer = None
+            stream.skip = None
+            return None
+
+        message = self._consume(key, stream, payload, ts_ns)
+        if flags & FIN:
+            streams.pop(key, None)
+        return message
+
+    def _consume(self, key, stream, data, ts_ns):
+        first = None
+        while data:
+            if stream.buffer is None:
+                if stream.skip:
+                    skipped = min(stream.skip, len(data))
+                    stream.skip -= skipped
+                    data = data[skipped:]
+                    continue
+                if not bytes(data[:8]).startswith(_STARTS):
+                    stream.skip = None
+                    return first
+                stream.buffer = bytearray()
+
+            stream.buffer += data
+            end = stream.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(stream.buffer) > self.max_header_bytes:
+                    stream.buffer = None
+                    stream.skip = None
+                return first
+
+            head = bytes(stream.buffer[:end])
+            data = bytes(stream.buffer[end + 4:])
+            stream.buffer = None
+            parsed = parse_head(head) if end <= self.max_header_bytes else None
+            if parsed is None:
+                stream.skip = None
+                return first
+
+            message, content_length, chunked = parsed
+            stream.skip = self._body_length(key, stream, message, content_length, chunked, ts_ns)
+            if first is None:
+                first = message
+        return first
+
+    def _body_length(self, key, stream, message, content_length, chunked, ts_ns):
+        """Record the message against its connection and get its body length, None if unknown"""
+        if message.request:
+            stream.pending.append((ts_ns, message.method))
+            if chunked:
+                return None
+            return content_length or 0
+
+        # Interim responses precede the real one
+        if message.status < 200:
+            return 0
+        method = None
+        request_stream = self.streams.get((key[2], key[3], key[0], key[1]))
+        if request_stream is not None and request_stream.pending:
+            sent_ns, method = request_stream.pending.popleft()
+            message.latency_ms = (ts_ns - sent_ns) / 1000000
+        if method == 'HEAD' or message.status in (204, 304):
+            return 0
+        if chunked:
+            return None
+        return content_length
@@ -0,0 +1,119 @@
+"""Incremental HTTP aggregates fed by the HTTP dissector
+
+Per interface and hour, the capture threads count requests by method and
+responses by status code, keep Space-Saving sketches of the most requested
+hosts and the most common user agents, and add each response's latency
+(timed by the dissector against its request) to a quantile sketch. Reading
+the last 24 hours merges at most 24 slots, however much HTTP traffic
+there was.
+"""
+from app.services.heavy_hitters import SpaceSaving
+from app.services.hourly_slots import (HourlySlots, HourlyStatsRegistry, add_counts, merge_counts, merged_top,
+                                       round_ms, slot_start)
+from app.services.http_dissector import HttpMessage
+from app.services.tcp_analyzer import QuantileSketch
+
+
+class HttpSlot:
+    """One hour of an interface's HTTP traffic"""
+
+    __slots__ = ('requests', 'methods', 'responses', 'status_codes', 'hosts', 'user_agents', 'latency')
+
+    def __init__(self, capacity):
+        self.requests = 0
+        self.methods = {}
+        self.responses = 0
+        self.status_codes = {}
+        self.hosts = SpaceSaving(capacity)
+        self.user_agents = SpaceSaving(capacity)
+        self.latency = QuantileSketch()
+
+
+class HttpAggregator:
+    """HTTP aggregates of one interface"""
+
+    def __init__(self, capacity=200):
+        self.slots = HourlySlots(lambda: HttpSlot(capacity))
+
+    def update(self, records):
+        for stats, run in self.slots.runs(records):
+            hosts = {}
+            user_agents = {}
+            for record in run:
+                message = record.app
+                if message.request:
+                    stats.requests += 1
+                    stats.methods[message.method] = stats.methods.get(message.method, 0) + 1
+                    if message.host:
+                        host = message.host.lower()
+                        hosts[host] = hosts.get(host, 0) + 1
+                    if message.user_agent:
+                        user_agents[message.user_agent] = user_agents.get(message.user_agent, 0) + 1
+                else:
+                    stats.responses += 1
+                    stats.status_codes[message.status] = stats.status_codes.get(message.status, 0) + 1
+                    if message.latency_ms is not None and message.latency_ms >= 0:
+                        stats.latency.add(message.latency_ms)
+            add_counts(stats.hosts, hosts)
+            add_counts(stats.user_agents, user_agents)
+
+
+class HttpStatsRegistry(HourlyStatsRegistry):
+    """Per-interface HTTP aggregates, updated with the records the captures deliver"""
+
+    def __init__(self):
+        super().__init__(lambda config: HttpAggregator(capacity=config['HTTP_SKETCH_CAPACITY']))
+
+    def update(self, interface_id, records):
+        """Add delivered records carrying a parsed HTTP message"""
+        messages = [record for record in records if isinstance(record.app, HttpMessage)]
+        if not messages:
+            return
+        with self.lock:
+            self.aggregator(interface_id).update(messages)
+
+    def summary(self, interface_ids=None, limit=10):
+        """Get HTTP totals, rates and top lists over the last 24 hours"""
+        with self.lock:
+            slots = self.window(interface_ids)
+            every = [stats for group in slots.values() for stats in group]
+
+            methods = merge_counts(stats.methods for stats in every)
+            status_codes = merge_counts(stats.status_codes for stats in every)
+            hosts = merged_top([stats.hosts for stats in every], limit)
+            user_agents = merged_top([stats.user_agents for stats in every], limit)
+            latency = QuantileSketch.merge([stats.latency for stats in every]) if every else QuantileSketch()
+            requests = sum(stats.requests for stats in every)
+            responses = sum(stats.responses for stats in every)
+            volume = [
+                {'timestamp': slot_start(slot), 'value': sum(stats.requests for stats in slots[slot])}
+                for slot in sorted(slots)
+            ]
+
+        errors = sum(count for status, count in status_codes.items() if status >= 400)
+        return {
+            'total_requests': requests,
+            'total_responses': responses,
+            'methods': dict(sorted(methods.items(), key=lambda item: item[1], reverse=True)),
+            'status_codes': {str(status): count for status, count in sorted(status_codes.items())},
+            'errors': errors,
+            'success_rate': round((responses - errors) / responses, 4) if responses else 0,
+            'top_hosts': [
+                {'host': host, 'requests': count, 'error': error}
+                for host, count, error, _ in hosts
+            ],
+            'user_agents': [
+                {'agent': agent, 'count': count, 'error': error}
+                for agent, count, error, _ in user_agents
+            ],
+            'latency_ms': {
+                'p50': round_ms(latency.quantile(0.5)),
+                'p90': round_ms(latency.quantile(0.9)),
+                'p99': round_ms(latency.quantile(0.99)),
+                'samples': latency.count
+            },
+            'request_volume': volume
+        }
+
+
+http_stats = HttpStatsRegistry()
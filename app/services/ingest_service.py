@@ -0,0 +1,100 @@
+import time
+from app import db
+from app.models.capture_session import CaptureSession
+from app.models.packet import Packet
+from app.models.rollup import SessionRollup
+from app.services.rollup_service import RollupAccumulator, write_rollups
+
+
+class PacketBatchWriter:
+    """Batches decoded packets and persists them with bulk Core inserts
+
+    Each batch also updates the session's traffic rollups in the same
+    transaction, so the buckets never disagree with the stored packets.
+    """
+
+    def __init__(self, session_id, batch_size=1000, flush_interval=1.0, store=None):
+        self.session_id = session_id
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.batches_written = 0
+        self.write_seconds = 0.0
+        self.last_batch_rows_per_sec = 0.0
+
+    def add(self, records):
+        """Queue decoded packet records, flushing every full batch"""
+        self.pending.extend(records)
+        while len(self.pending) >= self.batch_size:
+            batch = self.pending[:self.batch_size]
+            del self.pending[:self.batch_size]
+            self._write(batch)
+
+    def due(self):
+        """Check whether the flush interval has elapsed"""
+        return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def flush(self):
+        """Write everything pending"""
+        batch = self.pending
+        self.pending = []
+        self._write(batch)
+
+    def _write(self, batch):
+        started = time.monotonic()
+        self.last_flush = started
+        if not batch:
+            db.session.commit()
+            return
+
+        rows = [record.row(self.session_id) for record in batch]
+        batch_bytes = sum(row['length'] for row in rows)
+        rollups = RollupAccumulator()
+        rollups.add(batch)
+
+        try:
+            db.session.execute(Packet.__table__.insert(), rows)
+            sessions = CaptureSession.__table__
+            db.session.execute(
+                sessions.update()
+                .where(sessions.c.id == self.session_id)
+                .values(
+                    packet_count=sessions.c.packet_count + len(rows),
+                    bytes_captured=sessions.c.bytes_captured + batch_bytes
+                )
+            )
+            write_rollups(SessionRollup, self.session_id, rollups.drain())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if self.store is not None:
+            try:
+                self.store.append(self.session_id, batch)
+            except OSError as e:
+                print(f"Error writing packet segments for session {self.session_id}: {e}")
+
+        elapsed = time.monotonic() - started
+        self.rows_written += len(rows)
+        self.bytes_written += batch_bytes
+        self.batches_written += 1
+        self.write_seconds += elapsed
+        self.last_batch_rows_per_sec = len(rows) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        """Get writer throughput statistics"""
+        return {
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'pending': len(self.pending),
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'rows_per_sec': round(self.rows_written / self.write_seconds, 1) if self.write_seconds else 0.0,
+            'last_batch_rows_per_sec': round(self.last_batch_rows_per_sec, 1)
+        }
@@ -0,0 +1,125 @@
+"""SMTP, submission, POP3 and IMAP session classification
+
+A connection on a mail port is classified from its first payload only:
+the server greeting on plaintext ports, or a TLS hello from the client on
+implicit-TLS ports. Plaintext sessions are then watched for at most
+MAX_COMMANDS client segments, to catch a STARTTLS (STLS for POP3) upgrade
+confirmed by the client's TLS hello. After that the connection is marked
+finished and later segments cost one dict lookup.
+"""
+from collections import OrderedDict
+from app.models.types import TCP_FLAG_BITS
+
+MAX_STREAMS = 4096
+MAX_COMMANDS = 8
+
+# Server port -> (protocol, implicit TLS)
+MAIL_PORTS = {
+    25: ('SMTP', False),
+    587: ('Submission', False),
+    465: ('Submission', True),
+    110: ('POP3', False),
+    995: ('POP3', True),
+    143: ('IMAP', False),
+    993: ('IMAP', True)
+}
+
+PROTOCOLS = ('SMTP', 'Submission', 'POP3', 'IMAP')
+
+GREETINGS = {
+    'SMTP': (b'220',),
+    'Submission': (b'220',),
+    'POP3': (b'+OK',),
+    'IMAP': (b'* OK', b'* PREAUTH')
+}
+
+STARTTLS_COMMANDS = {
+    'SMTP': b'STARTTLS',
+    'Submission': b'STARTTLS',
+    'POP3': b'STLS',
+    'IMAP': b'STARTTLS'
+}
+
+# MailMessage events
+GREETING = 'greeting'
+TLS = 'tls'
+STARTTLS = 'starttls'
+
+FIN = TCP_FLAG_BITS['FIN']
+RST = TCP_FLAG_BITS['RST']
+
+
+class MailMessage:
+    """A mail session event: a plaintext greeting, an implicit-TLS hello or a STARTTLS upgrade"""
+
+    __slots__ = ('protocol', 'event')
+
+    def __init__(self, protocol, event):
+        self.protocol = protocol
+        self.event = event
+
+    def __reduce__(self):
+        return (MailMessage, (self.protocol, self.event))
+
+    def __repr__(self):
+        return f'<MailMessage {self.protocol} {self.event}>'
+
+
+def _tls_hello(payload):
+    return len(payload) >= 6 and payload[0] == 0x16 and payload[1] == 0x03 and payload[5] == 1
+
+
+class MailStreams:
+    """Mail session state for the connections of one capture tap"""
+
+    def __init__(self, max_streams=MAX_STREAMS, max_commands=MAX_COMMANDS):
+        self.max_streams = max_streams
+        self.max_commands = max_commands
+        # (client ip, client port, server ip, server port) -> [commands left, STARTTLS sent], or False once finished
+        self.streams = OrderedDict()
+
+    def feed(self, source_ip, source_port, destination_ip, destination_port, seq, flags, payload, length, ts_ns):
+        """Add one TCP segment, returning a MailMessage when it classifies or upgrades a session, or None"""
+        from_client = destination_port in MAIL_PORTS
+        if from_client:
+            key = (source_ip, source_port, destination_ip, destination_port)
+        else:
+            key = (destination_ip, destination_port, source_ip, source_port)
+        streams = self.streams
+        state = streams.get(key)
+
+        if flags & (FIN | RST):
+            streams.pop(key, None)
+            return None
+        if state is False or not length:
+            return None
+
+        protocol, implicit_tls = MAIL_PORTS[key[3]]
+        if state is None:
+            message = None
+            if implicit_tls:
+                if from_client and _tls_hello(payload):
+                    message = MailMessage(protocol, TLS)
+            elif not from_client and bytes(payload[:9]).startswith(GREETINGS[protocol]):
+                message = MailMessage(protocol, GREETING)
+            # Only the first payload classifies; plaintext sessions are then watched for STARTTLS
+            streams[key] = [self.max_commands, False] if message is not None and not implicit_tls else False
+            if len(streams) > self.max_streams:
+                streams.popitem(last=False)
+            return message
+
+        streams.move_to_end(key)
+        if not from_client:
+            return None
+        if state[1]:
+            if _tls_hello(payload):
+                streams[key] = False
+                return MailMessage(protocol, STARTTLS)
+            # The server refused and the session went on in plaintext
+            state[1] = False
+        if STARTTLS_COMMANDS[protocol] in bytes(payload[:32]).upper():
+            state[1] = True
+        state[0] -= 1
+        if state[0] <= 0 and not state[1]:
+            streams[key] = False
+        return None
@@ -0,0 +1,112 @@
+"""Incremental mail protocol aggregates
+
+Per interface and hour, sessions classified by the mail dissector are
+counted per protocol (with implicit-TLS sessions and STARTTLS upgrades),
+and a Space-Saving sketch keeps the busiest (protocol, server) pairs.
+Bytes and flows come from the flow tables: finished flows on a mail port
+are added when exported, so no packet is looked at twice.
+"""
+from app.models.types import int_to_ip
+from app.services.flow_table import flow_tables
+from app.services.heavy_hitters import SpaceSaving
+from app.services.hourly_slots import HourlySlots, HourlyStatsRegistry, merged_top
+from app.services.mail_dissector import GREETING, MAIL_PORTS, PROTOCOLS, STARTTLS, TLS, MailMessage
+
+
+class MailSlot:
+    """One hour of an interface's mail traffic"""
+
+    __slots__ = ('sessions', 'tls', 'starttls', 'flows', 'bytes', 'servers')
+
+    def __init__(self, capacity):
+        self.sessions = dict.fromkeys(PROTOCOLS, 0)
+        self.tls = dict.fromkeys(PROTOCOLS, 0)
+        self.starttls = dict.fromkeys(PROTOCOLS, 0)
+        self.flows = dict.fromkeys(PROTOCOLS, 0)
+        self.bytes = dict.fromkeys(PROTOCOLS, 0)
+        self.servers = SpaceSaving(capacity)
+
+
+class MailAggregator:
+    """Mail aggregates of one interface"""
+
+    def __init__(self, capacity=200):
+        self.slots = HourlySlots(lambda: MailSlot(capacity))
+
+    def update(self, records):
+        for stats, run in self.slots.runs(records):
+            for record in run:
+                message = record.app
+                protocol = message.protocol
+                if message.event == STARTTLS:
+                    stats.starttls[protocol] += 1
+                    continue
+                stats.sessions[protocol] += 1
+                if message.event == TLS:
+                    stats.tls[protocol] += 1
+                # Greetings come from the server, TLS hellos from the client
+                server = record.source_ip if message.event == GREETING else record.destination_ip
+                stats.servers.update({(protocol, server): (1, 0)})
+
+    def add_flow(self, flow, protocol):
+        stats = self.slots.get(flow.last_ns)
+        stats.flows[protocol] += 1
+        stats.bytes[protocol] += flow.bytes_out + flow.bytes_in
+
+
+class MailStatsRegistry(HourlyStatsRegistry):
+    """Per-interface mail aggregates, fed by the captures and the flow tables"""
+
+    def __init__(self):
+        super().__init__(lambda config: MailAggregator(capacity=config['MAIL_SKETCH_CAPACITY']))
+
+    def update(self, interface_id, records):
+        """Add delivered records carrying a mail session event"""
+        messages = [record for record in records if isinstance(record.app, MailMessage)]
+        if not messages:
+            return
+        with self.lock:
+            self.aggregator(interface_id).update(messages)
+
+    def add_flow(self, flow):
+        """Flow exporter: count the bytes of finished flows on mail ports"""
+        port = MAIL_PORTS.get(flow.server_port)
+        if port is None:
+            return
+        with self.lock:
+            self.aggregator(flow.interface_id).add_flow(flow, port[0])
+
+    def summary(self, interface_ids=None, limit=10):
+        """Get per-protocol sessions, bytes and top servers over the last 24 hours"""
+        with self.lock:
+            every = [stats for group in self.window(interface_ids).values() for stats in group]
+            details = []
+            for protocol in PROTOCOLS:
+                sessions = sum(stats.sessions[protocol] for stats in every)
+                tls = sum(stats.tls[protocol] for stats in every)
+                starttls = sum(stats.starttls[protocol] for stats in every)
+                details.append({
+                    'protocol': protocol,
+                    'sessions': sessions,
+                    'tls': tls,
+                    'starttls': starttls,
+                    'encrypted_rate': round((tls + starttls) / sessions, 4) if sessions else 0,
+                    'flows': sum(stats.flows[protocol] for stats in every),
+                    'bytes': sum(stats.bytes[protocol] for stats in every)
+                })
+            servers = merged_top([stats.servers for stats in every], limit)
+
+        return {
+            'total': sum(detail['sessions'] for detail in details),
+            'total_bytes': sum(detail['bytes'] for detail in details),
+            'protocols': {detail['protocol']: detail['sessions'] for detail in details},
+            'details': details,
+            'servers': [
+                {'server': int_to_ip(server), 'protocol': protocol, 'sessions': count, 'error': error}
+                for (protocol, server), count, error, _ in servers
+            ]
+        }
+
+
+mail_stats = MailStatsRegistry()
+flow_tables.add_exporter(mail_stats.add_flow)
@@ -0,0 +1,338 @@
+"""Packet capture sources feeding the capture pipeline
+
+Every source exposes the same ``poll(handler, timeout)`` call: it waits up to
+``timeout`` seconds for frames and hands them to ``handler`` as a list of
+``(ts_ns, frame, wire_length)`` tuples, so the decoder and everything after it
+is identical whether traffic is real or simulated.
+
+Sources are opened with the filters of every session attached to them and
+``set_filters`` swaps that set in place, without reopening the capture.
+"""
+import mmap
+import random
+import select
+import socket
+import struct
+import sys
+import time
+from scapy.arch import get_if_list  # noqa: F401  (loads the platform capture sockets)
+from scapy.config import conf
+from app.models.types import PROTOCOL_CODES, ip_to_int
+from app.services.bpf import compile_filters, attach_filter, BPF_RET_K, DEFAULT_SNAPLEN
+from app.services.packet_record import PacketRecord
+
+CAPTURE_SOURCES = ('live', 'ring', 'simulated')
+
+# Linux AF_PACKET socket options (linux/if_packet.h)
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+ETH_P_ALL = 0x0003
+
+_tpacket_stats = struct.Struct('II')
+_tpacket_stats_v3 = struct.Struct('III')
+
+
+def _union_program(filters, snaplen=DEFAULT_SNAPLEN):
+    """Compile the union of the session filters, accepting everything if it is too large"""
+    try:
+        return compile_filters(filters, snaplen)
+    except ValueError:
+        # Sessions are still filtered in userspace by the demultiplexer
+        return [(BPF_RET_K, 0, 0, snaplen)]
+
+
+def _read_kernel_stats(sock, stats, layout=_tpacket_stats):
+    """Accumulate the kernel's packet/drop counters (reading resets them)"""
+    try:
+        values = layout.unpack(sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, layout.size))
+    except OSError:
+        return stats
+    stats['kernel_packets'] = stats.get('kernel_packets', 0) + values[0]
+    stats['kernel_drops'] = stats.get('kernel_drops', 0) + values[1]
+    if len(values) > 2:
+        stats['kernel_freeze_count'] = stats.get('kernel_freeze_count', 0) + values[2]
+    return stats
+
+
+class SimulatedSource:
+    """Synthetic traffic generator that needs no capture privileges"""
+
+    source_ips = [
+        '192.168.1.100', '192.168.1.101', '192.168.1.102', '10.0.0.50',
+        '172.16.0.20', '192.168.0.150', '10.1.1.30'
+    ]
+    dest_ips = [
+        '8.8.8.8', '1.1.1.1', '172.217.14.206', '151.101.1.140',
+        '104.16.132.229', '13.107.21.200', '192.168.1.1'
+    ]
+    # (transport, destination ports) picked with equal weight; the capture tap labels
+    # the frames with application protocols like any live traffic
+    services = [
+        ('TCP', [25, 3306, 5432, 3389]),
+        ('UDP', [123, 161, 5353]),
+        ('ICMP', [None]),
+        ('TCP', [80, 8080]),
+        ('TCP', [443]),
+        ('UDP', [53]),
+        ('TCP', [22]),
+        ('TCP', [21]),
+    ]
+    tcp_flags = [0x02, 0x10, 0x01, 0x18, 0x04, 0x12, 0x18, 0x11]
+
+    _ethernet = b'\x02\x00\x00\x00\x00\x02\x02\x00\x00\x00\x00\x01\x08\x00'
+    _ipv4 = struct.Struct('!BBHHHBBH4s4s')
+    _tcp = struct.Struct('!HHIIBBHHH')
+    _udp = struct.Struct('!HHHH')
+    _icmp = struct.Struct('!BBHI')
+
+    def __init__(self, interface_name, filters=(), packets_per_second=35, batch_size=1024):
+        self.interface_name = interface_name
+        self.packets_per_second = packets_per_second
+        self.batch_size = batch_size
+        self.set_filters(filters)
+
+    def set_filters(self, filters):
+        self.predicates = [f.compile() for f in filters]
+
+    def poll(self, handler, timeout=1.0):
+        """Generate one interval worth of frames"""
+        started = time.monotonic()
+        if self.packets_per_second and self.packets_per_second > 0:
+            expected = self.packets_per_second * timeout
+            count = random.randint(int(expected * 0.6), max(int(expected * 1.4), 1))
+        else:
+            count = self.batch_size
+
+        frames = []
+        for _ in range(count):
+            frame = self._generate_frame()
+            if frame is not None:
+                frames.append(frame)
+
+        if frames:
+            handler(frames)
+
+        if self.packets_per_second and self.packets_per_second > 0:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+        return len(frames)
+
+    def _generate_frame(self):
+        transport, ports = random.choice(self.services)
+        candidate = PacketRecord(
+            0,
+            ip_to_int(random.choice(self.source_ips)),
+            ip_to_int(random.choice(self.dest_ips)),
+            random.randint(1024, 65535) if transport != 'ICMP' else None,
+            random.choice(ports),
+            PROTOCOL_CODES[transport],
+            PROTOCOL_CODES[transport],
+            0
+        )
+        # Stand-in for the kernel filter applied to live sources
+        if not any(predicate(candidate) for predicate in self.predicates):
+            return None
+
+        if transport == 'TCP':
+            l4 = self._tcp.pack(candidate.source_port, candidate.destination_port,
+                                random.getrandbits(32), random.getrandbits(32),
+                                5 << 4, random.choice(self.tcp_flags), 65535, 0, 0)
+            ip_proto = 6
+        elif transport == 'UDP':
+            l4 = self._udp.pack(candidate.source_port, candidate.destination_port, 8, 0)
+            ip_proto = 17
+        else:
+            l4 = self._icmp.pack(8, 0, 0, 0)
+            ip_proto = 1
+
+        wire_length = random.randint(64, 1500)
+        ip = self._ipv4.pack(0x45, 0, wire_length - 14, 0, 0, 64, ip_proto, 0,
+                             (candidate.source_ip & 0xFFFFFFFF).to_bytes(4, 'big'),
+                             (candidate.destination_ip & 0xFFFFFFFF).to_bytes(4, 'big'))
+        return (time.time_ns(), self._ethernet + ip + l4, wire_length)
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class LiveSource:
+    """Capture from a network interface through scapy with a kernel BPF filter"""
+
+    def __init__(self, interface_name, filters=(), snaplen=65535, max_batch=4096):
+        self.interface_name = interface_name
+        self.snaplen = snaplen
+        self.max_batch = max_batch
+        self.kernel_stats = {}
+
+        if sys.platform.startswith('linux'):
+            self.socket = conf.L2listen(iface=interface_name, nofilter=True)
+            self.set_filters(filters)
+            self._drain()
+        else:
+            # libpcap filters cannot be swapped on an open handle, so other
+            # platforms capture everything and rely on userspace filtering
+            self.socket = conf.L2listen(iface=interface_name)
+
+    def set_filters(self, filters):
+        """Replace the kernel filter with the union of the given filters"""
+        if sys.platform.startswith('linux'):
+            attach_filter(self.socket.ins, _union_program(filters))
+
+    def poll(self, handler, timeout=1.0):
+        """Read frames until the timeout expires or a batch fills up"""
+        deadline = time.monotonic() + timeout
+        frames = []
+        while len(frames) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([self.socket], [], [], remaining)
+            if not ready:
+                break
+            _, data, ts = self.socket.recv_raw(self.snaplen)
+            if data is None:
+                continue
+            ts_ns = int(ts * 1e9) if ts else time.time_ns()
+            frames.append((ts_ns, data, len(data)))
+
+        if frames:
+            handler(frames)
+        return len(frames)
+
+    def _drain(self):
+        # Discard anything queued between bind and filter attach
+        while select.select([self.socket], [], [], 0)[0]:
+            self.socket.recv_raw(self.snaplen)
+
+    def stats(self):
+        if sys.platform.startswith('linux'):
+            _read_kernel_stats(self.socket.ins, self.kernel_stats)
+        return dict(self.kernel_stats)
+
+    def close(self):
+        self.socket.close()
+
+
+class RingSource:
+    """AF_PACKET capture through a TPACKET_V3 memory-mapped block ring
+
+    The kernel fills whole blocks of frames and hands them over by flipping
+    the block status, so a busy link costs one poll() per block instead of
+    one recv() per packet. Frames are passed to the handler as memoryviews
+    into the ring and are only valid until the handler returns.
+    """
+
+    block_size = 1 << 20
+    frame_size = 2048
+
+    _block_header = struct.Struct('IIIIIIQ')  # tpacket_block_desc + tpacket_hdr_v1 head
+    _frame_header = struct.Struct('IIIIIIHH')  # tpacket3_hdr head
+
+    def __init__(self, interface_name, filters=(), ring_size_mb=64, block_timeout_ms=100, snaplen=65535):
+        if not sys.platform.startswith('linux'):
+            raise OSError('TPACKET_V3 ring capture requires Linux')
+
+        self.interface_name = interface_name
+        self.block_count = max(int(ring_size_mb * (1 << 20) // self.block_size), 1)
+        self.block_timeout_ms = block_timeout_ms
+        self.snaplen = snaplen
+        self.kernel_stats = {}
+        self.current_block = 0
+
+        # Protocol 0 receives nothing until bind, after the filter is in place
+        self.socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+        try:
+            self.socket.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            request = struct.pack(
+                'IIIIIII',
+                self.block_size,
+                self.block_count,
+                self.frame_size,
+                self.block_size // self.frame_size * self.block_count,
+                block_timeout_ms,
+                0,
+                0
+            )
+            self.socket.setsockopt(SOL_PACKET, PACKET_RX_RING, request)
+            self.ring = mmap.mmap(self.socket.fileno(), self.block_size * self.block_count,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self.set_filters(filters)
+            self.socket.bind((interface_name, ETH_P_ALL))
+        except Exception:
+            self.socket.close()
+            raise
+
+        self.view = memoryview(self.ring)
+        self.poller = select.poll()
+        self.poller.register(self.socket.fileno(), select.POLLIN | select.POLLERR)
+
+    def poll(self, handler, timeout=1.0):
+        """Hand every filled block to the handler until the timeout expires"""
+        deadline = time.monotonic() + timeout
+        count = 0
+        while True:
+            base = self.current_block * self.block_size
+            status = self._block_header.unpack_from(self.ring, base)[2]
+            if status & TP_STATUS_USER:
+                count += self._process_block(base, handler)
+                # Return the block to the kernel
+                struct.pack_into('I', self.ring, base + 8, TP_STATUS_KERNEL)
+                self.current_block = (self.current_block + 1) % self.block_count
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.poller.poll(remaining * 1000)
+        return count
+
+    def set_filters(self, filters):
+        """Replace the kernel filter with the union of the given filters"""
+        attach_filter(self.socket, _union_program(filters, self.snaplen))
+
+    def _process_block(self, base, handler):
+        _, _, _, num_packets, offset, _, _ = self._block_header.unpack_from(self.ring, base)
+        block = self.view[base:base + self.block_size]
+        frames = []
+        try:
+            for _ in range(num_packets):
+                next_offset, sec, nsec, snaplen, wire_length, _, mac, _ = self._frame_header.unpack_from(block, offset)
+                frames.append((sec * 1000000000 + nsec, block[offset + mac:offset + mac + snaplen], wire_length))
+                offset += next_offset
+            if frames:
+                handler(frames)
+        finally:
+            for _, frame, _ in frames:
+                frame.release()
+            block.release()
+        return len(frames)
+
+    def stats(self):
+        return dict(_read_kernel_stats(self.socket, self.kernel_stats, _tpacket_stats_v3))
+
+    def close(self):
+        self.poller.unregister(self.socket.fileno())
+        self.view.release()
+        self.ring.close()
+        self.socket.close()
+
+
+def open_capture_source(kind, interface_name, filters=(), **options):
+    """Open a capture source by name"""
+    if kind == 'live':
+        return LiveSource(interface_name, filters, **options)
+    if kind == 'ring':
+        return RingSource(interface_name, filters, **options)
+    if kind == 'simulated':
+        return SimulatedSource(interface_name, filters, **options)
+    raise ValueError(f'Unknown capture source: {kind}')
@@ -0,0 +1,157 @@
+"""Decoding of raw Ethernet frames into compact packet records"""
+import struct
+from app.models.types import PROTOCOL_CODES, IPV4_MAPPED
+from app.services.dhcp_dissector import parse_dhcp
+from app.services.dns_dissector import parse_dns, parse_dns_tcp
+from app.services.http_dissector import HttpStreams
+from app.services.mail_dissector import MAIL_PORTS, MailStreams
+from app.services.packet_record import PacketRecord
+from app.services.signature_engine import DEFAULT_DEPTH, FlowInspector, SignatureEngine
+from app.services.tls_dissector import TlsStreams
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+
+TRANSPORTS = {6: 'TCP', 17: 'UDP', 1: 'ICMP', 58: 'ICMP'}
+
+TCP = PROTOCOL_CODES['TCP']
+UDP = PROTOCOL_CODES['UDP']
+OTHER = PROTOCOL_CODES['OTHER']
+
+_transport_codes = {number: PROTOCOL_CODES[name] for number, name in TRANSPORTS.items()}
+# (transport, port) -> parser of the application payload; the result is kept as record.app
+DISSECTORS = {
+    (TCP, 53): parse_dns_tcp,
+    (UDP, 53): parse_dns,
+    (UDP, 67): parse_dhcp,
+    (UDP, 68): parse_dhcp
+}
+_dissector_ports = {port for _, port in DISSECTORS}
+# TCP port -> per-flow reassembler class, one instance per capture (see stream_dissectors)
+STREAM_DISSECTORS = {
+    80: HttpStreams,
+    8080: HttpStreams,
+    443: TlsStreams,
+    **{port: MailStreams for port in MAIL_PORTS}
+}
+# Payloads on other ports go to the capture's FlowInspector, when it has signatures; a record holds one
+# application result, so the inspector never scans ports a dissector claims (see signature_engine)
+_claimed_ports = _dissector_ports | set(STREAM_DISSECTORS)
+
+_ports = struct.Struct('!HH')
+_tcp_header = struct.Struct('!IIBBH')  # seq, ack, data offset, flags, window
+
+
+def decode_frame(frame, ts_ns, wire_length=None, streams=None):
+    """Decode an Ethernet frame, returning None for non-IP traffic
+
+    streams is the stream_dissectors() state of the capture the frame came
+    from; without it, TCP payloads needing reassembly are not dissected.
+    The record's protocol is its transport until a ProtocolClassifier
+    labels the batch.
+    """
+    if len(frame) < 14:
+        return None
+
+    ethertype = (frame[12] << 8) | frame[13]
+    offset = 14
+    if ethertype == ETH_P_8021Q and len(frame) >= 18:
+        ethertype = (frame[16] << 8) | frame[17]
+        offset = 18
+
+    if ethertype == ETH_P_IP:
+        if len(frame) < offset + 20:
+            return None
+        header_length = (frame[offset] & 0x0F) * 4
+        payload_length = ((frame[offset + 2] << 8) | frame[offset + 3]) - header_length
+        ip_proto = frame[offset + 9]
+        source_ip = IPV4_MAPPED | int.from_bytes(frame[offset + 12:offset + 16], 'big')
+        destination_ip = IPV4_MAPPED | int.from_bytes(frame[offset + 16:offset + 20], 'big')
+        fragment_offset = ((frame[offset + 6] << 8) | frame[offset + 7]) & 0x1FFF
+        l4 = offset + header_length if fragment_offset == 0 else None
+    elif ethertype == ETH_P_IPV6:
+        if len(frame) < offset + 40:
+            return None
+        ip_proto = frame[offset + 6]
+        payload_length = (frame[offset + 4] << 8) | frame[offset + 5]
+        source_ip = int.from_bytes(frame[offset + 8:offset + 24], 'big')
+        destination_ip = int.from_bytes(frame[offset + 24:offset + 40], 'big')
+        l4 = offset + 40
+    else:
+        return None
+
+    transport = _transport_codes.get(ip_proto, OTHER)
+    source_port = None
+    destination_port = None
+    flags = 0
+    tcp = None
+    app = None
+
+    if l4 is not None and (transport == TCP or transport == UDP) and len(frame) >= l4 + 4:
+        source_port, destination_port = _ports.unpack_from(frame, l4)
+        payload_start = None
+        if transport == UDP:
+            payload_start = l4 + 8
+            payload_length -= 8
+        elif len(frame) >= l4 + 16:
+            seq, ack, data_offset, flags, window = _tcp_header.unpack_from(frame, l4 + 4)
+            flags &= 0x3F
+            payload_start = l4 + (data_offset >> 4) * 4
+            # Lengths come from the IP header, so truncated snaplen captures still count payload
+            payload_length = max(payload_length - (data_offset >> 4) * 4, 0)
+            tcp = (seq, ack, window, payload_length)
+            if streams is not None:
+                dissector = STREAM_DISSECTORS.get(destination_port) or STREAM_DISSECTORS.get(source_port)
+                if dissector is not None:
+                    app = streams[dissector].feed(source_ip, source_port, destination_ip, destination_port, seq,
+                                                  flags, frame[payload_start:payload_start + payload_length],
+                                                  payload_length, ts_ns)
+        elif len(frame) >= l4 + 14:
+            flags = frame[l4 + 13] & 0x3F
+
+        if payload_start is not None and payload_length > 0 \
+                and (destination_port in _dissector_ports or source_port in _dissector_ports):
+            dissector = DISSECTORS.get((transport, destination_port)) or DISSECTORS.get((transport, source_port))
+            if dissector is not None:
+                app = dissector(frame[payload_start:payload_start + payload_length])
+        elif streams is not None and payload_start is not None and payload_length > 0 and FlowInspector in streams \
+                and destination_port not in _claimed_ports and source_port not in _claimed_ports:
+            app = streams[FlowInspector].feed(transport, source_ip, source_port, destination_ip, destination_port,
+                                              frame[payload_start:payload_start + payload_length])
+
+    return PacketRecord(
+        ts_ns,
+        source_ip,
+        destination_ip,
+        source_port,
+        destination_port,
+        transport,
+        transport,
+        wire_length if wire_length is not None else len(frame),
+        flags,
+        tcp,
+        app
+    )
+
+
+def stream_dissectors(signatures=None, inspect_bytes=DEFAULT_DEPTH):
+    """Get fresh per-flow dissector state for one capture, keyed by class
+
+    With signatures, payloads on unclaimed ports are also matched against
+    them by a FlowInspector.
+    """
+    streams = {dissector: dissector() for dissector in set(STREAM_DISSECTORS.values())}
+    if signatures:
+        streams[FlowInspector] = FlowInspector(SignatureEngine(signatures), inspect_bytes)
+    return streams
+
+
+def decode_frames(frames, streams=None):
+    """Decode an iterable of (ts_ns, frame, wire_length) tuples"""
+    records = []
+    for ts_ns, frame, wire_length in frames:
+        record = decode_frame(frame, ts_ns, wire_length, streams)
+        if record is not None:
+            records.append(record)
+    return records
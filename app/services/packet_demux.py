@@ -0,0 +1,66 @@
+from app.services.packet_decoder import decode_frames, stream_dissectors
+from app.services.protocol_classifier import ProtocolClassifier
+from app.services.signature_engine import DEFAULT_DEPTH
+
+
+class PacketDemux:
+    """Routes decoded records to the sessions whose filters match them"""
+
+    def __init__(self):
+        self.routes = []
+
+    def set_filters(self, filters):
+        """Replace the session routes from a {session_id: PacketFilter} mapping"""
+        self.routes = [(session_id, packet_filter.compile(), packet_filter.is_empty)
+                       for session_id, packet_filter in filters.items()]
+
+    def route(self, records):
+        """Split records into {session_id: [records]}"""
+        if not records or not self.routes:
+            return {}
+
+        routed = {}
+        for session_id, predicate, match_all in self.routes:
+            if match_all:
+                routed[session_id] = records
+                continue
+            matched = [record for record in records if predicate(record)]
+            if matched:
+                routed[session_id] = matched
+        return routed
+
+
+class CaptureTap:
+    """Capture source wrapper that decodes each frame once and demultiplexes it
+
+    The kernel filter on the source is kept at the union of the session
+    filters, so frames no session wants are dropped before they are decoded.
+    Each decoded batch is labelled with application protocols before routing.
+    """
+
+    def __init__(self, source, signatures=None, inspect_bytes=DEFAULT_DEPTH):
+        self.source = source
+        self.demux = PacketDemux()
+        self.streams = stream_dissectors(signatures, inspect_bytes)
+        self.classifier = ProtocolClassifier()
+
+    def set_filters(self, filters):
+        """Attach the given {session_id: PacketFilter} mapping without reopening the source"""
+        self.demux.set_filters(filters)
+        self.source.set_filters(list(filters.values()))
+
+    def poll(self, handler, timeout=1.0):
+        """Hand {session_id: [records]} to the handler for each batch of frames"""
+        def route(frames):
+            records = self.classifier.classify(decode_frames(frames, self.streams))
+            routed = self.demux.route(records)
+            if routed:
+                handler(routed)
+
+        return self.source.poll(route, timeout=timeout)
+
+    def stats(self):
+        return self.source.stats()
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,143 @@
+"""Capture filters built from a capture session's IP, port and protocol fields"""
+import ipaddress
+from app.models.types import PROTOCOL_CODES, IPV4_MAPPED
+
+TCP = PROTOCOL_CODES['TCP']
+UDP = PROTOCOL_CODES['UDP']
+
+
+class PacketFilter:
+    """Session capture filter that can be expressed as BPF or evaluated in Python"""
+
+    # Protocol filter -> (transports, ports). An empty port tuple matches any port.
+    PROTOCOLS = {
+        'TCP': (('TCP',), ()),
+        'UDP': (('UDP',), ()),
+        'ICMP': (('ICMP',), ()),
+        'HTTP': (('TCP',), (80, 8080)),
+        'HTTPS': (('TCP',), (443,)),
+        'DNS': (('UDP', 'TCP'), (53,)),
+        'SSH': (('TCP',), (22,)),
+        'FTP': (('TCP',), (20, 21)),
+    }
+
+    def __init__(self, ip=None, port=None, protocol=None):
+        self.network = None
+        self.port = None
+        self.protocol = None
+        self._predicate = None
+
+        if ip:
+            try:
+                self.network = ipaddress.ip_network(str(ip).strip(), strict=False)
+            except ValueError:
+                raise ValueError(f'Invalid IP filter: {ip}')
+
+        if port not in (None, ''):
+            try:
+                self.port = int(port)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid port filter: {port}')
+            if not 0 <= self.port <= 65535:
+                raise ValueError(f'Invalid port filter: {port}')
+
+        if protocol:
+            self.protocol = str(protocol).upper()
+            if self.protocol not in self.PROTOCOLS:
+                raise ValueError(f'Unsupported protocol filter: {protocol}')
+
+    @classmethod
+    def from_session(cls, session):
+        """Build filter from a CaptureSession"""
+        return cls(session.filter_ip, session.filter_port, session.filter_protocol)
+
+    @property
+    def is_empty(self):
+        return self.network is None and self.port is None and self.protocol is None
+
+    @property
+    def ip_versions(self):
+        """IP versions that can match this filter"""
+        if self.network is not None:
+            return (self.network.version,)
+        return (4, 6)
+
+    def expression(self):
+        """Render the filter as a tcpdump/libpcap expression"""
+        clauses = []
+
+        if self.network is not None:
+            if self.network.prefixlen == self.network.max_prefixlen:
+                clauses.append(f'host {self.network.network_address}')
+            else:
+                clauses.append(f'net {self.network}')
+
+        if self.port is not None:
+            clauses.append(f'port {self.port}')
+
+        if self.protocol:
+            transports, ports = self.PROTOCOLS[self.protocol]
+            terms = []
+            for transport in transports:
+                if transport == 'ICMP':
+                    terms.append('icmp or icmp6')
+                elif ports:
+                    terms.extend(f'{transport.lower()} port {p}' for p in ports)
+                else:
+                    terms.append(transport.lower())
+            clauses.append(terms[0] if len(terms) == 1 else f'({" or ".join(terms)})')
+
+        return ' and '.join(clauses)
+
+    def matches(self, record):
+        """Evaluate the filter against a decoded PacketRecord"""
+        if self._predicate is None:
+            self._predicate = self.compile()
+        return self._predicate(record)
+
+    def compile(self):
+        """Build a predicate over PacketRecords, specialised to the fields that are set"""
+        checks = []
+
+        if self.network is not None:
+            low = int(self.network.network_address)
+            high = int(self.network.broadcast_address)
+            if self.network.version == 4:
+                low |= IPV4_MAPPED
+                high |= IPV4_MAPPED
+            if low == high:
+                checks.append(lambda r: r.source_ip == low or r.destination_ip == low)
+            else:
+                checks.append(lambda r: low <= r.source_ip <= high or low <= r.destination_ip <= high)
+
+        if self.port is not None:
+            port = self.port
+            checks.append(lambda r: (r.transport == TCP or r.transport == UDP)
+                          and (r.source_port == port or r.destination_port == port))
+
+        if self.protocol:
+            transports, ports = self.PROTOCOLS[self.protocol]
+            transports = frozenset(PROTOCOL_CODES[t] for t in transports)
+            if ports:
+                ports = frozenset(ports)
+                checks.append(lambda r: r.transport in transports
+                              and (r.source_port in ports or r.destination_port in ports))
+            else:
+                checks.append(lambda r: r.transport in transports)
+
+        if not checks:
+            return lambda r: True
+        if len(checks) == 1:
+            return checks[0]
+        return lambda r: all(check(r) for check in checks)
+
+    def to_dict(self):
+        """Serialise the filter for a capture worker"""
+        return {
+            'ip': str(self.network) if self.network is not None else None,
+            'port': self.port,
+            'protocol': self.protocol
+        }
+
+    def __repr__(self):
+        return f'<PacketFilter {self.expression() or "all"}>'
@@ -0,0 +1,68 @@
+from app.models.types import PROTOCOL_NAMES, int_to_ip, mask_to_flags, ns_to_datetime
+
+
+class PacketRecord:
+    """Decoded packet in compact form
+
+    Addresses are 128-bit integers (IPv4 as ::ffff:a.b.c.d), transport and
+    protocol are codes from ``PROTOCOL_CODES``, flags is the TCP flag bitmask
+    and ts_ns is nanoseconds since the epoch. TCP segments also carry
+    ``tcp`` = (seq, ack, window, payload_length) for the TCP analyzer, and
+    packets on dissected ports carry the parsed application message as
+    ``app``; neither is stored. ``to_dict`` converts to the strings used by
+    the API.
+    """
+
+    __slots__ = ('ts_ns', 'source_ip', 'destination_ip', 'source_port', 'destination_port',
+                 'transport', 'protocol', 'length', 'flags', 'tcp', 'app')
+
+    def __init__(self, ts_ns, source_ip, destination_ip, source_port, destination_port,
+                 transport, protocol, length, flags=0, tcp=None, app=None):
+        self.ts_ns = ts_ns
+        self.source_ip = source_ip
+        self.destination_ip = destination_ip
+        self.source_port = source_port
+        self.destination_port = destination_port
+        self.transport = transport
+        self.protocol = protocol
+        self.length = length
+        self.flags = flags
+        self.tcp = tcp
+        self.app = app
+
+    def __reduce__(self):
+        # Pickle as a plain tuple of fields for the capture worker pipe
+        return (PacketRecord, (self.ts_ns, self.source_ip, self.destination_ip, self.source_port,
+                               self.destination_port, self.transport, self.protocol, self.length, self.flags,
+                               self.tcp, self.app))
+
+    def row(self, session_id):
+        """Get the packets table row; the compact column types accept these values as-is"""
+        return {
+            'session_id': session_id,
+            'timestamp': self.ts_ns,
+            'source_ip': self.source_ip,
+            'destination_ip': self.destination_ip,
+            'source_port': self.source_port,
+            'destination_port': self.destination_port,
+            'protocol': self.protocol,
+            'length': self.length,
+            'flags': self.flags
+        }
+
+    def to_dict(self):
+        """Get the record in API form"""
+        return {
+            'timestamp': ns_to_datetime(self.ts_ns).isoformat(),
+            'source_ip': int_to_ip(self.source_ip),
+            'destination_ip': int_to_ip(self.destination_ip),
+            'source_port': self.source_port,
+            'destination_port': self.destination_port,
+            'transport': PROTOCOL_NAMES[self.transport],
+            'protocol': PROTOCOL_NAMES[self.protocol],
+            'length': self.length,
+            'flags': mask_to_flags(self.flags)
+        }
+
+    def __repr__(self):
+        return f'<PacketRecord {self.to_dict()}>'
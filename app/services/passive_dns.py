@@ -0,0 +1,166 @@
+"""Passive DNS: hostnames for addresses, learned from observed DNS answers
+
+Every A/AAAA answer the DNS dissector sees maps its address to the name
+that was queried, so addresses can be labelled without resolving anything.
+Entries expire with their record's TTL (clamped to a configured range, as
+short CDN TTLs would otherwise drop names that are still accurate), and
+the least recently used entry is evicted when the cache is full. Changes
+are saved to the passive_dns table periodically, and the table is loaded
+when the cache is first used. Addresses with no DNS answer fall back to the
+host name of their DHCP lease.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.passive_dns import PassiveDnsEntry
+from app.models.types import ip_to_int
+from app.services.dhcp_leases import dhcp_leases
+from app.services.dns_dissector import DnsMessage
+from app.services.hostnames import is_plain_hostname
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class PassiveDnsCache:
+    """Bounded address -> hostname map with TTL expiry and LRU eviction"""
+
+    def __init__(self):
+        # address -> [hostname, expires (epoch seconds)], least recently used first
+        self.entries = OrderedDict()
+        self.dirty = set()
+        self.evicted = set()
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.last_save = time.monotonic()
+
+    def _ensure_loaded(self):
+        """Load unexpired entries on first use; needs an app context and the lock"""
+        if self.loaded:
+            return
+        self.loaded = True
+        rows = db.session.query(
+            PassiveDnsEntry.address,
+            PassiveDnsEntry.hostname,
+            PassiveDnsEntry.expires_at
+        ).filter(
+            PassiveDnsEntry.expires_at > datetime.utcnow()
+        ).order_by(PassiveDnsEntry.updated_at.desc()).limit(current_app.config['PASSIVE_DNS_MAX_ENTRIES']).all()
+        # Most recently updated last, as the LRU order expects
+        for address, hostname, expires_at in reversed(rows):
+            self.entries[ip_to_int(address)] = [hostname, (expires_at - _EPOCH).total_seconds()]
+
+    def update(self, records):
+        """Learn the answers of delivered DNS responses"""
+        answers = [
+            record.app for record in records
+            if isinstance(record.app, DnsMessage) and record.app.addresses and is_plain_hostname(record.app.name)
+        ]
+        if not answers:
+            return
+
+        config = current_app.config
+        min_ttl = config['PASSIVE_DNS_MIN_TTL']
+        max_ttl = config['PASSIVE_DNS_MAX_TTL']
+        max_entries = config['PASSIVE_DNS_MAX_ENTRIES']
+        now = time.time()
+        with self.lock:
+            self._ensure_loaded()
+            entries = self.entries
+            for message in answers:
+                for address, ttl in message.addresses:
+                    entries[address] = [message.name, now + min(max(ttl, min_ttl), max_ttl)]
+                    entries.move_to_end(address)
+                    self.dirty.add(address)
+                    self.evicted.discard(address)
+            while len(entries) > max_entries:
+                address, _ = entries.popitem(last=False)
+                self.dirty.discard(address)
+                self.evicted.add(address)
+
+    def lookup(self, address):
+        """Get the hostname for an address (string or integer), or None"""
+        if address is None:
+            return None
+        try:
+            key = address if isinstance(address, int) else ip_to_int(address)
+        except ValueError:
+            return None
+
+        with self.lock:
+            self._ensure_loaded()
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self.entries[key]
+                self.dirty.discard(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry[0]
+        return dhcp_leases.hostname(key)
+
+    def annotate(self, addresses):
+        """Get {address: hostname} for the addresses with a known name"""
+        names = {}
+        for address in set(addresses):
+            hostname = self.lookup(address)
+            if hostname:
+                names[address] = hostname
+        return names
+
+    def save(self, force=False):
+        """Write changed entries and drop evicted and expired ones, at most once per save interval; the caller commits"""
+        interval = current_app.config['PASSIVE_DNS_SAVE_INTERVAL']
+        if not force and time.monotonic() - self.last_save < interval:
+            return 0
+
+        now = datetime.utcnow()
+        with self.lock:
+            # Checked again under the lock so concurrent capture threads save once per interval
+            if not force and time.monotonic() - self.last_save < interval:
+                return 0
+            self.last_save = time.monotonic()
+            rows = [
+                {
+                    'address': address,
+                    'hostname': self.entries[address][0][:255],
+                    'expires_at': datetime.utcfromtimestamp(self.entries[address][1]),
+                    'updated_at': now
+                }
+                for address in self.dirty
+                if address in self.entries
+            ]
+            evicted = list(self.evicted)
+            self.dirty = set()
+            self.evicted = set()
+
+        table = PassiveDnsEntry.__table__
+        if evicted:
+            db.session.execute(table.delete().where(table.c.address.in_(evicted)))
+        db.session.execute(table.delete().where(table.c.expires_at <= now))
+        if not rows:
+            return 0
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            statement = insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=['address'],
+                set_={
+                    'hostname': statement.excluded.hostname,
+                    'expires_at': statement.excluded.expires_at,
+                    'updated_at': statement.excluded.updated_at
+                }
+            )
+            db.session.execute(statement, rows)
+        else:
+            db.session.execute(table.delete().where(table.c.address.in_([row['address'] for row in rows])))
+            db.session.execute(table.insert(), rows)
+        return len(rows)
+
+
+passive_dns = PassiveDnsCache()
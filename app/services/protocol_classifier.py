@@ -0,0 +1,130 @@
+"""Application protocol labels for batches of decoded packets
+
+Each record's ``protocol`` code comes from a lookup table indexed by
+transport and port, built once from PORT_PROTOCOLS: the destination port is
+looked up first, then the source port, and the transport is kept when
+neither is known. Labelling a batch is then one table index per packet.
+
+The dissectors know better than the port numbers. When a record carries an
+application message (HTTP on an odd port found by a payload signature, say)
+its flow is remembered with that label, and every later packet of the flow
+is labelled the same way. Packets seen before the message keep the port
+label.
+"""
+from collections import OrderedDict
+from app.models.types import PROTOCOL_CODES
+from app.services.dhcp_dissector import DhcpMessage
+from app.services.dns_dissector import DnsMessage
+from app.services.http_dissector import HttpMessage
+from app.services.mail_dissector import MailMessage
+from app.services.signature_engine import SignatureMatch
+from app.services.tls_dissector import TlsMessage
+
+MAX_FLOWS = 65536
+
+# Application protocol -> (transports, ports)
+PORT_PROTOCOLS = {
+    'HTTP': (('TCP',), (80, 8080)),
+    'HTTPS': (('TCP', 'UDP'), (443, 8443)),
+    'DNS': (('UDP', 'TCP'), (53,)),
+    'SSH': (('TCP',), (22,)),
+    'FTP': (('TCP',), (20, 21)),
+    'SMTP': (('TCP',), (25, 465, 587)),
+    'POP3': (('TCP',), (110, 995)),
+    'IMAP': (('TCP',), (143, 993)),
+    'DHCP': (('UDP',), (67, 68)),
+}
+
+TCP = PROTOCOL_CODES['TCP']
+UDP = PROTOCOL_CODES['UDP']
+
+# Transport code -> offset of its 65536 entries in the lookup table
+_TABLE_OFFSETS = {TCP: 0, UDP: 65536}
+
+# Application message class -> protocol code; mail and signature matches are labelled by name
+_MESSAGE_CODES = {
+    DnsMessage: PROTOCOL_CODES['DNS'],
+    DhcpMessage: PROTOCOL_CODES['DHCP'],
+    HttpMessage: PROTOCOL_CODES['HTTP'],
+    TlsMessage: PROTOCOL_CODES['HTTPS'],
+}
+_MAIL_CODES = {
+    'SMTP': PROTOCOL_CODES['SMTP'],
+    'Submission': PROTOCOL_CODES['SMTP'],
+    'POP3': PROTOCOL_CODES['POP3'],
+    'IMAP': PROTOCOL_CODES['IMAP'],
+}
+_SIGNATURE_CODES = {'TLS': PROTOCOL_CODES['HTTPS']}
+P2P = PROTOCOL_CODES['P2P']
+
+
+def build_port_table(port_protocols=PORT_PROTOCOLS):
+    """Get the (transport, port) -> protocol code lookup table; 0 means no label"""
+    table = bytearray(len(_TABLE_OFFSETS) * 65536)
+    for name, (transports, ports) in port_protocols.items():
+        code = PROTOCOL_CODES[name]
+        for transport in transports:
+            offset = _TABLE_OFFSETS[PROTOCOL_CODES[transport]]
+            for port in ports:
+                table[offset + port] = code
+    return bytes(table)
+
+
+def message_code(app):
+    """Get the protocol code a dissected application message implies, or None"""
+    code = _MESSAGE_CODES.get(type(app))
+    if code is not None:
+        return code
+    if isinstance(app, MailMessage):
+        return _MAIL_CODES.get(app.protocol)
+    if isinstance(app, SignatureMatch):
+        if app.category == 'p2p':
+            return P2P
+        return _SIGNATURE_CODES.get(app.name) or PROTOCOL_CODES.get(app.name.upper())
+    return None
+
+
+class ProtocolClassifier:
+    """Labels the records of one capture tap, remembering flows relabelled by a dissector
+
+    The flow overrides keep at most MAX_FLOWS flows and forget the oldest
+    first.
+    """
+
+    def __init__(self, port_protocols=PORT_PROTOCOLS, max_flows=MAX_FLOWS):
+        self.table = build_port_table(port_protocols)
+        self.max_flows = max_flows
+        self.overrides = OrderedDict()
+
+    def classify(self, records):
+        """Set the protocol code of every record in a decoded batch"""
+        table = self.table
+        offsets = _TABLE_OFFSETS
+        overrides = self.overrides
+        for record in records:
+            transport = record.transport
+            offset = offsets.get(transport)
+            if offset is None or record.source_port is None:
+                record.protocol = transport
+                continue
+            protocol = table[offset + record.destination_port] or table[offset + record.source_port] or transport
+
+            app = record.app
+            if app is not None or overrides:
+                if (record.source_ip, record.source_port) <= (record.destination_ip, record.destination_port):
+                    key = (transport, record.source_ip, record.source_port,
+                           record.destination_ip, record.destination_port)
+                else:
+                    key = (transport, record.destination_ip, record.destination_port,
+                           record.source_ip, record.source_port)
+                code = message_code(app) if app is not None else None
+                if code is not None and code != protocol:
+                    overrides[key] = code
+                    if len(overrides) > self.max_flows:
+                        overrides.popitem(last=False)
+                    protocol = code
+                elif overrides:
+                    protocol = overrides.get(key, protocol)
+
+            record.protocol = protocol
+        return records
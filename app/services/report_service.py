@@ -95,6 +95,36 @@ class ReportService:
         
         content.append(table)
         
+        # Top-K sketches from live capture; counts may overestimate by the listed error
+        from app.services.heavy_hitters import heavy_hitters
+        from app.services.passive_dns import passive_dns
+        for title, dimension in (('Top Talkers (24h)', 'source_ip'),
+                                 ('Top Destination Ports (24h)', 'destination_port'),
+                                 ('Top Conversations (24h)', 'conversation')):
+            top = heavy_hitters.top(dimension, '24h', limit=10)
+            if not top:
+                continue
+            
+            content.append(Spacer(1, 0.2*inch))
+            content.append(Paragraph(f'<b>{title}</b>', styles['Heading3']))
+            rows = [['Key', 'Packets', 'Bytes', 'Max Error']]
+            for entry in top:
+                key = str(entry['key'])
+                hostname = passive_dns.lookup(entry['key']) if dimension == 'source_ip' else None
+                if hostname:
+                    key = f'{key}\n{hostname}'
+                rows.append([key, f"{entry['packets']:,}", f"{entry['bytes']:,}", f"{entry['error']:,}"])
+            
+            top_table = Table(rows, colWidths=[2.5*inch, 1.2*inch, 1.3*inch, 1*inch])
+            top_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            content.append(top_table)
+        
         return content
     
     def _generate_security_report(self, params):
@@ -0,0 +1,120 @@
+import threading
+import time
+
+
+class PacketRingBuffer:
+    """Bounded, preallocated queue between the capture and writer stages"""
+
+    POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+    def __init__(self, capacity, policy='drop_oldest', block_timeout=1.0):
+        if capacity < 1:
+            raise ValueError('Ring buffer capacity must be positive')
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown overflow policy: {policy}')
+
+        self.capacity = capacity
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.slots = [None] * capacity
+        self.head = 0
+        self.size = 0
+        self.closed = False
+
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+        self.high_water = 0
+        self.dropped = 0
+        self.enqueued = 0
+        self.dequeued = 0
+
+    def put_many(self, items):
+        """Enqueue items according to the overflow policy, returning the number accepted
+
+        With the ``block`` policy the whole call waits at most block_timeout;
+        once that has passed, the rest of a full batch is dropped.
+        """
+        accepted = 0
+        deadline = None
+        with self.lock:
+            for item in items:
+                if self.closed:
+                    self.dropped += 1
+                    continue
+
+                if self.size == self.capacity:
+                    if self.policy == 'drop_newest':
+                        self.dropped += 1
+                        continue
+                    elif self.policy == 'drop_oldest':
+                        self.slots[self.head] = None
+                        self.head = (self.head + 1) % self.capacity
+                        self.size -= 1
+                        self.dropped += 1
+                    else:
+                        if deadline is None:
+                            deadline = time.monotonic() + self.block_timeout
+                        while self.size == self.capacity and not self.closed:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                break
+                            self.not_full.wait(remaining)
+                        if self.size == self.capacity or self.closed:
+                            self.dropped += 1
+                            continue
+
+                self.slots[(self.head + self.size) % self.capacity] = item
+                self.size += 1
+                accepted += 1
+
+            self.enqueued += accepted
+            if self.size > self.high_water:
+                self.high_water = self.size
+            if accepted:
+                self.not_empty.notify()
+        return accepted
+
+    def get_batch(self, max_items, timeout=None):
+        """Dequeue up to max_items, waiting up to timeout for the first one"""
+        with self.lock:
+            if self.size == 0 and not self.closed:
+                self.not_empty.wait(timeout)
+
+            count = min(self.size, max_items)
+            batch = []
+            for _ in range(count):
+                batch.append(self.slots[self.head])
+                self.slots[self.head] = None
+                self.head = (self.head + 1) % self.capacity
+            self.size -= count
+            self.dequeued += count
+
+            if count:
+                self.not_full.notify_all()
+            return batch
+
+    def close(self):
+        """Stop accepting items and wake up any waiting stage"""
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    @property
+    def drained(self):
+        return self.closed and self.size == 0
+
+    def stats(self):
+        """Get live buffer counters"""
+        with self.lock:
+            return {
+                'capacity': self.capacity,
+                'policy': self.policy,
+                'depth': self.size,
+                'high_water': self.high_water,
+                'dropped': self.dropped,
+                'enqueued': self.enqueued,
+                'dequeued': self.dequeued
+            }
@@ -0,0 +1,246 @@
+"""Rebuilding traffic rollups from stored packets
+
+History is cut into hour-aligned slices. Every 1s, 1m and 1h bucket falls
+inside exactly one slice, so a slice's rollups can be replaced as a unit:
+re-running a slice yields the same rows, and an interrupted run resumes
+from its checkpoint without double counting.
+"""
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from sqlalchemy import create_engine, text
+from app import db
+from app.models.rollup import InterfaceRollup, SessionRollup
+from app.models.types import datetime_to_ns, ns_to_datetime
+from app.services.rollup_service import RESOLUTIONS, RollupAccumulator, write_rollups
+
+_SLICE_QUERY = text(
+    'SELECT p.timestamp AS ts_ns, p.session_id, s.interface_id, p.protocol, p.length, '
+    'p.source_ip, p.destination_ip, p.source_port, p.destination_port '
+    'FROM packets p JOIN capture_sessions s ON s.id = p.session_id '
+    'WHERE p.timestamp >= :start AND p.timestamp < :end '
+    'ORDER BY p.timestamp'
+)
+
+# Engine of the current pool worker process
+_engine = None
+
+
+def _init_worker(database_url):
+    global _engine
+    _engine = create_engine(database_url)
+
+
+def _aggregate_slice(start_ns, end_ns, chunk_size):
+    """Aggregate one slice of packets in a pool worker
+
+    Rows are streamed in chunks so memory is bounded by the slice's bucket
+    count rather than its packet count. Packets stored by several sessions
+    on one interface (overlapping filters) have the same timestamp and
+    fields and are counted once for the interface: a frame seen n times by
+    one session and m times by another counts max(n, m).
+    """
+    sessions = {}
+    interfaces = {}
+    rows = 0
+    current_ts = None
+    seen = {}
+
+    with _engine.connect() as connection:
+        result = connection.execution_options(yield_per=chunk_size).execute(
+            _SLICE_QUERY, {'start': start_ns, 'end': end_ns}
+        )
+        for chunk in result.partitions():
+            rows += len(chunk)
+            by_session = {}
+            by_interface = {}
+            for row in chunk:
+                by_session.setdefault(row.session_id, []).append(row)
+                if row.ts_ns != current_ts:
+                    current_ts = row.ts_ns
+                    seen.clear()
+                key = (row.interface_id, row.source_ip, row.destination_ip,
+                       row.source_port, row.destination_port, row.length)
+                counts = seen.get(key)
+                if counts is None:
+                    counts = seen[key] = [0, {}]
+                copies = counts[1].get(row.session_id, 0) + 1
+                counts[1][row.session_id] = copies
+                if copies > counts[0]:
+                    counts[0] = copies
+                    by_interface.setdefault(row.interface_id, []).append(row)
+
+            for session_id, records in by_session.items():
+                sessions.setdefault(session_id, RollupAccumulator()).add(records)
+            for interface_id, records in by_interface.items():
+                interfaces.setdefault(interface_id, RollupAccumulator()).add(records)
+
+    return (
+        rows,
+        {session_id: accumulator.buckets for session_id, accumulator in sessions.items()},
+        {interface_id: accumulator.buckets for interface_id, accumulator in interfaces.items()}
+    )
+
+
+class RollupBackfill:
+    """Rebuilds session and interface rollups for a time range in a process pool"""
+
+    def __init__(self, start=None, end=None, slice_hours=1, workers=None, chunk_size=50000,
+                 checkpoint_path='rollup_backfill.json', retention=None):
+        if slice_hours < 1:
+            raise ValueError('Slices must be at least one hour')
+
+        self.slice_seconds = int(slice_hours) * 3600
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.retention = retention or {}
+
+        if start is None:
+            first = db.session.execute(text('SELECT MIN(timestamp) FROM packets')).scalar()
+            start = ns_to_datetime(first) if first is not None else datetime.utcnow()
+        # Without an explicit end, a resumed run keeps the end its checkpoint was saved with
+        self.end_given = end is not None
+        if end is None:
+            # The current hour is still being written by live ingest
+            end = datetime.utcnow()
+        self.start = self._floor(start)
+        self.end = self._floor(end)
+
+    def _floor(self, value):
+        return value.replace(minute=0, second=0, microsecond=0)
+
+    def slices(self):
+        """Get the (start, end) datetimes of every slice in the range"""
+        slices = []
+        current = self.start
+        while current < self.end:
+            slices.append((current, min(current + timedelta(seconds=self.slice_seconds), self.end)))
+            current = slices[-1][1]
+        return slices
+
+    def load_checkpoint(self, progress=print):
+        """Get the datetime the previous run of this range completed up to, if any
+
+        When no end was given the checkpoint only has to match the start, and
+        its end is reused: the default end moves with every hour boundary.
+        """
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('start') != self.start.isoformat():
+            progress(f"Ignoring checkpoint {self.checkpoint_path}: it starts at {checkpoint.get('start')}, "
+                     f"not {self.start.isoformat()}")
+            return None
+        if self.end_given and checkpoint.get('end') != self.end.isoformat():
+            progress(f"Ignoring checkpoint {self.checkpoint_path}: it ends at {checkpoint.get('end')}, "
+                     f"not {self.end.isoformat()}")
+            return None
+        self.end = datetime.fromisoformat(checkpoint['end'])
+        return datetime.fromisoformat(checkpoint['completed_until'])
+
+    def save_checkpoint(self, completed_until, rows):
+        if not self.checkpoint_path:
+            return
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({
+                'start': self.start.isoformat(),
+                'end': self.end.isoformat(),
+                'slice_hours': self.slice_seconds // 3600,
+                'completed_until': completed_until.isoformat(),
+                'rows': rows
+            }, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def run(self, resume=True, progress=print):
+        """Rebuild every remaining slice, committing and checkpointing each in order"""
+        completed_until = self.load_checkpoint(progress) if resume else None
+        slices = self.slices()
+        if completed_until is not None:
+            progress(f"Resuming from checkpoint at {completed_until.isoformat()} "
+                     f"(range ends {self.end.isoformat()})")
+            slices = [s for s in slices if s[0] >= completed_until]
+
+        database_url = db.engine.url.render_as_string(hide_password=False)
+        total = len(slices)
+        rows_total = 0
+        started = time.monotonic()
+
+        context = get_context('spawn')
+        with ProcessPoolExecutor(self.workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(database_url,)) as pool:
+            # A bounded window of slices in flight keeps finished-but-unmerged results small
+            pending = deque()
+            queued = iter(slices)
+            for done in range(1, total + 1):
+                while len(pending) < self.workers * 2:
+                    bounds = next(queued, None)
+                    if bounds is None:
+                        break
+                    pending.append((bounds, pool.submit(
+                        _aggregate_slice, datetime_to_ns(bounds[0]), datetime_to_ns(bounds[1]), self.chunk_size
+                    )))
+
+                (slice_start, slice_end), future = pending.popleft()
+                rows, sessions, interfaces = future.result()
+                self._replace_slice(slice_start, slice_end, sessions, interfaces)
+                rows_total += rows
+                self.save_checkpoint(slice_end, rows_total)
+
+                elapsed = time.monotonic() - started
+                rate = rows_total / elapsed if elapsed > 0 else 0.0
+                progress(f"[{done}/{total}] {slice_start.isoformat()} - {slice_end.isoformat()}: "
+                         f"{rows} packets, {rate:,.0f} rows/s")
+
+        self.clear_checkpoint()
+        elapsed = time.monotonic() - started
+        return {
+            'slices': total,
+            'rows': rows_total,
+            'seconds': round(elapsed, 1),
+            'rows_per_sec': round(rows_total / elapsed, 1) if elapsed > 0 else 0.0
+        }
+
+    def _replace_slice(self, slice_start, slice_end, sessions, interfaces):
+        """Swap a slice's rollups for freshly aggregated ones in one transaction"""
+        try:
+            for model in (SessionRollup, InterfaceRollup):
+                model.query.filter(
+                    model.bucket_start >= slice_start,
+                    model.bucket_start < slice_end
+                ).delete(synchronize_session=False)
+
+            for session_id, buckets in sessions.items():
+                write_rollups(SessionRollup, session_id, self._retained(buckets))
+            for interface_id, buckets in interfaces.items():
+                write_rollups(InterfaceRollup, interface_id, self._retained(buckets))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _retained(self, buckets):
+        """Drop buckets that cleanup would already have expired"""
+        now = int(time.time())
+        cutoffs = {
+            resolution: now - days * 86400
+            for resolution, days in self.retention.items()
+            if resolution in RESOLUTIONS and days is not None
+        }
+        if not cutoffs:
+            return buckets
+        return {
+            key: counts
+            for key, counts in buckets.items()
+            if key[1] >= cutoffs.get(key[0], key[1])
+        }
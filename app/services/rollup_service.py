@@ -0,0 +1,158 @@
+"""Pre-aggregated traffic buckets
+
+Ingest folds every persisted batch into per-protocol packet and byte counts
+at 1 second, 1 minute and 1 hour resolution, per session and per interface.
+Time-series widgets read these few rows instead of scanning packets.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.rollup import InterfaceRollup, SessionRollup
+from app.services.time_buckets import bucket_range, fill_buckets, time_bucket
+
+RESOLUTIONS = (1, 60, 3600)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class RollupAccumulator:
+    """Sums packet records into {(resolution, bucket_second, protocol): [packets, bytes]}"""
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, records):
+        buckets = self.buckets
+        for record in records:
+            second = record.ts_ns // 1000000000
+            protocol = record.protocol
+            length = record.length
+            for resolution in RESOLUTIONS:
+                key = (resolution, second - second % resolution, protocol)
+                counts = buckets.get(key)
+                if counts is None:
+                    buckets[key] = [1, length]
+                else:
+                    counts[0] += 1
+                    counts[1] += length
+
+    def drain(self):
+        """Take the accumulated buckets, leaving the accumulator empty"""
+        buckets = self.buckets
+        self.buckets = {}
+        return buckets
+
+
+def write_rollups(model, owner_id, buckets):
+    """Add accumulated buckets to a rollup table; the caller commits"""
+    if not buckets:
+        return
+
+    owner_column = 'interface_id' if model is InterfaceRollup else 'session_id'
+    rows = [
+        {
+            owner_column: owner_id,
+            'resolution': resolution,
+            'bucket_start': _EPOCH + timedelta(seconds=second),
+            'protocol': protocol,
+            'packets': packets,
+            'bytes': length
+        }
+        for (resolution, second, protocol), (packets, length) in buckets.items()
+    ]
+
+    table = model.__table__
+    key = [owner_column, 'resolution', 'bucket_start', 'protocol']
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=key,
+            set_={
+                'packets': table.c.packets + statement.excluded.packets,
+                'bytes': table.c.bytes + statement.excluded.bytes
+            }
+        )
+        db.session.execute(statement, rows)
+        return
+
+    # Other databases: update existing buckets, insert the rest
+    for row in rows:
+        updated = db.session.execute(
+            table.update()
+            .where(*[table.c[column] == row[column] for column in key])
+            .values(packets=table.c.packets + row['packets'], bytes=table.c.bytes + row['bytes'])
+        ).rowcount
+        if not updated:
+            db.session.execute(table.insert(), row)
+
+
+def purge_rollups(retention):
+    """Delete buckets older than the retention configured for their resolution"""
+    now = datetime.utcnow()
+    deleted = 0
+    for model in (InterfaceRollup, SessionRollup):
+        for resolution, days in retention.items():
+            if days is None:
+                continue
+            deleted += model.query.filter(
+                model.resolution == resolution,
+                model.bucket_start < now - timedelta(days=days)
+            ).delete(synchronize_session=False)
+    return deleted
+
+
+class RollupService:
+
+    def get_series(self, start, end, step, resolution=None, interface_ids=None, session_ids=None):
+        """Get zero-filled [(bucket_start, packets, bytes)] in step-second slots between start and end
+
+        Reads the coarsest resolution that divides the step, from session
+        rollups when session_ids is given and interface rollups otherwise.
+        """
+        if resolution is None:
+            resolution = max(r for r in RESOLUTIONS if step % r == 0)
+
+        if session_ids is not None:
+            model, owner_column, owner_ids = SessionRollup, SessionRollup.session_id, session_ids
+        else:
+            model, owner_column, owner_ids = InterfaceRollup, InterfaceRollup.interface_id, interface_ids
+
+        first, last = bucket_range(start, end, step)
+        bucket = time_bucket(model.bucket_start, step).label('bucket')
+
+        query = db.session.query(
+            bucket,
+            func.sum(model.packets),
+            func.sum(model.bytes)
+        ).filter(
+            model.resolution == resolution,
+            model.bucket_start >= _EPOCH + timedelta(seconds=first),
+            model.bucket_start < _EPOCH + timedelta(seconds=last + step)
+        )
+        if owner_ids is not None:
+            query = query.filter(owner_column.in_(owner_ids))
+
+        rows = query.group_by(bucket).order_by(bucket).all()
+        return [
+            (bucket_start, int(packets or 0), int(length or 0))
+            for bucket_start, packets, length in fill_buckets(rows, start, end, step, empty=(0, 0))
+        ]
+
+    def get_protocol_counts(self, start, end, resolution=1, interface_ids=None):
+        """Get {protocol: packets} from interface rollups between start and end"""
+        query = db.session.query(
+            InterfaceRollup.protocol,
+            func.sum(InterfaceRollup.packets)
+        ).filter(
+            InterfaceRollup.resolution == resolution,
+            InterfaceRollup.bucket_start >= start,
+            InterfaceRollup.bucket_start < end
+        )
+        if interface_ids is not None:
+            query = query.filter(InterfaceRollup.interface_id.in_(interface_ids))
+        return {protocol: int(packets) for protocol, packets in query.group_by(InterfaceRollup.protocol).all()}
+
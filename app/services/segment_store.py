@@ -0,0 +1,370 @@
+"""Columnar, time-partitioned packet store
+
+Each session's packets are written to one segment per time partition:
+
+    <root>/<session_id>/<partition start, epoch seconds>/
+        header.json        rows, min/max timestamp (ns), column layout
+        timestamp.bin      int64 ns
+        source_ip.bin      2 x uint64 (high, low) per row
+        ...
+
+Column files are only ever appended to and the header is replaced atomically
+after each append, so readers memory-map exactly ``rows`` rows of the
+columns they need and never see a partial batch.
+"""
+import ipaddress
+import json
+import os
+import shutil
+import numpy as np
+from app.models.types import PROTOCOL_CODES, PROTOCOL_NAMES, IPV4_MAPPED, int_to_ip, ns_to_datetime, mask_to_flags
+
+# Column -> (dtype, values per row)
+COLUMNS = {
+    'timestamp': (np.dtype('<i8'), 1),
+    'source_ip': (np.dtype('<u8'), 2),
+    'destination_ip': (np.dtype('<u8'), 2),
+    'source_port': (np.dtype('<i4'), 1),
+    'destination_port': (np.dtype('<i4'), 1),
+    'transport': (np.dtype('u1'), 1),
+    'protocol': (np.dtype('u1'), 1),
+    'length': (np.dtype('<u4'), 1),
+    'flags': (np.dtype('u1'), 1),
+}
+FORMAT_VERSION = 1
+NO_PORT = -1
+
+_LOW_64 = (1 << 64) - 1
+
+
+def records_to_columns(records):
+    """Convert PacketRecords into column arrays"""
+    n = len(records)
+    source_ip = np.empty((n, 2), dtype='<u8')
+    destination_ip = np.empty((n, 2), dtype='<u8')
+    for i, record in enumerate(records):
+        source_ip[i] = (record.source_ip >> 64, record.source_ip & _LOW_64)
+        destination_ip[i] = (record.destination_ip >> 64, record.destination_ip & _LOW_64)
+
+    return {
+        'timestamp': np.fromiter((r.ts_ns for r in records), '<i8', n),
+        'source_ip': source_ip,
+        'destination_ip': destination_ip,
+        'source_port': np.fromiter((NO_PORT if r.source_port is None else r.source_port for r in records), '<i4', n),
+        'destination_port': np.fromiter(
+            (NO_PORT if r.destination_port is None else r.destination_port for r in records), '<i4', n),
+        'transport': np.fromiter((r.transport for r in records), 'u1', n),
+        'protocol': np.fromiter((r.protocol for r in records), 'u1', n),
+        'length': np.fromiter((r.length for r in records), '<u4', n),
+        'flags': np.fromiter((r.flags for r in records), 'u1', n),
+    }
+
+
+def _ip_bounds(network):
+    """Get the (high, low) 64-bit halves of a network's first and last address"""
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.version == 4:
+        first |= IPV4_MAPPED
+        last |= IPV4_MAPPED
+    return (first >> 64, first & _LOW_64), (last >> 64, last & _LOW_64)
+
+
+def _ip_in_range(ips, first, last):
+    high = ips[:, 0]
+    low = ips[:, 1]
+    above = (high > first[0]) | ((high == first[0]) & (low >= first[1]))
+    below = (high < last[0]) | ((high == last[0]) & (low <= last[1]))
+    return above & below
+
+
+def _unique_ips(ips):
+    """np.unique over address rows, returning (keys, inverse)"""
+    # Factorise each 64-bit half, then combine the two dense codes into one
+    # int64 key; much cheaper than np.unique(axis=0) over the rows
+    high_values, high_codes = np.unique(ips[:, 0], return_inverse=True)
+    low_values, low_codes = np.unique(ips[:, 1], return_inverse=True)
+    combined, inverse = np.unique(high_codes.ravel() * len(low_values) + low_codes.ravel(), return_inverse=True)
+    keys = np.empty((len(combined), 2), dtype=ips.dtype)
+    keys[:, 0] = high_values[combined // len(low_values)]
+    keys[:, 1] = low_values[combined % len(low_values)]
+    return keys, inverse.ravel()
+
+
+def _ip_strings(ips):
+    return [int_to_ip((int(high) << 64) | int(low)) for high, low in ips]
+
+
+class Segment:
+    """Read-only view of one segment; columns are memory-mapped on first use"""
+
+    def __init__(self, path, session_id, header):
+        self.path = path
+        self.session_id = session_id
+        self.rows = header['rows']
+        self.min_ts = header['min_ts']
+        self.max_ts = header['max_ts']
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            dtype, width = COLUMNS[name]
+            shape = (self.rows, width) if width > 1 else (self.rows,)
+            self._columns[name] = np.memmap(os.path.join(self.path, f'{name}.bin'), dtype=dtype, mode='r', shape=shape)
+        return self._columns[name]
+
+    def time_mask(self, start_ns, end_ns):
+        """Rows inside [start_ns, end_ns), or None when the whole segment is inside"""
+        if (start_ns is None or self.min_ts >= start_ns) and (end_ns is None or self.max_ts < end_ns):
+            return None
+        ts = self.column('timestamp')
+        mask = np.ones(self.rows, dtype=bool)
+        if start_ns is not None:
+            mask &= ts >= start_ns
+        if end_ns is not None:
+            mask &= ts < end_ns
+        return mask
+
+
+class SegmentStore:
+    """Columnar packet store rooted at a directory"""
+
+    def __init__(self, root, partition_seconds=3600):
+        self.root = root
+        self.partition_ns = int(partition_seconds) * 1000000000
+
+    # Writing
+
+    def append(self, session_id, records):
+        """Append PacketRecords to the session's segments"""
+        if not records:
+            return
+        columns = records_to_columns(records)
+        partitions = columns['timestamp'] // self.partition_ns
+
+        unique = np.unique(partitions)
+        if len(unique) == 1:
+            self._append_segment(session_id, int(unique[0]), columns)
+            return
+        for partition in unique:
+            selected = partitions == partition
+            self._append_segment(session_id, int(partition), {name: values[selected] for name, values in columns.items()})
+
+    def _append_segment(self, session_id, partition, columns):
+        path = os.path.join(self.root, str(session_id), str(partition * self.partition_ns // 1000000000))
+        os.makedirs(path, exist_ok=True)
+        header = self._read_header(path) or {
+            'version': FORMAT_VERSION,
+            'session_id': session_id,
+            'rows': 0,
+            'min_ts': None,
+            'max_ts': None,
+            'columns': {name: [dtype.str, width] for name, (dtype, width) in COLUMNS.items()},
+        }
+
+        rows = header['rows']
+        for name, (dtype, width) in COLUMNS.items():
+            with open(os.path.join(path, f'{name}.bin'), 'ab') as f:
+                # Drop anything past the header left by an interrupted append
+                expected = rows * dtype.itemsize * width
+                if f.tell() != expected:
+                    f.truncate(expected)
+                    f.seek(expected)
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+
+        ts = columns['timestamp']
+        header['rows'] = rows + len(ts)
+        header['min_ts'] = int(ts.min()) if header['min_ts'] is None else min(header['min_ts'], int(ts.min()))
+        header['max_ts'] = int(ts.max()) if header['max_ts'] is None else max(header['max_ts'], int(ts.max()))
+
+        temp = os.path.join(path, 'header.json.tmp')
+        with open(temp, 'w') as f:
+            json.dump(header, f)
+        os.replace(temp, os.path.join(path, 'header.json'))
+
+    def _read_header(self, path):
+        try:
+            with open(os.path.join(path, 'header.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # Reading
+
+    def segments(self, start_ns=None, end_ns=None, session_ids=None):
+        """Yield segments that may hold rows in [start_ns, end_ns)"""
+        if not os.path.isdir(self.root):
+            return
+        partition_seconds = self.partition_ns // 1000000000
+        for session_dir in os.listdir(self.root):
+            if not session_dir.isdigit():
+                continue
+            session_id = int(session_dir)
+            if session_ids is not None and session_id not in session_ids:
+                continue
+            session_path = os.path.join(self.root, session_dir)
+            for partition_dir in os.listdir(session_path):
+                if not partition_dir.isdigit():
+                    continue
+                partition_start = int(partition_dir) * 1000000000
+                if end_ns is not None and partition_start >= end_ns:
+                    continue
+                if start_ns is not None and partition_start + partition_seconds * 1000000000 <= start_ns:
+                    continue
+                path = os.path.join(session_path, partition_dir)
+                header = self._read_header(path)
+                if not header or not header['rows']:
+                    continue
+                if end_ns is not None and header['min_ts'] >= end_ns:
+                    continue
+                if start_ns is not None and header['max_ts'] < start_ns:
+                    continue
+                yield Segment(path, session_id, header)
+
+    def protocol_counts(self, start_ns=None, end_ns=None, session_ids=None):
+        """Count packets per protocol"""
+        totals = np.zeros(256, dtype=np.int64)
+        for segment in self.segments(start_ns, end_ns, session_ids):
+            protocols = segment.column('protocol')
+            mask = segment.time_mask(start_ns, end_ns)
+            if mask is not None:
+                protocols = protocols[mask]
+            totals += np.bincount(protocols, minlength=256)
+        return {PROTOCOL_NAMES.get(code, 'OTHER'): int(count) for code, count in enumerate(totals) if count}
+
+    def top_sources(self, start_ns=None, end_ns=None, limit=10, session_ids=None):
+        """Get (ip, packets, bytes) for the busiest source addresses"""
+        totals = {}
+        for segment in self.segments(start_ns, end_ns, session_ids):
+            ips = segment.column('source_ip')
+            lengths = segment.column('length')
+            mask = segment.time_mask(start_ns, end_ns)
+            if mask is not None:
+                ips = ips[mask]
+                lengths = lengths[mask]
+            if not len(ips):
+                continue
+            keys, inverse = _unique_ips(ips)
+            counts = np.bincount(inverse, minlength=len(keys))
+            byte_counts = np.bincount(inverse, weights=lengths, minlength=len(keys))
+            for (high, low), packets, total_bytes in zip(keys.tolist(), counts.tolist(), byte_counts.tolist()):
+                entry = totals.setdefault((high, low), [0, 0])
+                entry[0] += packets
+                entry[1] += int(total_bytes)
+
+        ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return [(int_to_ip((high << 64) | low), packets, total_bytes)
+                for (high, low), (packets, total_bytes) in ranked]
+
+    def search(self, conditions, start_ns=None, end_ns=None, limit=500, session_ids=None):
+        """Find packets matching every (field, operator, value) condition, newest first
+
+        Fields are source_ip, destination_ip, protocol and port; operators are
+        equals, contains, greater and less. Returns (total matches, rows).
+        """
+        total = 0
+        matches = []
+        for segment in self.segments(start_ns, end_ns, session_ids):
+            mask = segment.time_mask(start_ns, end_ns)
+            if mask is None:
+                mask = np.ones(segment.rows, dtype=bool)
+            for field, operator, value in conditions:
+                mask &= self._condition_mask(segment, field, operator, value)
+            indexes = np.flatnonzero(mask)
+            if not len(indexes):
+                continue
+            total += len(indexes)
+            # Keep only the newest rows of each segment as candidates
+            ts = segment.column('timestamp')[indexes]
+            newest = indexes[np.argsort(ts)[::-1][:limit]]
+            matches.extend((int(segment.column('timestamp')[i]), segment, int(i)) for i in newest)
+
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return total, [self._row(segment, i) for _, segment, i in matches[:limit]]
+
+    def _condition_mask(self, segment, field, operator, value):
+        value = str(value).strip()
+        if field in ('source_ip', 'destination_ip'):
+            ips = segment.column(field)
+            if operator in ('equals', 'contains'):
+                try:
+                    network = ipaddress.ip_network(value, strict=False)
+                except ValueError:
+                    network = None
+                if network is not None and (operator == 'contains' or network.num_addresses == 1):
+                    return _ip_in_range(ips, *_ip_bounds(network))
+                if operator == 'equals':
+                    return np.zeros(segment.rows, dtype=bool)
+                # Substring match against the distinct addresses in the segment
+                keys, inverse = _unique_ips(ips)
+                wanted = np.array([value in ip for ip in _ip_strings(keys)], dtype=bool)
+                return wanted[inverse]
+            raise ValueError(f'Unsupported operator for {field}: {operator}')
+
+        if field == 'protocol':
+            protocols = segment.column('protocol')
+            if operator == 'equals':
+                codes = [PROTOCOL_CODES[value.upper()]] if value.upper() in PROTOCOL_CODES else []
+            elif operator == 'contains':
+                codes = [code for name, code in PROTOCOL_CODES.items() if value.upper() in name]
+            else:
+                raise ValueError(f'Unsupported operator for protocol: {operator}')
+            return np.isin(protocols, codes)
+
+        if field == 'port':
+            try:
+                port = int(value)
+            except ValueError:
+                raise ValueError(f'Invalid port: {value}')
+            source = segment.column('source_port')
+            destination = segment.column('destination_port')
+            if operator in ('equals', 'contains'):
+                return (source == port) | (destination == port)
+            if operator == 'greater':
+                return (source > port) | (destination > port)
+            if operator == 'less':
+                return ((source >= 0) & (source < port)) | ((destination >= 0) & (destination < port))
+            raise ValueError(f'Unsupported operator for port: {operator}')
+
+        raise ValueError(f'Unsupported search field: {field}')
+
+    def _row(self, segment, i):
+        source = segment.column('source_ip')[i]
+        destination = segment.column('destination_ip')[i]
+        source_port = int(segment.column('source_port')[i])
+        destination_port = int(segment.column('destination_port')[i])
+        return {
+            'session_id': segment.session_id,
+            'timestamp': ns_to_datetime(int(segment.column('timestamp')[i])).isoformat(),
+            'source_ip': int_to_ip((int(source[0]) << 64) | int(source[1])),
+            'destination_ip': int_to_ip((int(destination[0]) << 64) | int(destination[1])),
+            'source_port': source_port if source_port != NO_PORT else None,
+            'destination_port': destination_port if destination_port != NO_PORT else None,
+            'protocol': PROTOCOL_NAMES.get(int(segment.column('protocol')[i]), 'OTHER'),
+            'bytes': int(segment.column('length')[i]),
+            'flags': mask_to_flags(int(segment.column('flags')[i]))
+        }
+
+    # Retention
+
+    def purge_before(self, cutoff_ns):
+        """Delete segments whose newest packet is older than the cutoff"""
+        removed = 0
+        for segment in list(self.segments(end_ns=cutoff_ns)):
+            if segment.max_ts < cutoff_ns:
+                shutil.rmtree(segment.path, ignore_errors=True)
+                removed += segment.rows
+        return removed
+
+
+def get_packet_store():
+    """Get the packet store for the current app, or None if it is disabled"""
+    from flask import current_app
+
+    if not current_app.config.get('PACKET_STORE_ENABLED'):
+        return None
+    store = current_app.extensions.get('packet_store')
+    if store is None:
+        store = SegmentStore(current_app.config['PACKET_STORE_PATH'], current_app.config['PACKET_STORE_PARTITION_SECONDS'])
+        current_app.extensions['packet_store'] = store
+    return store
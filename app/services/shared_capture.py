@@ -0,0 +1,151 @@
+import threading
+from app.services.dhcp_leases import dhcp_leases
+from app.services.distinct_counter import distinct_sources
+from app.services.dns_stats import dns_stats
+from app.services.flow_table import flow_tables
+from app.services.heavy_hitters import heavy_hitters
+from app.services.http_stats import http_stats
+from app.services.mail_stats import mail_stats
+from app.services.passive_dns import passive_dns
+from app.services.rollup_service import RollupAccumulator
+from app.services.signature_stats import signature_stats
+from app.services.tls_stats import tls_stats
+
+
+class SharedCapture:
+    """One capture source on an interface, shared by every session attached to it
+
+    Sessions attach with their filter and ring buffer. The source is read and
+    decoded once and each session only receives the records its filter
+    matches. Attaching, detaching, pausing and resuming re-filter the open
+    source instead of restarting it, and wake the capture thread if it is
+    waiting with every session paused.
+
+    Records delivered to at least one session are counted once into the
+    interface rollups, top-K and distinct-source sketches and flow table,
+    however many sessions' filters they match.
+    """
+
+    def __init__(self, key, interface_name, capture_source):
+        self.key = key
+        self.interface_name = interface_name
+        self.capture_source = capture_source
+        self.tap = None
+        self.sessions = {}
+        self.filters_changed = True
+        self.kernel_stats = {}
+        self.rollups = RollupAccumulator()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def attach(self, session_id, packet_filter, buffer):
+        """Start routing matching records to a session's buffer"""
+        with self.lock:
+            self.sessions[session_id] = {
+                'filter': packet_filter,
+                'buffer': buffer,
+                'paused': False,
+                'drops_base': self.kernel_stats.get('kernel_drops', 0),
+                'drops_recorded': 0
+            }
+            self.filters_changed = True
+            self.changed.notify_all()
+
+    def detach(self, session_id):
+        """Stop routing to a session and close its buffer"""
+        with self.lock:
+            entry = self.sessions.pop(session_id, None)
+            self.filters_changed = True
+            self.changed.notify_all()
+        if entry is not None:
+            entry['buffer'].close()
+
+    def set_paused(self, session_id, paused):
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is not None and entry['paused'] != paused:
+                entry['paused'] = paused
+                self.filters_changed = True
+                self.changed.notify_all()
+
+    @property
+    def session_ids(self):
+        with self.lock:
+            return list(self.sessions)
+
+    def wait_active(self):
+        """Block while every attached session is paused; False once none are attached"""
+        with self.lock:
+            while self.sessions and all(entry['paused'] for entry in self.sessions.values()):
+                self.changed.wait()
+            return bool(self.sessions)
+
+    def apply_filters(self):
+        """Push the running sessions' filters to the source if they changed"""
+        with self.lock:
+            if not self.filters_changed:
+                return
+            self.filters_changed = False
+            filters = {
+                session_id: entry['filter']
+                for session_id, entry in self.sessions.items()
+                if not entry['paused']
+            }
+        self.tap.set_filters(filters)
+
+    def poll(self, timeout=1.0):
+        """Apply pending filter changes, then route one interval of traffic"""
+        self.apply_filters()
+        count = self.tap.poll(self._dispatch, timeout=timeout)
+        self.kernel_stats = self.tap.stats()
+        return count
+
+    def _dispatch(self, routed):
+        delivered = []
+        for session_id, records in routed.items():
+            entry = self.sessions.get(session_id)
+            # Records already in flight when a session pauses or detaches are discarded
+            if entry is not None and not entry['paused']:
+                entry['buffer'].put_many(records)
+                delivered.append(records)
+
+        if len(delivered) == 1:
+            unique = delivered[0]
+        else:
+            # A record matching several sessions is the same object in each list
+            seen = set()
+            unique = []
+            for records in delivered:
+                for record in records:
+                    if id(record) not in seen:
+                        seen.add(id(record))
+                        unique.append(record)
+        self.rollups.add(unique)
+        heavy_hitters.update(self.key[0], unique)
+        distinct_sources.update(self.key[0], unique)
+        flow_tables.update(self.key[0], unique)
+        dissected = [record for record in unique if record.app is not None]
+        if dissected:
+            dns_stats.update(self.key[0], dissected)
+            http_stats.update(self.key[0], dissected)
+            tls_stats.update(self.key[0], dissected)
+            mail_stats.update(self.key[0], dissected)
+            signature_stats.update(self.key[0], dissected)
+            passive_dns.update(dissected)
+            dhcp_leases.update(self.key[0], dissected)
+
+    def unrecorded_kernel_drops(self):
+        """Get {session_id: drops since attach} for sessions whose count changed since the last call"""
+        total = self.kernel_stats.get('kernel_drops', 0)
+        changed = {}
+        with self.lock:
+            for session_id, entry in self.sessions.items():
+                drops = total - entry['drops_base']
+                if drops != entry['drops_recorded']:
+                    entry['drops_recorded'] = drops
+                    changed[session_id] = drops
+        return changed
+
+    def close(self):
+        if self.tap is not None:
+            self.tap.close()
@@ -0,0 +1,242 @@
+"""Payload signature matching for P2P and protocol detection
+
+Every signature's byte patterns are compiled into one Aho-Corasick
+automaton, so a payload is scanned once whatever the number of signatures.
+Only the first payload of each direction of a flow is scanned, and only its
+first ``depth`` bytes. A pattern may be anchored at an offset.
+
+A flow whose payloads match nothing in both directions, but whose port is
+a signature's hint port, is reported as a port-only match. Encrypted
+variants of P2P protocols are the usual case.
+
+Signatures are dicts, loaded from a JSON file (a list of them) or taken
+from DEFAULT_SIGNATURES::
+
+    {"name": "BitTorrent", "category": "p2p", "patterns": ["\\u0013BitTorrent protocol"],
+     "offset": 0, "ports": [6881, 6889]}
+
+Patterns are latin-1 text, or hex bytes when prefixed with ``hex:``.
+``ports`` lists single ports and [low, high] ranges.
+
+The decoder only feeds the inspector payloads on ports without a protocol
+dissector (DNS, DHCP, HTTP on 80/8080, TLS on 443 and the mail ports),
+since a record carries a single application result. Signatures never see
+those ports: a BitTorrent tracker announce over HTTP on port 80, say, is
+counted as an HTTP request, not as tracker traffic.
+"""
+import json
+from collections import OrderedDict, deque
+
+DEFAULT_DEPTH = 64
+MAX_FLOWS = 65536
+
+DEFAULT_SIGNATURES = [
+    {'name': 'BitTorrent', 'category': 'p2p', 'patterns': ['\x13BitTorrent protocol'], 'offset': 0,
+     'ports': [[6881, 6889]]},
+    {'name': 'BitTorrent DHT', 'category': 'p2p', 'patterns': ['d1:ad2:id20:', 'd1:rd2:id20:'], 'offset': 0,
+     'ports': [[6881, 6889]]},
+    # HTTP trackers on their usual non-web ports, and the UDP tracker protocol's connect magic
+    {'name': 'BitTorrent Tracker', 'category': 'p2p',
+     'patterns': ['GET /announce?info_hash=', 'GET /scrape?', 'hex:0000041727101980'], 'offset': 0,
+     'ports': [6969, 2710]},
+    {'name': 'eDonkey', 'category': 'p2p', 'patterns': ['hex:0110'], 'offset': 5, 'ports': [4662, 4672]},
+    {'name': 'Gnutella', 'category': 'p2p', 'patterns': ['GNUTELLA CONNECT/', 'GNUTELLA/0.6'], 'offset': 0,
+     'ports': [6346, 6347]},
+    {'name': 'Direct Connect', 'category': 'p2p', 'patterns': ['$MyNick ', '$Lock '], 'offset': 0,
+     'ports': [411, 412]},
+    {'name': 'FastTrack', 'category': 'p2p', 'patterns': ['GET /.hash=', 'X-Kazaa-'], 'ports': [1214]},
+    {'name': 'Bitcoin', 'category': 'cryptocurrency', 'patterns': ['hex:f9beb4d9'], 'offset': 0, 'ports': [8333]},
+    {'name': 'Stratum Mining', 'category': 'cryptocurrency', 'patterns': ['mining.subscribe', 'mining.authorize'],
+     'ports': [3333, 4444]},
+    {'name': 'SSH', 'category': 'remote_access', 'patterns': ['SSH-2.0-', 'SSH-1.99-'], 'offset': 0, 'ports': [22]},
+    {'name': 'VNC', 'category': 'remote_access', 'patterns': ['RFB 003.'], 'offset': 0, 'ports': [[5900, 5909]]},
+    {'name': 'SMB', 'category': 'file_sharing', 'patterns': ['hex:ff534d42', 'hex:fe534d42'], 'offset': 4,
+     'ports': [139, 445]},
+    {'name': 'IRC', 'category': 'chat', 'patterns': ['NICK ', 'CAP LS'], 'offset': 0, 'ports': [[6660, 6669]]},
+    {'name': 'XMPP', 'category': 'chat', 'patterns': ['<stream:stream'], 'ports': [5222, 5269]},
+    {'name': 'SIP', 'category': 'voip', 'patterns': ['SIP/2.0 ', 'INVITE sip:', 'REGISTER sip:'], 'ports': [5060, 5061]},
+    {'name': 'STUN', 'category': 'voip', 'patterns': ['hex:2112a442'], 'offset': 4, 'ports': [3478, 19302]},
+    {'name': 'RTSP', 'category': 'streaming', 'patterns': ['RTSP/1.0'], 'ports': [554, 8554]},
+    {'name': 'HTTP', 'category': 'web', 'patterns': ['HTTP/1.1 ', 'HTTP/1.0 ', 'GET / HTTP/1.'], 'offset': 0},
+    {'name': 'TLS', 'category': 'web', 'patterns': ['hex:160301', 'hex:160303'], 'offset': 0}
+]
+
+
+def load_signatures(path=None):
+    """Get the signatures in a JSON file, or the defaults when no path is given"""
+    if not path:
+        return DEFAULT_SIGNATURES
+    with open(path) as f:
+        signatures = json.load(f)
+    if not isinstance(signatures, list):
+        raise ValueError(f'{path}: expected a list of signatures')
+    return signatures
+
+
+def _pattern_bytes(pattern):
+    if pattern.startswith('hex:'):
+        return bytes.fromhex(pattern[4:])
+    return pattern.encode('latin-1')
+
+
+def _ports(entries):
+    ports = set()
+    for entry in entries:
+        if isinstance(entry, (list, tuple)):
+            ports.update(range(entry[0], entry[1] + 1))
+        else:
+            ports.add(entry)
+    return ports
+
+
+class AhoCorasick:
+    """Multi-pattern byte matcher: one pass over the data finds every pattern occurrence"""
+
+    def __init__(self, patterns):
+        """Build from (pattern bytes, value) pairs"""
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [()]
+        for pattern, value in patterns:
+            state = 0
+            for byte in pattern:
+                next_state = self.goto[state].get(byte)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][byte] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(())
+                state = next_state
+            self.outputs[state] += ((len(pattern), value),)
+
+        # Failure links breadth first, inheriting the outputs of the fallback state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for byte, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and byte not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(byte, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] += self.outputs[self.fail[next_state]]
+
+    def search(self, data):
+        """Yield (start offset, value) for every pattern occurrence in data"""
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        state = 0
+        for index, byte in enumerate(data):
+            while state and byte not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(byte, 0)
+            for length, value in outputs[state]:
+                yield index - length + 1, value
+
+
+class SignatureEngine:
+    """Compiled signatures: one automaton for every pattern, plus the port hints"""
+
+    def __init__(self, signatures):
+        self.names = []
+        self.categories = []
+        self.offsets = []
+        self.port_hints = {}
+        patterns = []
+        for index, signature in enumerate(signatures):
+            self.names.append(signature['name'])
+            self.categories.append(signature.get('category', 'other'))
+            self.offsets.append(signature.get('offset'))
+            for pattern in signature['patterns']:
+                patterns.append((_pattern_bytes(pattern), index))
+            for port in _ports(signature.get('ports', ())):
+                self.port_hints.setdefault(port, index)
+        self.automaton = AhoCorasick(patterns)
+
+    def match(self, payload):
+        """Get the index of the first signature whose pattern occurs in payload, or None"""
+        offsets = self.offsets
+        for start, index in self.automaton.search(payload):
+            offset = offsets[index]
+            if offset is None or offset == start:
+                return index
+        return None
+
+    def port_hint(self, source_port, destination_port):
+        """Get the index of the signature hinting either port, server side first, or None"""
+        hint = self.port_hints.get(destination_port)
+        if hint is None:
+            hint = self.port_hints.get(source_port)
+        return hint
+
+
+class SignatureMatch:
+    """A flow classified by a signature, from its payload or only from its port"""
+
+    __slots__ = ('name', 'category', 'by_port')
+
+    def __init__(self, name, category, by_port=False):
+        self.name = name
+        self.category = category
+        self.by_port = by_port
+
+    def __reduce__(self):
+        return (SignatureMatch, (self.name, self.category, self.by_port))
+
+    def __repr__(self):
+        return f'<SignatureMatch {self.name} {"port" if self.by_port else "payload"}>'
+
+
+# FlowInspector state bits
+_FORWARD = 1
+_REVERSE = 2
+
+
+class FlowInspector:
+    """First-payload signature inspection for the flows of one capture tap
+
+    Each flow is keyed in a canonical direction; its state records which
+    directions have been scanned. Once a flow is classified, or both
+    directions came up empty, it is finished. The table keeps at most
+    MAX_FLOWS flows and forgets the oldest first.
+    """
+
+    def __init__(self, engine, depth=DEFAULT_DEPTH, max_flows=MAX_FLOWS):
+        self.engine = engine
+        self.depth = depth
+        self.max_flows = max_flows
+        self.flows = OrderedDict()
+
+    def feed(self, transport, source_ip, source_port, destination_ip, destination_port, payload):
+        """Scan the first payload of each flow direction, returning a SignatureMatch once per flow, or None"""
+        if (source_ip, source_port) <= (destination_ip, destination_port):
+            key = (transport, source_ip, source_port, destination_ip, destination_port)
+            direction = _FORWARD
+        else:
+            key = (transport, destination_ip, destination_port, source_ip, source_port)
+            direction = _REVERSE
+        flows = self.flows
+        state = flows.get(key, 0)
+        if state & direction:
+            return None
+
+        engine = self.engine
+        index = engine.match(bytes(payload[:self.depth]))
+        if index is not None:
+            state = _FORWARD | _REVERSE
+            match = SignatureMatch(engine.names[index], engine.categories[index])
+        else:
+            state |= direction
+            match = None
+            if state == _FORWARD | _REVERSE:
+                index = engine.port_hint(source_port, destination_port)
+                if index is not None:
+                    match = SignatureMatch(engine.names[index], engine.categories[index], by_port=True)
+
+        flows[key] = state
+        if len(flows) > self.max_flows:
+            flows.popitem(last=False)
+        return match
@@ -0,0 +1,91 @@
+"""Per-signature hit counters fed by the capture taps' flow inspectors
+
+Each flow is reported at most once, by payload or by port hint, so the
+counters are flows rather than packets. A Space-Saving sketch per signature
+keeps the hosts that sent the matching payloads.
+"""
+import threading
+from flask import current_app
+from app.models.types import int_to_ip, ns_to_datetime
+from app.services.heavy_hitters import SpaceSaving
+from app.services.signature_engine import SignatureMatch
+
+
+class SignatureCounter:
+    """Hits of one signature on one interface"""
+
+    __slots__ = ('category', 'payload_hits', 'port_hits', 'first_ns', 'last_ns', 'hosts')
+
+    def __init__(self, category, capacity):
+        self.category = category
+        self.payload_hits = 0
+        self.port_hits = 0
+        self.first_ns = None
+        self.last_ns = None
+        self.hosts = SpaceSaving(capacity)
+
+
+class SignatureStatsRegistry:
+    """Signature counters per interface"""
+
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def update(self, interface_id, records):
+        """Count delivered records carrying a signature match"""
+        matches = [record for record in records if isinstance(record.app, SignatureMatch)]
+        if not matches:
+            return
+        with self.lock:
+            counters = self.counters.setdefault(interface_id, {})
+            for record in matches:
+                match = record.app
+                counter = counters.get(match.name)
+                if counter is None:
+                    counter = counters[match.name] = SignatureCounter(
+                        match.category,
+                        current_app.config['SIGNATURE_HOST_CAPACITY']
+                    )
+                if match.by_port:
+                    counter.port_hits += 1
+                else:
+                    counter.payload_hits += 1
+                if counter.first_ns is None:
+                    counter.first_ns = record.ts_ns
+                counter.last_ns = record.ts_ns
+                counter.hosts.update({record.source_ip: (1, 0)})
+
+    def hits(self, interface_ids=None, category=None, limit=5):
+        """Get each signature's flow counts and top hosts, most hits first"""
+        with self.lock:
+            merged = {}
+            for interface_id, counters in self.counters.items():
+                if interface_ids is not None and interface_id not in interface_ids:
+                    continue
+                for name, counter in counters.items():
+                    if category is None or counter.category == category:
+                        merged.setdefault(name, []).append(counter)
+
+            hits = []
+            for name, counters in merged.items():
+                payload_hits = sum(counter.payload_hits for counter in counters)
+                port_hits = sum(counter.port_hits for counter in counters)
+                hosts = SpaceSaving.merge([counter.hosts for counter in counters], counters[0].hosts.capacity)
+                hits.append({
+                    'signature': name,
+                    'category': counters[0].category,
+                    'flows': payload_hits + port_hits,
+                    'payload_hits': payload_hits,
+                    'port_hits': port_hits,
+                    'first_seen': ns_to_datetime(min(counter.first_ns for counter in counters)).isoformat(),
+                    'last_seen': ns_to_datetime(max(counter.last_ns for counter in counters)).isoformat(),
+                    'hosts': [
+                        {'ip': int_to_ip(address), 'flows': count}
+                        for address, count, _, _ in hosts.top(limit)
+                    ]
+                })
+        return sorted(hits, key=lambda hit: hit['flows'], reverse=True)
+
+
+signature_stats = SignatureStatsRegistry()
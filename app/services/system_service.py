@@ -5,7 +5,11 @@ from datetime import datetime, timedelta
 from app import db
 from app.models.user import User
 from app.models.packet import Packet
+from app.models.flow import Flow
 from app.models.capture_session import CaptureSession
+from app.models.types import datetime_to_ns
+from app.services.rollup_service import purge_rollups
+from app.services.segment_store import get_packet_store
 
 class SystemService:
     
@@ -49,10 +53,22 @@ class SystemService:
     
     def run_cleanup(self):
         """Run database cleanup"""
-        cutoff_date = datetime.utcnow() - timedelta(days=90)
+        packet_days = 90
+        cutoff_date = datetime.utcnow() - timedelta(days=packet_days)
         
         # Delete old packets
         old_packets = Packet.query.filter(Packet.timestamp < cutoff_date).delete()
+        old_flows = Flow.query.filter(Flow.end_time < cutoff_date).delete()
+        store = get_packet_store()
+        segment_packets = store.purge_before(datetime_to_ns(cutoff_date)) if store else 0
+        
+        # Expire fine-grained rollups sooner; None keeps a resolution as long as the packets
+        from flask import current_app
+        retention = {
+            resolution: packet_days if days is None else days
+            for resolution, days in current_app.config['ROLLUP_RETENTION_DAYS'].items()
+        }
+        rollups_deleted = purge_rollups(retention)
         
         # Update sessions without packets
         orphan_sessions = CaptureSession.query.filter(
@@ -68,6 +84,9 @@ class SystemService:
         return {
             'success': True,
             'packets_deleted': old_packets,
+            'flows_deleted': old_flows,
+            'segment_packets_deleted': segment_packets,
+            'rollups_deleted': rollups_deleted,
             'sessions_archived': orphan_sessions,
             'timestamp': datetime.utcnow().isoformat()
         }
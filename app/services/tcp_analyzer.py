@@ -0,0 +1,247 @@
+"""TCP latency and loss measurement from per-flow state
+
+The flow tables hand every TCP segment to their interface's analyzer along
+with the flow it belongs to. Per flow, the analyzer times the handshake
+(SYN -> SYN/ACK is the server side of the round trip as seen from the
+capture point, SYN/ACK -> ACK the client side) and follows the highest
+sequence number sent in each direction. A segment starting below it is an
+out-of-order segment if it arrives within one handshake RTT (3 ms if
+unknown) of the previous segment in its direction, and a retransmission
+otherwise. Handshakes with a retransmitted SYN or SYN/ACK are not timed.
+
+Results are kept per interface and minute: RTTs in quantile sketches with
+1% relative error, and event counters.
+"""
+import math
+from datetime import datetime, timedelta
+from app.models.types import TCP_FLAG_BITS
+
+SYN = TCP_FLAG_BITS['SYN']
+ACK = TCP_FLAG_BITS['ACK']
+FIN = TCP_FLAG_BITS['FIN']
+RST = TCP_FLAG_BITS['RST']
+
+RTT_METRICS = ('rtt', 'server_rtt', 'client_rtt')
+COUNTERS = ('handshakes', 'segments', 'retransmissions', 'out_of_order', 'zero_windows')
+
+# An identical segment this soon after the last one is a second copy of the
+# same frame (e.g. loopback captures see both directions), not a retransmission
+DUPLICATE_NS = 1000000
+OUT_OF_ORDER_NS = 3000000
+
+_MINUTE_NS = 60 * 1000000000
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _seq_diff(a, b):
+    """Signed distance from sequence number b to a, modulo 2 ** 32"""
+    return ((a - b + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch over positive values
+
+    Values are counted in logarithmic buckets growing by gamma, so every
+    quantile is within relative_accuracy of a value that was added.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        # Values at or below 1 ns share the lowest bucket
+        index = math.ceil(math.log(max(value, 1e-6)) / self.log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @classmethod
+    def merge(cls, sketches):
+        merged = cls(sketches[0].relative_accuracy)
+        for sketch in sketches:
+            for index, count in sketch.bins.items():
+                merged.bins[index] = merged.bins.get(index, 0) + count
+            merged.count += sketch.count
+            merged.total += sketch.total
+            if sketch.count:
+                merged.min = sketch.min if merged.min is None else min(merged.min, sketch.min)
+                merged.max = sketch.max if merged.max is None else max(merged.max, sketch.max)
+        return merged
+
+    def quantile(self, q):
+        """Estimate the q-quantile, None while empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class TcpFlowState:
+    """Handshake timing and sequence tracking of one TCP flow"""
+
+    __slots__ = ('syn_ns', 'synack_ns', 'handshake_retransmitted', 'rtt_ns',
+                 'next_seq', 'last_ns', 'last_segment', 'zero_window')
+
+    def __init__(self):
+        self.syn_ns = None
+        self.synack_ns = None
+        self.handshake_retransmitted = False
+        self.rtt_ns = None
+        # Per direction, indexed by from_client
+        self.next_seq = [None, None]
+        self.last_ns = [0, 0]
+        self.last_segment = [None, None]
+        self.zero_window = [False, False]
+
+
+class TcpMinute:
+    """One minute of an interface's TCP measurements"""
+
+    __slots__ = ('sketches', 'counters')
+
+    def __init__(self, relative_accuracy):
+        self.sketches = {metric: QuantileSketch(relative_accuracy) for metric in RTT_METRICS}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+
+class TcpAnalyzer:
+    """TCP measurements of one interface, kept per minute"""
+
+    def __init__(self, minutes=60, relative_accuracy=0.01):
+        self.kept_minutes = minutes
+        self.relative_accuracy = relative_accuracy
+        self.minutes = {}
+
+    def _minute(self, ts_ns):
+        minute = ts_ns // _MINUTE_NS
+        stats = self.minutes.get(minute)
+        if stats is None:
+            stats = self.minutes[minute] = TcpMinute(self.relative_accuracy)
+            for expired in [m for m in self.minutes if m <= minute - self.kept_minutes]:
+                del self.minutes[expired]
+        return stats
+
+    def observe(self, flow, record, from_client):
+        """Measure one TCP segment of a flow"""
+        seq, ack, window, payload = record.tcp
+        flags = record.flags
+        ts_ns = record.ts_ns
+        state = flow.tcp
+        if state is None:
+            state = flow.tcp = TcpFlowState()
+
+        direction = 1 if from_client else 0
+        segment = (seq, ack, payload, flags, window)
+        if segment == state.last_segment[direction] and ts_ns - state.last_ns[direction] < DUPLICATE_NS:
+            return
+        stats = self._minute(ts_ns)
+        counters = stats.counters
+
+        if flags & SYN:
+            if not flags & ACK:
+                if from_client:
+                    if state.syn_ns is not None:
+                        state.handshake_retransmitted = True
+                    state.syn_ns = ts_ns
+            elif not from_client and state.syn_ns is not None:
+                if state.synack_ns is not None:
+                    state.handshake_retransmitted = True
+                state.synack_ns = ts_ns
+        elif from_client and flags & ACK and state.synack_ns is not None and state.rtt_ns is None:
+            state.rtt_ns = ts_ns - state.syn_ns
+            counters['handshakes'] += 1
+            if not state.handshake_retransmitted:
+                sketches = stats.sketches
+                sketches['rtt'].add(state.rtt_ns / 1000000)
+                sketches['server_rtt'].add((state.synack_ns - state.syn_ns) / 1000000)
+                sketches['client_rtt'].add((ts_ns - state.synack_ns) / 1000000)
+
+        # Zero window events: a receiver advertising no space, counted once until it reopens
+        if not flags & (SYN | FIN | RST):
+            if window == 0:
+                if not state.zero_window[direction]:
+                    state.zero_window[direction] = True
+                    counters['zero_windows'] += 1
+            else:
+                state.zero_window[direction] = False
+
+        # SYN and FIN each take one sequence number
+        length = payload + (1 if flags & SYN else 0) + (1 if flags & FIN else 0)
+        if length and not flags & RST:
+            end = (seq + length) & 0xFFFFFFFF
+            next_seq = state.next_seq[direction]
+            if payload:
+                counters['segments'] += 1
+            if next_seq is None or _seq_diff(end, next_seq) > 0:
+                if next_seq is not None and _seq_diff(seq, next_seq) < 0:
+                    # Overlaps data already sent and carries some new data
+                    counters['retransmissions'] += 1
+                state.next_seq[direction] = end
+            elif seq != state.last_segment[direction][0] \
+                    and ts_ns - state.last_ns[direction] < (state.rtt_ns or OUT_OF_ORDER_NS):
+                counters['out_of_order'] += 1
+            else:
+                counters['retransmissions'] += 1
+
+        state.last_segment[direction] = segment
+        state.last_ns[direction] = ts_ns
+
+    def window(self, minutes, now_ns):
+        """Get the TcpMinutes of the last N minutes"""
+        current = now_ns // _MINUTE_NS
+        return {m: stats for m, stats in self.minutes.items() if m > current - minutes}
+
+
+def summarize(windows, quantiles=(0.5, 0.9, 0.99)):
+    """Combine TcpMinutes into RTT percentiles (ms) and event counts"""
+    counters = dict.fromkeys(COUNTERS, 0)
+    sketches = {metric: [] for metric in RTT_METRICS}
+    for stats in windows:
+        for name, count in stats.counters.items():
+            counters[name] += count
+        for metric, sketch in stats.sketches.items():
+            sketches[metric].append(sketch)
+
+    summary = {}
+    for metric in RTT_METRICS:
+        merged = QuantileSketch.merge(sketches[metric]) if sketches[metric] else QuantileSketch()
+        summary[f'{metric}_ms'] = {
+            **{f'p{round(q * 100)}': _round(merged.quantile(q)) for q in quantiles},
+            'mean': _round(merged.total / merged.count if merged.count else None),
+            'samples': merged.count
+        }
+    summary.update({
+        'handshakes': counters['handshakes'],
+        'data_segments': counters['segments'],
+        'retransmissions': counters['retransmissions'],
+        'retransmission_rate': round(counters['retransmissions'] / counters['segments'], 4)
+        if counters['segments'] else 0,
+        'out_of_order': counters['out_of_order'],
+        'zero_window_events': counters['zero_windows']
+    })
+    return summary
+
+
+def minute_start(minute):
+    return _EPOCH + timedelta(minutes=minute)
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
@@ -0,0 +1,80 @@
+"""Portable GROUP BY time-bucket queries
+
+``time_bucket(column, seconds)`` is the bucket start as integer epoch
+seconds, compiled per dialect, so one grouped query works on SQLite and
+PostgreSQL. ``fill_buckets`` turns the grouped rows into a gap-free series.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import BigInteger, type_coerce
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from app.models.types import NanoTimestamp
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class epoch_seconds(FunctionElement):
+    """Whole seconds since the epoch of a naive UTC DateTime expression"""
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(epoch_seconds)
+def _epoch_seconds_default(element, compiler, **kw):
+    return 'CAST(FLOOR(EXTRACT(EPOCH FROM %s)) AS BIGINT)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(epoch_seconds, 'sqlite')
+def _epoch_seconds_sqlite(element, compiler, **kw):
+    return "CAST(strftime('%%s', %s) AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(epoch_seconds, 'mysql')
+def _epoch_seconds_mysql(element, compiler, **kw):
+    return 'UNIX_TIMESTAMP(%s)' % compiler.process(element.clauses, **kw)
+
+
+def to_epoch_seconds(column):
+    """Get a column as integer epoch seconds; DateTime and NanoTimestamp columns are supported"""
+    if isinstance(column.type, NanoTimestamp):
+        return type_coerce(column, BigInteger) // 1000000000
+    return epoch_seconds(column)
+
+
+def time_bucket(column, seconds):
+    """Get the start of the column's bucket as integer epoch seconds"""
+    return to_epoch_seconds(column) // seconds * seconds
+
+
+def bucket_range(start, end, seconds):
+    """Get the first and last bucket starts, in epoch seconds, covering start..end"""
+    return _to_second(start) // seconds * seconds, _to_second(end) // seconds * seconds
+
+
+def fill_buckets(rows, start, end, seconds, empty=(0,)):
+    """Zero-fill grouped (bucket, value, ...) rows sorted by bucket into [(bucket_start, value, ...)]
+
+    Walks the rows and the bucket range together, so the series is built in
+    one pass. ``empty`` holds the values of a bucket without rows; rows
+    outside the range are ignored.
+    """
+    first, last = bucket_range(start, end, seconds)
+    rows = iter(rows)
+    row = next(rows, None)
+
+    series = []
+    for bucket in range(first, last + seconds, seconds):
+        while row is not None and row[0] < bucket:
+            row = next(rows, None)
+        bucket_start = _EPOCH + timedelta(seconds=bucket)
+        if row is not None and row[0] == bucket:
+            series.append((bucket_start,) + tuple(row[1:]))
+            row = next(rows, None)
+        else:
+            series.append((bucket_start,) + tuple(empty))
+    return series
+
+
+def _to_second(value):
+    delta = value - _EPOCH
+    return delta.days * 86400 + delta.seconds
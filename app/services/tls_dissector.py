@@ -0,0 +1,279 @@
+"""TLS ClientHello/ServerHello parsing with JA3/JA3S fingerprints
+
+A flow direction is followed only from a segment that starts a TLS
+handshake record carrying a hello, and only until the hello is complete:
+bytes are buffered (up to MAX_HELLO_BYTES) while the hello spans segments,
+then the direction is marked finished and its buffer released. Later
+segments of the flow cost one dict lookup until FIN/RST or eviction.
+
+The fingerprints follow JA3: the MD5 of the hello's version, cipher
+suites, extensions, supported groups and point formats (JA3S: version,
+chosen cipher and extensions), in decimal and with GREASE values removed.
+"""
+import hashlib
+import struct
+from collections import OrderedDict
+from app.models.types import TCP_FLAG_BITS
+
+MAX_HELLO_BYTES = 16384
+MAX_STREAMS = 4096
+
+CLIENT_HELLO = 1
+SERVER_HELLO = 2
+
+VERSIONS = {
+    0x0300: 'SSL 3.0',
+    0x0301: 'TLS 1.0',
+    0x0302: 'TLS 1.1',
+    0x0303: 'TLS 1.2',
+    0x0304: 'TLS 1.3'
+}
+
+CIPHER_SUITES = {
+    0x1301: 'TLS_AES_128_GCM_SHA256',
+    0x1302: 'TLS_AES_256_GCM_SHA384',
+    0x1303: 'TLS_CHACHA20_POLY1305_SHA256',
+    0xC02B: 'TLS_ECDHE_ECDSA_WITH_AES_128_GCM_SHA256',
+    0xC02C: 'TLS_ECDHE_ECDSA_WITH_AES_256_GCM_SHA384',
+    0xC02F: 'TLS_ECDHE_RSA_WITH_AES_128_GCM_SHA256',
+    0xC030: 'TLS_ECDHE_RSA_WITH_AES_256_GCM_SHA384',
+    0xCCA8: 'TLS_ECDHE_RSA_WITH_CHACHA20_POLY1305_SHA256',
+    0xCCA9: 'TLS_ECDHE_ECDSA_WITH_CHACHA20_POLY1305_SHA256',
+    0xC009: 'TLS_ECDHE_ECDSA_WITH_AES_128_CBC_SHA',
+    0xC00A: 'TLS_ECDHE_ECDSA_WITH_AES_256_CBC_SHA',
+    0xC013: 'TLS_ECDHE_RSA_WITH_AES_128_CBC_SHA',
+    0xC014: 'TLS_ECDHE_RSA_WITH_AES_256_CBC_SHA',
+    0xC023: 'TLS_ECDHE_ECDSA_WITH_AES_128_CBC_SHA256',
+    0xC027: 'TLS_ECDHE_RSA_WITH_AES_128_CBC_SHA256',
+    0x009C: 'TLS_RSA_WITH_AES_128_GCM_SHA256',
+    0x009D: 'TLS_RSA_WITH_AES_256_GCM_SHA384',
+    0x009E: 'TLS_DHE_RSA_WITH_AES_128_GCM_SHA256',
+    0x009F: 'TLS_DHE_RSA_WITH_AES_256_GCM_SHA384',
+    0x002F: 'TLS_RSA_WITH_AES_128_CBC_SHA',
+    0x0035: 'TLS_RSA_WITH_AES_256_CBC_SHA',
+    0x003C: 'TLS_RSA_WITH_AES_128_CBC_SHA256',
+    0x000A: 'TLS_RSA_WITH_3DES_EDE_CBC_SHA',
+    0x0005: 'TLS_RSA_WITH_RC4_128_SHA'
+}
+
+# Extension numbers
+SERVER_NAME = 0
+SUPPORTED_GROUPS = 10
+EC_POINT_FORMATS = 11
+SUPPORTED_VERSIONS = 43
+
+FIN = TCP_FLAG_BITS['FIN']
+RST = TCP_FLAG_BITS['RST']
+
+# ServerHello.random of a HelloRetryRequest (RFC 8446 section 4.1.3)
+_HELLO_RETRY = bytes.fromhex('cf21ad74e59a6111be1d8c021e65b891c2a211167abb8c5e079e09e2c8a8339c')
+
+_u16 = struct.Struct('!H')
+
+
+def version_name(version):
+    return VERSIONS.get(version, 'Other')
+
+
+def cipher_name(cipher):
+    return CIPHER_SUITES.get(cipher, f'0x{cipher:04X}')
+
+
+def _grease(value):
+    """GREASE values (RFC 8701) are 0x?A?A with equal bytes"""
+    return value & 0x0F0F == 0x0A0A and value >> 8 == value & 0xFF
+
+
+class TlsMessage:
+    """Fields of a ClientHello or ServerHello
+
+    version is the highest offered (client) or the negotiated (server)
+    protocol version; cipher is set for server hellos only.
+    """
+
+    __slots__ = ('client', 'version', 'cipher', 'sni', 'fingerprint')
+
+    def __init__(self, client, version, cipher=None, sni=None, fingerprint=None):
+        self.client = client
+        self.version = version
+        self.cipher = cipher
+        self.sni = sni
+        self.fingerprint = fingerprint
+
+    def __reduce__(self):
+        return (TlsMessage, (self.client, self.version, self.cipher, self.sni, self.fingerprint))
+
+    def __repr__(self):
+        kind = 'ClientHello' if self.client else 'ServerHello'
+        return f'<TlsMessage {kind} {version_name(self.version)} {self.sni or ""} {self.fingerprint}>'
+
+
+def _extensions(body, offset):
+    """Yield (type, data) of the extension block starting at offset, if any"""
+    if offset + 2 > len(body):
+        return
+    end = min(offset + 2 + _u16.unpack_from(body, offset)[0], len(body))
+    offset += 2
+    while offset + 4 <= end:
+        ext_type, length = struct.unpack_from('!HH', body, offset)
+        yield ext_type, body[offset + 4:offset + 4 + length]
+        offset += 4 + length
+
+
+def _u16_list(data):
+    return [value for (value,) in struct.iter_unpack('!H', data[:len(data) & ~1])]
+
+
+def parse_client_hello(body):
+    """Parse a ClientHello handshake body (after the 4-byte handshake header)"""
+    version = _u16.unpack_from(body, 0)[0]
+    offset = 34
+    offset += 1 + body[offset]
+    length = _u16.unpack_from(body, offset)[0]
+    ciphers = _u16_list(body[offset + 2:offset + 2 + length])
+    offset += 2 + length
+    offset += 1 + body[offset]
+
+    extensions = []
+    groups = []
+    point_formats = []
+    versions = []
+    sni = None
+    for ext_type, data in _extensions(body, offset):
+        extensions.append(ext_type)
+        if ext_type == SERVER_NAME and len(data) > 5 and data[2] == 0:
+            name_length = _u16.unpack_from(data, 3)[0]
+            sni = data[5:5 + name_length].decode('latin-1').lower() or None
+        elif ext_type == SUPPORTED_GROUPS and len(data) >= 2:
+            groups = _u16_list(data[2:2 + _u16.unpack_from(data, 0)[0]])
+        elif ext_type == EC_POINT_FORMATS and data:
+            point_formats = list(data[1:1 + data[0]])
+        elif ext_type == SUPPORTED_VERSIONS and data:
+            versions = _u16_list(data[1:1 + data[0]])
+
+    ja3 = ','.join((
+        str(version),
+        '-'.join(str(c) for c in ciphers if not _grease(c)),
+        '-'.join(str(e) for e in extensions if not _grease(e)),
+        '-'.join(str(g) for g in groups if not _grease(g)),
+        '-'.join(str(p) for p in point_formats)
+    ))
+    offered = [v for v in versions if not _grease(v)]
+    return TlsMessage(
+        True,
+        max(offered) if offered else version,
+        sni=sni,
+        fingerprint=hashlib.md5(ja3.encode(), usedforsecurity=False).hexdigest()
+    )
+
+
+def parse_server_hello(body):
+    """Parse a ServerHello handshake body, returning None for a HelloRetryRequest"""
+    version = _u16.unpack_from(body, 0)[0]
+    if body[2:34] == _HELLO_RETRY:
+        return None
+    offset = 34
+    offset += 1 + body[offset]
+    cipher = _u16.unpack_from(body, offset)[0]
+    offset += 3
+
+    extensions = []
+    negotiated = version
+    for ext_type, data in _extensions(body, offset):
+        extensions.append(ext_type)
+        if ext_type == SUPPORTED_VERSIONS and len(data) == 2:
+            negotiated = _u16.unpack_from(data, 0)[0]
+
+    ja3s = ','.join((str(version), str(cipher), '-'.join(str(e) for e in extensions)))
+    return TlsMessage(
+        False,
+        negotiated,
+        cipher=cipher,
+        fingerprint=hashlib.md5(ja3s.encode(), usedforsecurity=False).hexdigest()
+    )
+
+
+def _starts_hello(payload):
+    return len(payload) >= 6 and payload[0] == 0x16 and payload[1] == 0x03 \
+        and payload[5] in (CLIENT_HELLO, SERVER_HELLO)
+
+
+def _hello(buffer):
+    """Get the first handshake message from the records in buffer, None while incomplete
+
+    Raises ValueError when the records are not a TLS handshake.
+    """
+    handshake = bytearray()
+    offset = 0
+    while offset + 5 <= len(buffer):
+        if buffer[offset] != 0x16 or buffer[offset + 1] != 0x03:
+            raise ValueError('Not a TLS handshake record')
+        length = _u16.unpack_from(buffer, offset + 3)[0]
+        # The hello may end inside a record that is still arriving
+        handshake += buffer[offset + 5:offset + 5 + length]
+        offset += 5 + length
+        if len(handshake) >= 4:
+            needed = 4 + int.from_bytes(handshake[1:4], 'big')
+            if len(handshake) >= needed:
+                return bytes(handshake[:needed])
+    return None
+
+
+class TlsStreams:
+    """Hello reassembly for the flow directions of one capture tap"""
+
+    def __init__(self, max_streams=MAX_STREAMS, max_hello_bytes=MAX_HELLO_BYTES):
+        self.max_streams = max_streams
+        self.max_hello_bytes = max_hello_bytes
+        # (source ip, source port, destination ip, destination port) -> [next seq, buffer or None once finished]
+        self.streams = OrderedDict()
+
+    def feed(self, source_ip, source_port, destination_ip, destination_port, seq, flags, payload, length, ts_ns):
+        """Add one TCP segment, returning a TlsMessage when it completes a hello, or None"""
+        key = (source_ip, source_port, destination_ip, destination_port)
+        streams = self.streams
+        state = streams.get(key)
+        if state is None:
+            if not length or flags & RST or not _starts_hello(payload):
+                return None
+            state = streams[key] = [seq, bytearray()]
+            if len(streams) > self.max_streams:
+                streams.popitem(last=False)
+        elif flags & (FIN | RST):
+            del streams[key]
+            return None
+        elif state[1] is None:
+            return None
+
+        gap = ((seq - state[0] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        if gap < 0:
+            # Retransmitted or duplicate bytes
+            if gap + length <= 0:
+                return None
+            payload = payload[-gap:]
+            length += gap
+        elif gap > 0 or len(payload) < length:
+            # Lost or truncated data
+            state[1] = None
+            return None
+        state[0] = (state[0] + length) & 0xFFFFFFFF
+
+        buffer = state[1]
+        buffer += payload
+        try:
+            hello = _hello(buffer)
+        except ValueError:
+            state[1] = None
+            return None
+        if hello is None:
+            if len(buffer) > self.max_hello_bytes:
+                state[1] = None
+            return None
+
+        state[1] = None
+        try:
+            if hello[0] == CLIENT_HELLO:
+                return parse_client_hello(hello[4:])
+            return parse_server_hello(hello[4:])
+        except (IndexError, struct.error):
+            return None
@@ -0,0 +1,123 @@
+"""Incremental TLS handshake aggregates fed by the TLS dissector
+
+Per interface and hour, the capture threads count hellos, negotiated
+protocol versions and chosen cipher suites, and keep Space-Saving sketches
+of server names and JA3/JA3S fingerprints. Versions and ciphers are drawn
+from 16-bit code points and the sketches have a fixed capacity, so memory
+stays bounded however many clients are seen.
+"""
+from app.services.heavy_hitters import SpaceSaving
+from app.services.hostnames import is_plain_hostname
+from app.services.hourly_slots import (HourlySlots, HourlyStatsRegistry, add_counts, merge_counts, merged_top,
+                                       slot_start)
+from app.services.tls_dissector import TlsMessage, cipher_name, version_name
+
+# Protocol versions older than TLS 1.2
+LEGACY_VERSION = 0x0303
+
+
+class TlsSlot:
+    """One hour of an interface's TLS handshakes"""
+
+    __slots__ = ('client_hellos', 'server_hellos', 'versions', 'ciphers', 'server_names', 'ja3', 'ja3s')
+
+    def __init__(self, capacity):
+        self.client_hellos = 0
+        self.server_hellos = 0
+        self.versions = {}
+        self.ciphers = {}
+        self.server_names = SpaceSaving(capacity)
+        self.ja3 = SpaceSaving(capacity)
+        self.ja3s = SpaceSaving(capacity)
+
+
+class TlsAggregator:
+    """TLS aggregates of one interface"""
+
+    def __init__(self, capacity=200):
+        self.slots = HourlySlots(lambda: TlsSlot(capacity))
+
+    def update(self, records):
+        for stats, run in self.slots.runs(records):
+            server_names = {}
+            ja3 = {}
+            ja3s = {}
+            for record in run:
+                message = record.app
+                if message.client:
+                    stats.client_hellos += 1
+                    ja3[message.fingerprint] = ja3.get(message.fingerprint, 0) + 1
+                    if is_plain_hostname(message.sni):
+                        server_names[message.sni] = server_names.get(message.sni, 0) + 1
+                else:
+                    stats.server_hellos += 1
+                    stats.versions[message.version] = stats.versions.get(message.version, 0) + 1
+                    stats.ciphers[message.cipher] = stats.ciphers.get(message.cipher, 0) + 1
+                    ja3s[message.fingerprint] = ja3s.get(message.fingerprint, 0) + 1
+            add_counts(stats.server_names, server_names)
+            add_counts(stats.ja3, ja3)
+            add_counts(stats.ja3s, ja3s)
+
+
+class TlsStatsRegistry(HourlyStatsRegistry):
+    """Per-interface TLS aggregates, updated with the records the captures deliver"""
+
+    def __init__(self):
+        super().__init__(lambda config: TlsAggregator(capacity=config['TLS_SKETCH_CAPACITY']))
+
+    def update(self, interface_id, records):
+        """Add delivered records carrying a parsed TLS hello"""
+        messages = [record for record in records if isinstance(record.app, TlsMessage)]
+        if not messages:
+            return
+        with self.lock:
+            self.aggregator(interface_id).update(messages)
+
+    def summary(self, interface_ids=None, limit=10):
+        """Get TLS versions, ciphers and top fingerprints over the last 24 hours"""
+        with self.lock:
+            slots = self.window(interface_ids)
+            every = [stats for group in slots.values() for stats in group]
+
+            versions = merge_counts(stats.versions for stats in every)
+            ciphers = merge_counts(stats.ciphers for stats in every)
+            server_names = merged_top([stats.server_names for stats in every], limit)
+            ja3 = merged_top([stats.ja3 for stats in every], limit)
+            ja3s = merged_top([stats.ja3s for stats in every], limit)
+            client_hellos = sum(stats.client_hellos for stats in every)
+            server_hellos = sum(stats.server_hellos for stats in every)
+            volume = [
+                {'timestamp': slot_start(slot), 'value': sum(stats.client_hellos for stats in slots[slot])}
+                for slot in sorted(slots)
+            ]
+
+        tls_versions = {}
+        for version, count in versions.items():
+            name = version_name(version)
+            tls_versions[name] = tls_versions.get(name, 0) + count
+        return {
+            'total_connections': client_hellos,
+            'server_hellos': server_hellos,
+            'tls_versions': dict(sorted(tls_versions.items(), key=lambda item: item[1], reverse=True)),
+            'legacy_connections': sum(count for version, count in versions.items() if version < LEGACY_VERSION),
+            'cipher_suites': [
+                {'cipher': cipher_name(cipher), 'count': count}
+                for cipher, count in sorted(ciphers.items(), key=lambda item: item[1], reverse=True)[:limit]
+            ],
+            'server_names': [
+                {'name': name, 'connections': count, 'error': error}
+                for name, count, error, _ in server_names
+            ],
+            'ja3': [
+                {'fingerprint': fingerprint, 'count': count, 'error': error}
+                for fingerprint, count, error, _ in ja3
+            ],
+            'ja3s': [
+                {'fingerprint': fingerprint, 'count': count, 'error': error}
+                for fingerprint, count, error, _ in ja3s
+            ],
+            'handshake_volume': volume
+        }
+
+
+tls_stats = TlsStatsRegistry()
@@ -19,7 +19,72 @@ class Config:
     ALERT_CHECK_INTERVAL = 5  # seconds
     BANDWIDTH_THRESHOLD_PERCENT = 80
     MAX_FILTERS_PER_SESSION = 5
-    PACKET_BUFFER_SIZE = 10000
+    PACKET_BUFFER_SIZE = 10000  # packets queued between capture and the DB writer
+    PACKET_BUFFER_POLICY = 'drop_oldest'  # 'drop_newest', 'drop_oldest' or 'block'
+    
+    # Capture Engine
+    DEFAULT_CAPTURE_SOURCE = os.environ.get('CAPTURE_SOURCE') or 'simulated'  # 'live', 'ring' or 'simulated'
+    CAPTURE_SNAPLEN = 65535
+    CAPTURE_RING_SIZE_MB = 64  # TPACKET_V3 ring, in 1 MB blocks
+    CAPTURE_RING_BLOCK_TIMEOUT_MS = 100
+    SIMULATED_PACKET_RATE = 35  # packets/sec, 0 = unthrottled for benchmarking
+    CAPTURE_WORKER_MODE = os.environ.get('CAPTURE_WORKER_MODE') or 'process'  # 'process' or 'thread'
+    
+    # Ingest
+    INGEST_BATCH_SIZE = 1000  # rows per bulk insert
+    INGEST_FLUSH_INTERVAL = 1.0  # seconds
+    
+    # Columnar packet store
+    PACKET_STORE_ENABLED = True
+    PACKET_STORE_PATH = os.environ.get('PACKET_STORE_PATH') or 'packet_segments'
+    PACKET_STORE_PARTITION_SECONDS = 3600  # one segment per session per hour
+    
+    # Traffic rollups: resolution in seconds -> days kept (None = until packet retention)
+    ROLLUP_RETENTION_DAYS = {1: 1, 60: 30, 3600: None}
+    
+    # Top talkers: keys monitored per sketch; counts overestimate by at most packets / capacity
+    HEAVY_HITTER_CAPACITY = 200
+    
+    # Distinct sources: one HyperLogLog per interface per minute, ~1.04 / sqrt(2 ** precision) error
+    DISTINCT_COUNTER_PRECISION = 12
+    DISTINCT_COUNTER_MINUTES = 60
+    
+    # Flow table (per interface)
+    FLOW_TABLE_MAX_FLOWS = 65536  # least recently active flow is exported when full
+    FLOW_IDLE_TIMEOUT = 120  # seconds without packets
+    FLOW_ACTIVE_TIMEOUT = 1800  # long-lived flows are exported in parts
+    FLOW_CLOSE_LINGER = 5  # seconds kept after FIN/RST for retransmissions
+    
+    # TCP analyzer: handshake RTT sketches and loss counters per interface per minute
+    TCP_ANALYZER_ACCURACY = 0.01  # relative error of RTT percentiles
+    TCP_ANALYZER_MINUTES = 60
+    
+    # DNS aggregates (per interface, hourly for 24 hours)
+    DNS_SKETCH_CAPACITY = 200  # domains and resolvers monitored per hour
+    DNS_RESPONSE_TIMEOUT = 10  # seconds a query waits for its response
+    
+    # HTTP aggregates (per interface, hourly for 24 hours)
+    HTTP_SKETCH_CAPACITY = 200  # hosts and user agents monitored per hour
+    
+    # TLS handshake aggregates (per interface, hourly for 24 hours)
+    TLS_SKETCH_CAPACITY = 200  # server names and JA3/JA3S fingerprints monitored per hour
+    
+    # Mail protocol aggregates (per interface, hourly for 24 hours)
+    MAIL_SKETCH_CAPACITY = 200  # (protocol, server) pairs monitored per hour
+    
+    # Payload signatures: the first bytes of each flow direction on ports without a dissector
+    SIGNATURE_FILE = os.environ.get('SIGNATURE_FILE')  # JSON list of signatures; None = built-in set
+    SIGNATURE_INSPECT_BYTES = 64
+    SIGNATURE_HOST_CAPACITY = 50  # hosts monitored per signature
+    
+    # Passive DNS: address -> hostname from observed answers
+    PASSIVE_DNS_MAX_ENTRIES = 100000  # least recently used entry is evicted when full
+    PASSIVE_DNS_MIN_TTL = 300  # record TTLs are clamped to this range
+    PASSIVE_DNS_MAX_TTL = 86400
+    PASSIVE_DNS_SAVE_INTERVAL = 60  # seconds between saves to the passive_dns table
+    
+    # DHCP lease table
+    DHCP_SNAPSHOT_INTERVAL = 60  # seconds between snapshots to the dhcp_leases table
     
     # Data Retention
     MIN_RETENTION_DAYS = 30
@@ -0,0 +1,209 @@
+"""Compiled capture filters run against canned Ethernet frames
+
+The programs are executed by a small classic BPF interpreter that follows
+the kernel's rules (loads past the end of the packet reject it), so the
+tests need no capture privileges.
+"""
+import socket
+import struct
+import pytest
+from scapy.all import ARP, ICMP, IP, TCP, UDP, Ether, ICMPv6EchoRequest, IPv6, Raw
+from app.services.bpf import (
+    BPF_ALU_AND_K, BPF_JMP_JA, BPF_JMP_JEQ_K, BPF_JMP_JSET_K, BPF_LD_B_ABS, BPF_LD_H_ABS, BPF_LD_H_IND,
+    BPF_LD_W_ABS, BPF_LDX_B_MSH, BPF_RET_K, DEFAULT_SNAPLEN, attach_filter, compile_filters
+)
+from app.services.packet_filter import PacketFilter
+
+
+def run(program, frame):
+    """Run a compiled program over a frame, returning the number of bytes to keep"""
+    a = x = pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        if code in (BPF_LD_W_ABS, BPF_LD_H_ABS, BPF_LD_B_ABS, BPF_LD_H_IND):
+            offset = k + x if code == BPF_LD_H_IND else k
+            size = {BPF_LD_W_ABS: 4, BPF_LD_B_ABS: 1}.get(code, 2)
+            if offset + size > len(frame):
+                return 0
+            a = int.from_bytes(frame[offset:offset + size], 'big')
+        elif code == BPF_LDX_B_MSH:
+            if k >= len(frame):
+                return 0
+            x = (frame[k] & 0x0F) * 4
+        elif code == BPF_ALU_AND_K:
+            a &= k
+        elif code == BPF_JMP_JA:
+            pc += k
+        elif code == BPF_JMP_JEQ_K:
+            pc += jt if a == k else jf
+        elif code == BPF_JMP_JSET_K:
+            pc += jt if a & k else jf
+        elif code == BPF_RET_K:
+            return k
+        else:
+            raise AssertionError(f'Unexpected instruction {code:#x}')
+
+
+def accepts(filters, packet):
+    return run(compile_filters(filters), bytes(packet)) > 0
+
+
+def udp4(src='10.0.0.1', dst='10.0.0.2', sport=40000, dport=9999):
+    return Ether() / IP(src=src, dst=dst) / UDP(sport=sport, dport=dport) / Raw(b'x')
+
+
+def tcp4(src='10.0.0.1', dst='10.0.0.2', sport=40000, dport=80):
+    return Ether() / IP(src=src, dst=dst) / TCP(sport=sport, dport=dport, flags='S')
+
+
+def udp6(src='2001:db8::1', dst='2001:db8::2', sport=40000, dport=9999):
+    return Ether() / IPv6(src=src, dst=dst) / UDP(sport=sport, dport=dport) / Raw(b'x')
+
+
+def tcp6(src='2001:db8::1', dst='2001:db8::2', sport=40000, dport=80):
+    return Ether() / IPv6(src=src, dst=dst) / TCP(sport=sport, dport=dport, flags='S')
+
+
+def test_no_filters_reject_everything():
+    assert not accepts([], udp4())
+    assert not accepts([], tcp6())
+
+
+def test_empty_filter_accepts_everything():
+    program = compile_filters([PacketFilter(port=53), PacketFilter()])
+    assert run(program, bytes(udp4())) == DEFAULT_SNAPLEN
+    assert run(program, bytes(Ether() / ARP())) == DEFAULT_SNAPLEN
+
+
+def test_snaplen_is_returned_on_match():
+    program = compile_filters([PacketFilter(port=9999)], snaplen=128)
+    assert run(program, bytes(udp4())) == 128
+
+
+@pytest.mark.parametrize('packet, expected', [
+    (udp4(src='10.0.0.5'), True),
+    (udp4(dst='10.0.0.5'), True),
+    (udp4(src='10.0.0.6', dst='10.0.0.7'), False),
+    (udp6(), False),
+])
+def test_ipv4_host(packet, expected):
+    assert accepts([PacketFilter(ip='10.0.0.5')], packet) is expected
+
+
+@pytest.mark.parametrize('packet, expected', [
+    (udp4(src='10.200.1.1'), True),
+    (udp4(src='192.168.0.1', dst='10.255.255.255'), True),
+    (udp4(src='11.0.0.1', dst='9.255.255.255'), False),
+])
+def test_ipv4_cidr(packet, expected):
+    assert accepts([PacketFilter(ip='10.0.0.0/8')], packet) is expected
+
+
+def test_ipv4_default_route_matches_any_ipv4_only():
+    assert accepts([PacketFilter(ip='0.0.0.0/0')], udp4(src='1.2.3.4', dst='5.6.7.8'))
+    assert not accepts([PacketFilter(ip='0.0.0.0/0')], udp6())
+
+
+@pytest.mark.parametrize('packet, expected', [
+    (udp6(src='2001:db8::1'), True),
+    (udp6(src='2001:db8::9', dst='2001:db8::1'), True),
+    (udp6(src='2001:db8::9', dst='2001:db8::8'), False),
+    (udp4(), False),
+])
+def test_ipv6_host(packet, expected):
+    assert accepts([PacketFilter(ip='2001:db8::1')], packet) is expected
+
+
+@pytest.mark.parametrize('address, expected', [
+    ('2001:db8:0fff:1::1', True),
+    ('2001:db8:1000::1', False),
+    ('2001:db9::1', False),
+])
+def test_ipv6_cidr_inside_a_word(address, expected):
+    # /36 masks part of the second 32-bit word
+    packet = udp6(src=address, dst='fe80::1')
+    assert accepts([PacketFilter(ip='2001:db8::/36')], packet) is expected
+
+
+@pytest.mark.parametrize('packet, expected', [
+    (udp4(sport=9999, dport=40000), True),
+    (udp4(sport=40000, dport=9999), True),
+    (tcp4(dport=9999), True),
+    (udp6(dport=9999), True),
+    (tcp6(sport=9999, dport=40000), True),
+    (udp4(dport=9998), False),
+    (udp6(dport=9998), False),
+    (Ether() / IP() / ICMP(), False),
+])
+def test_port(packet, expected):
+    assert accepts([PacketFilter(port=9999)], packet) is expected
+
+
+def test_port_after_ipv4_options():
+    packet = Ether() / IP(options=b'\x01\x01\x01\x00') / UDP(sport=40000, dport=9999)
+    assert accepts([PacketFilter(port=9999)], packet)
+    assert not accepts([PacketFilter(port=40001)], packet)
+
+
+def test_port_ignores_non_first_fragments():
+    first = Ether() / IP(flags='MF', frag=0) / UDP(sport=40000, dport=9999) / Raw(b'x' * 16)
+    later = Ether() / IP(proto=17, frag=4) / Raw(struct.pack('!HH', 40000, 9999) + b'x' * 12)
+    assert accepts([PacketFilter(port=9999)], first)
+    assert not accepts([PacketFilter(port=9999)], later)
+
+
+@pytest.mark.parametrize('protocol, packet, expected', [
+    ('TCP', tcp4(), True),
+    ('TCP', tcp6(), True),
+    ('TCP', udp4(), False),
+    ('UDP', udp6(), True),
+    ('UDP', tcp4(), False),
+    ('ICMP', Ether() / IP() / ICMP(), True),
+    ('ICMP', Ether() / IPv6() / ICMPv6EchoRequest(), True),
+    ('ICMP', udp4(), False),
+    ('DNS', udp4(dport=53), True),
+    ('DNS', tcp6(sport=53, dport=40000), True),
+    ('DNS', udp4(dport=54), False),
+    ('HTTP', tcp4(dport=8080), True),
+    ('HTTP', udp4(dport=80), False),
+    ('HTTPS', tcp6(dport=443), True),
+])
+def test_protocol(protocol, packet, expected):
+    assert accepts([PacketFilter(protocol=protocol)], packet) is expected
+
+
+def test_fields_of_one_filter_must_all_match():
+    packet_filter = PacketFilter(ip='10.0.0.0/24', port=53, protocol='UDP')
+    assert accepts([packet_filter], udp4(src='10.0.0.9', dst='192.168.1.1', dport=53))
+    assert not accepts([packet_filter], udp4(src='10.0.1.9', dst='192.168.1.1', dport=53))
+    assert not accepts([packet_filter], udp4(src='10.0.0.9', dst='192.168.1.1', dport=54))
+    assert not accepts([packet_filter], tcp4(src='10.0.0.9', dst='192.168.1.1', dport=53))
+
+
+@pytest.mark.parametrize('packet, expected', [
+    (udp4(dst='10.0.0.5', dport=9), True),
+    (udp4(dport=1111), True),
+    (udp6(dport=1111), True),
+    (udp6(src='2001:db8::5', dport=9), True),
+    (udp4(dport=2222), False),
+    (udp6(dport=2222), False),
+])
+def test_union_of_filters(packet, expected):
+    filters = [PacketFilter(port=1111), PacketFilter(ip='10.0.0.5'), PacketFilter(ip='2001:db8::5')]
+    assert accepts(filters, packet) is expected
+
+
+def test_other_ethertypes_and_short_frames_are_rejected():
+    assert not accepts([PacketFilter(protocol='TCP')], Ether() / ARP())
+    assert run(compile_filters([PacketFilter(port=9999)]), bytes(udp4())[:30]) == 0
+
+
+def test_kernel_accepts_program():
+    try:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(3))
+    except (AttributeError, PermissionError, OSError):
+        pytest.skip('AF_PACKET sockets are not available')
+    with sock:
+        filters = [PacketFilter(ip='2001:db8::/36', port=53, protocol='DNS'), PacketFilter(ip='10.0.0.0/8')]
+        attach_filter(sock, compile_filters(filters))
@@ -0,0 +1,64 @@
+"""DHCP message parsing over valid and truncated payloads"""
+import ipaddress
+from scapy.all import BOOTP, DHCP
+from app.models.types import IPV4_MAPPED
+from app.services.dhcp_dissector import ACK, REQUEST, DhcpMessage, parse_dhcp
+
+MAC = b'\x00\x11\x22\x33\x44\x55'
+
+REQUEST_PAYLOAD = bytes(BOOTP(chaddr=MAC, xid=0x1234) / DHCP(options=[
+    ('message-type', 'request'), ('requested_addr', '10.0.0.9'), ('hostname', b'Laptop\x00'), 'end'
+]))
+ACK_PAYLOAD = bytes(BOOTP(op=2, yiaddr='10.0.0.9', chaddr=MAC, xid=0x1234) / DHCP(options=[
+    ('message-type', 'ack'), ('server_id', '10.0.0.254'), ('lease_time', 3600), 'pad', 'end'
+]))
+
+
+def address(text):
+    return IPV4_MAPPED | int(ipaddress.IPv4Address(text))
+
+
+def test_request():
+    message = parse_dhcp(REQUEST_PAYLOAD)
+    assert isinstance(message, DhcpMessage)
+    assert message.message_type == REQUEST
+    assert message.xid == 0x1234
+    assert message.mac == '00:11:22:33:44:55'
+    assert message.requested_ip == address('10.0.0.9')
+    assert message.hostname == 'laptop'
+    assert message.client_ip is None
+
+
+def test_ack():
+    message = parse_dhcp(ACK_PAYLOAD)
+    assert message.type_name == 'ACK'
+    assert message.message_type == ACK
+    assert message.your_ip == address('10.0.0.9')
+    assert message.server_id == address('10.0.0.254')
+    assert message.lease_time == 3600
+
+
+def test_plain_bootp_is_ignored():
+    assert parse_dhcp(bytes(BOOTP(chaddr=MAC))) is None
+    assert parse_dhcp(bytes(BOOTP(chaddr=MAC) / DHCP(options=[('hostname', b'x'), 'end']))) is None
+
+
+def test_non_ethernet_hardware_is_ignored():
+    payload = bytearray(ACK_PAYLOAD)
+    payload[1] = 6
+    assert parse_dhcp(bytes(payload)) is None
+
+
+def test_truncated_payloads():
+    for payload in (REQUEST_PAYLOAD, ACK_PAYLOAD):
+        for end in range(len(payload)):
+            message = parse_dhcp(payload[:end])
+            assert message is None or isinstance(message, DhcpMessage)
+
+
+def test_options_cut_short_are_dropped():
+    # The lease time option claims four bytes but the payload ends after two
+    cut = ACK_PAYLOAD.index(b'\x33\x04') + 4
+    message = parse_dhcp(ACK_PAYLOAD[:cut])
+    assert message.message_type == ACK
+    assert message.lease_time is None
@@ -0,0 +1,84 @@
+"""DNS message parsing over valid, compressed and truncated payloads"""
+import ipaddress
+import struct
+import pytest
+from scapy.all import DNS, DNSQR
+from app.models.types import IPV4_MAPPED
+from app.services.dns_dissector import DnsMessage, parse_dns, parse_dns_tcp
+
+QUERY = bytes(DNS(id=7, rd=1, qd=DNSQR(qname='Example.COM', qtype='AAAA')))
+
+
+def compressed_response():
+    """www.example.com CNAME answer plus its A and AAAA records, all names compressed"""
+    header = struct.pack('!HHHHHH', 7, 0x8180, 1, 3, 0, 0)
+    question = b'\x07example\x03com\x00' + struct.pack('!HH', 1, 1)
+    cname_target = len(header) + len(question) + 12
+    cname = b'\xc0\x0c' + struct.pack('!HHIH', 5, 1, 60, 6) + b'\x03www\xc0\x0c'
+    pointer = struct.pack('!H', 0xC000 | cname_target)
+    a = pointer + struct.pack('!HHIH', 1, 1, 600, 4) + ipaddress.IPv4Address('93.184.216.34').packed
+    aaaa = pointer + struct.pack('!HHIH', 28, 1, 300, 16) + ipaddress.IPv6Address('2001:db8::1').packed
+    return header + question + cname + a + aaaa
+
+
+RESPONSE = compressed_response()
+
+
+def test_query():
+    message = parse_dns(QUERY)
+    assert isinstance(message, DnsMessage)
+    assert (message.id, message.response, message.rcode) == (7, False, 0)
+    assert message.name == 'example.com'
+    assert message.type_name == 'AAAA'
+    assert message.addresses == ()
+
+
+def test_response_addresses_follow_compressed_names():
+    message = parse_dns(RESPONSE)
+    assert message.response
+    assert message.answer_count == 3
+    assert message.addresses == (
+        (IPV4_MAPPED | int(ipaddress.IPv4Address('93.184.216.34')), 600),
+        (int(ipaddress.IPv6Address('2001:db8::1')), 300),
+    )
+
+
+def test_nxdomain_has_no_addresses():
+    message = parse_dns(bytes(DNS(id=1, qr=1, rcode=3, qd=DNSQR(qname='missing.test'))))
+    assert message.rcode == 3
+    assert message.addresses == ()
+
+
+def test_non_query_opcodes_and_empty_questions_are_ignored():
+    assert parse_dns(bytes(DNS(opcode=5, qd=DNSQR(qname='update.test')))) is None
+    assert parse_dns(bytes(DNS(id=1, qdcount=0))) is None
+
+
+@pytest.mark.parametrize('payload', [QUERY, RESPONSE])
+def test_truncated_payloads(payload):
+    for end in range(len(payload)):
+        message = parse_dns(payload[:end])
+        assert message is None or isinstance(message, DnsMessage)
+
+
+def test_truncated_answer_section_keeps_complete_records():
+    # Cut inside the AAAA record: the A record before it is still reported
+    message = parse_dns(RESPONSE[:-4])
+    assert [ttl for _, ttl in message.addresses] == [600]
+
+
+def test_compression_loop():
+    header = struct.pack('!HHHHHH', 1, 0x0100, 1, 0, 0, 0)
+    assert parse_dns(header + b'\xc0\x0c' + b'\x00\x01\x00\x01') is None
+
+
+def test_invalid_label_length():
+    header = struct.pack('!HHHHHH', 1, 0x0100, 1, 0, 0, 0)
+    assert parse_dns(header + b'\x50' + b'a' * 80 + b'\x00\x00\x01\x00\x01') is None
+
+
+def test_tcp_length_prefix():
+    framed = struct.pack('!H', len(QUERY)) + QUERY
+    assert parse_dns_tcp(framed).name == 'example.com'
+    for end in range(len(framed)):
+        assert parse_dns_tcp(framed[:end]) is None
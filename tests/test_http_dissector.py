@@ -0,0 +1,132 @@
+"""HTTP/1.x head parsing and per-direction reassembly"""
+from app.models.types import TCP_FLAG_BITS
+from app.services.http_dissector import HttpMessage, HttpStreams, parse_head
+
+CLIENT = (1, 40000)
+SERVER = (2, 80)
+ACK = TCP_FLAG_BITS['ACK']
+FIN = TCP_FLAG_BITS['FIN']
+RST = TCP_FLAG_BITS['RST']
+
+REQUEST = b'GET /index.html HTTP/1.1\r\nHost: example.com\r\nUser-Agent: curl/8.0\r\n\r\n'
+RESPONSE = b'HTTP/1.1 200 OK\r\nServer: nginx\r\nContent-Type: text/html\r\nContent-Length: 5\r\n\r\nhello'
+
+
+class Connection:
+    """Feeds the segments of one TCP connection, tracking both sequence numbers"""
+
+    def __init__(self, streams=None):
+        self.streams = streams or HttpStreams()
+        self.seq = {CLIENT: 1000, SERVER: 5000}
+
+    def send(self, sender, payload, length=None, flags=ACK, ts_ns=0, skip=0):
+        receiver = SERVER if sender == CLIENT else CLIENT
+        length = len(payload) if length is None else length
+        seq = self.seq[sender] + skip
+        self.seq[sender] = seq + length
+        return self.streams.feed(*sender, *receiver, seq, flags, payload, length, ts_ns)
+
+
+def test_request_and_response():
+    connection = Connection()
+    request = connection.send(CLIENT, REQUEST, ts_ns=1000000)
+    assert isinstance(request, HttpMessage)
+    assert (request.method, request.uri, request.version) == ('GET', '/index.html', 'HTTP/1.1')
+    assert (request.host, request.user_agent) == ('example.com', 'curl/8.0')
+
+    response = connection.send(SERVER, RESPONSE, ts_ns=6000000)
+    assert (response.status, response.server, response.content_type) == (200, 'nginx', 'text/html')
+    assert response.latency_ms == 5
+
+
+def test_head_split_across_segments():
+    connection = Connection()
+    assert connection.send(CLIENT, REQUEST[:20]) is None
+    assert connection.send(CLIENT, REQUEST[20:50]) is None
+    assert connection.send(CLIENT, REQUEST[50:]).host == 'example.com'
+
+
+def test_body_is_skipped_up_to_the_next_message():
+    connection = Connection()
+    connection.send(CLIENT, REQUEST)
+    connection.send(CLIENT, REQUEST)
+    body = b'x' * 3000
+    head = b'HTTP/1.1 200 OK\r\nContent-Length: 3000\r\n\r\n'
+    assert connection.send(SERVER, head + body[:1000]).status == 200
+    assert connection.send(SERVER, body[1000:2000]) is None
+    assert connection.send(SERVER, body[2000:] + b'HTTP/1.1 404 Not Found\r\n\r\n').status == 404
+
+
+def test_head_request_response_has_no_body():
+    connection = Connection()
+    connection.send(CLIENT, b'HEAD / HTTP/1.1\r\nHost: a\r\n\r\n')
+    assert connection.send(SERVER, b'HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n').status == 200
+    connection.send(CLIENT, REQUEST)
+    assert connection.send(SERVER, RESPONSE).status == 200
+
+
+def test_retransmission_is_ignored():
+    connection = Connection()
+    connection.send(CLIENT, REQUEST)
+    assert connection.streams.feed(*CLIENT, *SERVER, 1000, ACK, REQUEST, len(REQUEST), 0) is None
+
+
+def test_lost_segment_resynchronises_on_next_message():
+    connection = Connection()
+    connection.send(CLIENT, REQUEST)
+    assert connection.send(SERVER, b'HTTP/1.1 200 OK\r\nContent-Length: 10000\r\n\r\n').status == 200
+    assert connection.send(SERVER, b'x' * 500, skip=1000) is None
+    assert connection.send(SERVER, b'more body') is None
+    connection.send(CLIENT, REQUEST)
+    assert connection.send(SERVER, RESPONSE).status == 200
+
+
+def test_truncated_capture_resynchronises_on_next_message():
+    connection = Connection()
+    assert connection.send(CLIENT, REQUEST[:30], length=len(REQUEST)) is None
+    assert connection.send(CLIENT, REQUEST).method == 'GET'
+
+
+def test_every_prefix_of_a_message():
+    for message in (REQUEST, RESPONSE):
+        for end in range(1, len(message)):
+            result = Connection().send(CLIENT, message[:end])
+            assert result is None or isinstance(result, HttpMessage)
+
+
+def test_oversized_head_is_dropped():
+    connection = Connection(HttpStreams(max_header_bytes=100))
+    assert connection.send(CLIENT, b'GET / HTTP/1.1\r\nCookie: ' + b'a' * 200) is None
+    assert connection.send(CLIENT, b'\r\n\r\n') is None
+    assert connection.send(CLIENT, REQUEST).uri == '/index.html'
+
+
+def test_fin_and_rst_forget_the_stream():
+    connection = Connection()
+    connection.send(CLIENT, REQUEST[:20])
+    connection.send(CLIENT, b'', flags=FIN)
+    assert connection.streams.streams == {}
+    connection.send(CLIENT, REQUEST[:20])
+    connection.send(SERVER, b'', flags=RST)
+    assert connection.streams.streams == {}
+
+
+def test_stream_count_is_bounded():
+    streams = HttpStreams(max_streams=4)
+    for port in range(10):
+        streams.feed(1, port, 2, 80, 0, ACK, REQUEST[:20], 20, 0)
+    assert len(streams.streams) == 4
+
+
+def test_other_payloads_are_ignored():
+    assert Connection().send(CLIENT, b'\x16\x03\x01\x00\x05hello') is None
+    assert Connection().send(CLIENT, b'GETTING / HTTP/1.1\r\n\r\n') is None
+
+
+def test_parse_head_rejects_malformed_lines():
+    assert parse_head(b'HTTP/1.1 OK') is None
+    assert parse_head(b'GET /') is None
+    assert parse_head(b'FETCH / HTTP/1.1') is None
+    assert parse_head(b'HTTP/1.1 200 OK\r\nContent-Length: lots') is None
+    message, content_length, chunked = parse_head(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked')
+    assert (message.status, content_length, chunked) == (200, None, True)
@@ -0,0 +1,149 @@
+"""TLS hello parsing, JA3/JA3S fingerprints and hello reassembly"""
+import hashlib
+import struct
+from app.models.types import TCP_FLAG_BITS
+from app.services.tls_dissector import (
+    CLIENT_HELLO, SERVER_HELLO, TlsMessage, TlsStreams, parse_client_hello, parse_server_hello
+)
+
+ACK = TCP_FLAG_BITS['ACK']
+FIN = TCP_FLAG_BITS['FIN']
+GREASE = 0x1A1A
+
+
+def extension(ext_type, data):
+    return struct.pack('!HH', ext_type, len(data)) + data
+
+
+def u16_list(values, length_size='H'):
+    data = b''.join(struct.pack('!H', value) for value in values)
+    return struct.pack('!' + length_size, len(data)) + data
+
+
+def client_hello_body(sni='Secure.Example.org'):
+    name = sni.encode()
+    extensions = b''.join((
+        extension(GREASE, b''),
+        extension(0, struct.pack('!HBH', len(name) + 3, 0, len(name)) + name),
+        extension(10, u16_list([GREASE, 29, 23])),
+        extension(11, b'\x01\x00'),
+        extension(43, u16_list([GREASE, 0x0304, 0x0303], 'B')),
+    ))
+    return (b'\x03\x03' + b'\x11' * 32 + b'\x00' + u16_list([GREASE, 0x1301, 0xC02F]) + b'\x01\x00'
+            + struct.pack('!H', len(extensions)) + extensions)
+
+
+def server_hello_body(random=b'\x22' * 32):
+    extensions = extension(43, b'\x03\x04')
+    return (b'\x03\x03' + random + b'\x00' + struct.pack('!H', 0x1301) + b'\x00'
+            + struct.pack('!H', len(extensions)) + extensions)
+
+
+def record(hello_type, body):
+    handshake = bytes([hello_type]) + len(body).to_bytes(3, 'big') + body
+    return b'\x16\x03\x01' + struct.pack('!H', len(handshake)) + handshake
+
+
+CLIENT_RECORD = record(CLIENT_HELLO, client_hello_body())
+SERVER_RECORD = record(SERVER_HELLO, server_hello_body())
+
+
+def feed(streams, segments, seq=1000, port=40000):
+    """Feed consecutive segments of one direction, returning the results"""
+    results = []
+    for payload in segments:
+        results.append(streams.feed(1, port, 2, 443, seq, ACK, payload, len(payload), 0))
+        seq += len(payload)
+    return results
+
+
+def test_client_hello():
+    message = parse_client_hello(client_hello_body())
+    assert message.client
+    assert message.version == 0x0304
+    assert message.sni == 'secure.example.org'
+    ja3 = '771,4865-49199,0-10-11-43,29-23,0'
+    assert message.fingerprint == hashlib.md5(ja3.encode()).hexdigest()
+
+
+def test_server_hello():
+    message = parse_server_hello(server_hello_body())
+    assert not message.client
+    assert (message.version, message.cipher) == (0x0304, 0x1301)
+    assert message.fingerprint == hashlib.md5(b'771,4865,43').hexdigest()
+
+
+def test_hello_retry_request_is_ignored():
+    random = bytes.fromhex('cf21ad74e59a6111be1d8c021e65b891c2a211167abb8c5e079e09e2c8a8339c')
+    assert parse_server_hello(server_hello_body(random)) is None
+
+
+def test_hello_in_one_segment():
+    assert feed(TlsStreams(), [CLIENT_RECORD])[0].sni == 'secure.example.org'
+    assert feed(TlsStreams(), [SERVER_RECORD])[0].cipher == 0x1301
+
+
+def test_hello_split_across_segments():
+    results = feed(TlsStreams(), [CLIENT_RECORD[:10], CLIENT_RECORD[10:40], CLIENT_RECORD[40:]])
+    assert results[:2] == [None, None]
+    assert results[2].sni == 'secure.example.org'
+
+
+def test_hello_split_across_records():
+    handshake = CLIENT_RECORD[5:]
+    records = b''.join(
+        b'\x16\x03\x01' + struct.pack('!H', len(part)) + part
+        for part in (handshake[:30], handshake[30:])
+    )
+    assert feed(TlsStreams(), [records])[0].sni == 'secure.example.org'
+
+
+def test_direction_is_followed_only_until_the_hello():
+    streams = TlsStreams()
+    results = feed(streams, [CLIENT_RECORD, CLIENT_RECORD])
+    assert results[0] is not None and results[1] is None
+    assert feed(streams, [b''], seq=1000 + 2 * len(CLIENT_RECORD))[0] is None
+    streams.feed(1, 40000, 2, 443, 0, FIN, b'', 0, 0)
+    assert streams.streams == {}
+
+
+def test_every_prefix_of_a_record():
+    for data in (CLIENT_RECORD, SERVER_RECORD):
+        for end in range(len(data)):
+            assert feed(TlsStreams(), [data[:end]])[0] is None
+
+
+def test_truncated_hello_bodies():
+    # Record and handshake lengths agree with a body cut short anywhere
+    for body, hello_type in ((client_hello_body(), CLIENT_HELLO), (server_hello_body(), SERVER_HELLO)):
+        for end in range(len(body)):
+            result = feed(TlsStreams(), [record(hello_type, body[:end])])[0]
+            assert result is None or isinstance(result, TlsMessage)
+
+
+def test_truncated_capture_stops_following():
+    streams = TlsStreams()
+    payload = CLIENT_RECORD[:40]
+    assert streams.feed(1, 40000, 2, 443, 1000, ACK, payload, len(CLIENT_RECORD), 0) is None
+    assert feed(streams, [CLIENT_RECORD[40:]], seq=1000 + len(CLIENT_RECORD))[0] is None
+
+
+def test_lost_segment_stops_following():
+    streams = TlsStreams()
+    assert feed(streams, [CLIENT_RECORD[:40]])[0] is None
+    assert feed(streams, [CLIENT_RECORD[50:]], seq=1050)[0] is None
+
+
+def test_oversized_hello_is_dropped():
+    streams = TlsStreams(max_hello_bytes=64)
+    assert feed(streams, [CLIENT_RECORD[:40], CLIENT_RECORD[40:80], CLIENT_RECORD[80:]]) == [None] * 3
+
+
+def test_other_payloads_are_ignored():
+    assert feed(TlsStreams(), [b'GET / HTTP/1.1\r\n\r\n'])[0] is None
+    assert feed(TlsStreams(), [b'\x17\x03\x03\x00\x10' + b'\x00' * 16])[0] is None
+    # A hello continued in a record that is not a handshake record
+    handshake = CLIENT_RECORD[5:]
+    first = b'\x16\x03\x01' + struct.pack('!H', 30) + handshake[:30]
+    second = b'\x17\x03\x03' + struct.pack('!H', len(handshake) - 30) + handshake[30:]
+    assert feed(TlsStreams(), [first, second]) == [None, None]